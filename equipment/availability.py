@@ -0,0 +1,191 @@
+"""
+Date-based availability for equipment bookings.
+
+A rental books its equipment for the closed interval ``[start_date,
+end_date]`` (both days included). Availability questions are answered from
+those intervals:
+
+* ``is_free(equipment, start, end)`` - is one item free for a period?
+* ``free_equipment(start, end, equipment_type)`` - which items are?
+* ``booked_ranges(equipment)`` - the merged booked periods, for calendars.
+
+On PostgreSQL overlaps are tested with ``daterange(start_date, end_date,
+'[]') && daterange(...)``, backed by a GiST index, and an exclusion
+constraint stops two confirmed rentals of the same item from overlapping
+(see migration 0019, which stops with a list of the offending rentals if
+there already are some). Other databases use the equivalent
+``start_date <= end AND end_date >= start`` test on the B-tree index over
+``(equipment, start_date, end_date)``.
+
+When many items have to be checked at once (e.g. a whole cart),
+``BookingIndex`` loads their bookings in one query and answers from
+in-memory interval trees instead.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.postgres.fields import DateRangeField
+from django.db import connection
+from django.db.models import Func, Value
+
+from .models import Equipment, Rental
+
+# Rentals that hold their equipment for their dates. Pending requests count,
+# so two patrons can't request the same item for the same days.
+BOOKED_STATUSES = ('PENDING', 'ACTIVE', 'OVERDUE')
+
+# Rentals that have been approved; the database forbids these from overlapping
+CONFIRMED_STATUSES = ('ACTIVE', 'OVERDUE')
+
+
+class DateRange(Func):
+    """PostgreSQL ``daterange(lower, upper, bounds)`` constructor."""
+
+    function = 'daterange'
+    output_field = DateRangeField()
+
+
+# A rental's booked period as an inclusive PostgreSQL date range
+RENTAL_PERIOD = DateRange('start_date', 'end_date', Value('[]'))
+
+
+def overlapping(queryset, start, end):
+    """Restrict a Rental queryset to bookings that overlap ``[start, end]``."""
+    if connection.vendor == 'postgresql':
+        from django.db.backends.postgresql.psycopg_any import DateRange as Period
+
+        return queryset.alias(period=RENTAL_PERIOD).filter(
+            period__overlap=Period(start, end, '[]')
+        )
+    return queryset.filter(start_date__lte=end, end_date__gte=start)
+
+
+def bookings(statuses=BOOKED_STATUSES):
+    return Rental.objects.filter(rental_status__in=statuses)
+
+
+def is_free(equipment, start, end, statuses=BOOKED_STATUSES, exclude_rental=None):
+    """Return True if no booking of ``equipment`` overlaps ``[start, end]``."""
+    queryset = overlapping(bookings(statuses).filter(equipment=equipment), start, end)
+    if exclude_rental is not None:
+        queryset = queryset.exclude(pk=exclude_rental.pk)
+    return not queryset.exists()
+
+
+def free_equipment(start, end, equipment_type=None, queryset=None):
+    """Return the equipment (optionally of one type) with no booking in ``[start, end]``."""
+    if queryset is None:
+        queryset = Equipment.objects.filter(is_deleted=False)
+    if equipment_type:
+        queryset = queryset.filter(equipment_type=equipment_type)
+    booked = overlapping(bookings(), start, end).values('equipment_id')
+    return queryset.exclude(id__in=booked)
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or back-to-back ``(start, end)`` date ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def booked_ranges(equipment, start=None):
+    """
+    Return the periods ``equipment`` is booked for as a sorted list of
+    merged ``(start, end)`` date pairs, optionally only those ending on or
+    after ``start``.
+    """
+    queryset = bookings().filter(equipment=equipment)
+    if start is not None:
+        queryset = queryset.filter(end_date__gte=start)
+    return merge_ranges(queryset.values_list('start_date', 'end_date'))
+
+
+class IntervalTree:
+    """
+    Centered interval tree over closed ``(start, end)`` intervals.
+
+    Built once from a list of intervals; each query returns the intervals
+    that overlap the queried range in O(log n + matches).
+    """
+
+    def __init__(self, intervals):
+        intervals = list(intervals)
+        self.center = None
+        self.left = self.right = None
+        if not intervals:
+            return
+
+        endpoints = sorted(point for interval in intervals for point in interval[:2])
+        self.center = endpoints[len(endpoints) // 2]
+
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        # Intervals that contain the center, sorted both ways for early exits
+        self.by_start = sorted(here, key=lambda interval: interval[0])
+        self.by_end = sorted(here, key=lambda interval: interval[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def overlapping(self, start, end):
+        """Return every stored interval that overlaps ``[start, end]``."""
+        if self.center is None:
+            return []
+
+        found = []
+        if end < self.center:
+            for interval in self.by_start:
+                if interval[0] > end:
+                    break
+                found.append(interval)
+            if self.left:
+                found.extend(self.left.overlapping(start, end))
+        elif start > self.center:
+            for interval in self.by_end:
+                if interval[1] < start:
+                    break
+                found.append(interval)
+            if self.right:
+                found.extend(self.right.overlapping(start, end))
+        else:
+            found.extend(self.by_start)
+            if self.left:
+                found.extend(self.left.overlapping(start, end))
+            if self.right:
+                found.extend(self.right.overlapping(start, end))
+        return found
+
+
+class BookingIndex:
+    """
+    Bookings of a set of equipment, loaded with one query and held as one
+    interval tree per item.
+    """
+
+    def __init__(self, equipment_ids, statuses=BOOKED_STATUSES):
+        intervals = defaultdict(list)
+        rows = bookings(statuses).filter(equipment_id__in=equipment_ids).values_list(
+            'equipment_id', 'start_date', 'end_date', 'id'
+        )
+        for equipment_id, start, end, rental_id in rows:
+            intervals[equipment_id].append((start, end, rental_id))
+        self.trees = {equipment_id: IntervalTree(items) for equipment_id, items in intervals.items()}
+
+    def conflicts(self, equipment_id, start, end):
+        """Return the ``(start, end, rental id)`` bookings overlapping ``[start, end]``."""
+        tree = self.trees.get(equipment_id)
+        return tree.overlapping(start, end) if tree else []
+
+    def is_free(self, equipment_id, start, end):
+        return not self.conflicts(equipment_id, start, end)
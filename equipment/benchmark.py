@@ -0,0 +1,407 @@
+"""
+Synthetic inventory and timed scenarios for performance work.
+
+``generate()`` fills the database with a deterministic catalog of any size
+(10k to 1M items is the intended range): users and librarians, equipment,
+reviews, rentals, and public and private collections. Everything is written
+with ``bulk_create`` in batches, with no network access, so the same seed
+always gives the same data. Synthetic rows are marked (``BENCH-`` equipment
+IDs, ``bench_`` usernames) so ``clear()`` can remove them again.
+
+``run()`` then times a fixed set of scenarios through the test client: the
+catalog with every combination of filters, search, the detail page,
+checkout and the librarian dashboard. Each scenario's request cost comes from
+the profiling middleware (see skirentals/profiling.py). Every request runs in
+a transaction that is rolled back, so scenarios leave the data unchanged and
+can be repeated. The result is a JSON-serialisable report; ``compare()``
+lines two reports up, e.g. from before and after a change.
+"""
+import itertools
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from skirentals import profiling
+from users.models import UserProfile
+
+from . import search, typeahead, visibility
+from .models import (
+    Cart, CartItem, Collection, Equipment, Rental, Review, parse_size,
+)
+
+# Prefixes that mark synthetic rows
+EQUIPMENT_PREFIX = 'BENCH-'
+USERNAME_PREFIX = 'bench_'
+
+BRANDS = {
+    'SKI': ['Atomic', 'Rossignol', 'Salomon', 'Volkl', 'Head', 'K2', 'Blizzard', 'Nordica'],
+    'SNOWBOARD': ['Burton', 'Lib Tech', 'Jones', 'Ride', 'Capita', 'GNU'],
+    'POLES': ['Leki', 'Black Diamond', 'Scott'],
+    'BOOTS': ['Lange', 'Tecnica', 'Dalbello', 'Salomon', 'Burton'],
+    'HELMET': ['Smith', 'Giro', 'POC', 'Oakley'],
+    'GOGGLES': ['Oakley', 'Smith', 'Anon', 'Giro'],
+    'GLOVES': ['Hestra', 'Black Diamond', 'Burton'],
+    'JACKET': ['Arcteryx', 'Patagonia', 'The North Face', 'Helly Hansen'],
+    'PANTS': ['Arcteryx', 'Patagonia', 'Flylow'],
+}
+MODELS = ['Bent', 'Experience', 'QST', 'Mantra', 'Kore', 'Mindbender', 'Custom', 'Flagship',
+          'Vantage', 'Rustler', 'Hero', 'Enforcer', 'Pro', 'Elite', 'Summit', 'Alpine']
+APPAREL_SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+CONDITIONS = ['NEW', 'EXCELLENT', 'GOOD', 'FAIR', 'POOR']
+SKILL_LEVELS = ['BEGINNER', 'INTERMEDIATE', 'ADVANCED', 'EXPERT', 'ALL']
+
+# Filters the catalog scenarios combine, as IndexView query parameters
+INDEX_FILTERS = {
+    'type': {'type': 'SKI'},
+    'price': {'min_price': '20', 'max_price': '60'},
+    'size': {'size': '150-180'},
+    'condition': {'condition': ['GOOD', 'EXCELLENT']},
+    'skill': {'skill_level': 'INTERMEDIATE'},
+}
+
+
+def _size(rng, equipment_type):
+    if equipment_type in ('SKI', 'SNOWBOARD', 'POLES'):
+        return f'{rng.randint(100, 190)}cm'
+    if equipment_type == 'BOOTS':
+        return str(rng.randint(44, 62) / 2)
+    return rng.choice(APPAREL_SIZES)
+
+
+def _make_users(count, librarians, batch_size):
+    password = make_password(None)
+    users = [User(username=f'{USERNAME_PREFIX}user_{i}', password=password) for i in range(count)]
+    users += [User(username=f'{USERNAME_PREFIX}librarian_{i}', password=password) for i in range(librarians)]
+    User.objects.bulk_create(users, batch_size=batch_size)
+
+    # Fetch the IDs back; not every database returns them from bulk_create
+    users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, user_type='LIBRARIAN' if '_librarian_' in user.username else 'PATRON')
+        for user in users
+    ], batch_size=batch_size)
+    patrons = [user for user in users if '_user_' in user.username]
+    return patrons, [user for user in users if '_librarian_' in user.username]
+
+
+def generate(equipment=10000, users=None, seed=0, batch_size=2000, log=None):
+    """
+    Create a synthetic catalog of ``equipment`` items and return the number of
+    rows created per model.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    users = users or max(50, equipment // 10)
+    today = timezone.localdate()
+
+    patrons, librarians = _make_users(users, max(1, users // 100), batch_size)
+    log(f'Created {len(patrons)} patrons and {len(librarians)} librarians')
+
+    # Collections: mostly public, some private with a few authorized users
+    owners = librarians + patrons
+    collections = [
+        Collection(
+            title=f'Benchmark collection {i}', description='Synthetic collection',
+            sharing_type='PRIVATE' if rng.random() < 0.3 else 'PUBLIC',
+            creator=rng.choice(owners),
+        )
+        for i in range(max(1, equipment // 100))
+    ]
+    for collection in collections:
+        collection.is_public = collection.sharing_type == 'PUBLIC'
+    Collection.objects.bulk_create(collections, batch_size=batch_size)
+    collections = list(Collection.objects.filter(title__startswith='Benchmark collection').order_by('id'))
+    Collection.authorized_users.through.objects.bulk_create([
+        Collection.authorized_users.through(collection_id=collection.id, user_id=user.id)
+        for collection in collections if collection.sharing_type == 'PRIVATE'
+        for user in rng.sample(patrons, min(3, len(patrons)))
+    ], batch_size=batch_size)
+
+    counts = Counter(users=len(patrons) + len(librarians), collections=len(collections))
+    types = list(BRANDS)
+    for offset in range(0, equipment, batch_size):
+        items, reviews, rentals = [], {}, {}
+        for i in range(offset, min(offset + batch_size, equipment)):
+            equipment_type = rng.choice(types)
+            item = Equipment(
+                equipment_id=f'{EQUIPMENT_PREFIX}{i:07d}',
+                equipment_type=equipment_type,
+                brand=rng.choice(BRANDS[equipment_type]),
+                model=f'{rng.choice(MODELS)} {rng.randint(70, 120)}',
+                size=_size(rng, equipment_type),
+                condition=rng.choice(CONDITIONS),
+                recommended_skill_level=rng.choice(SKILL_LEVELS),
+                rental_price=Decimal(rng.randint(10, 90)),
+                is_available=rng.random() < 0.85,
+                notes='Synthetic benchmark item',
+            )
+            # bulk_create skips save(), which normally fills these
+            item.size_value, item.size_category = parse_size(item.size)
+
+            reviewers = rng.sample(patrons, min(rng.randint(0, 5), len(patrons)))
+            reviews[i] = [(user, rng.randint(1, 5)) for user in reviewers]
+            item.set_rating_counts(Counter(rating for _, rating in reviews[i]))
+
+            # Back-to-back rentals so confirmed bookings never overlap
+            start = today - timedelta(days=rng.randint(0, 60))
+            rentals[i] = []
+            for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+                end = start + timedelta(days=rng.randint(1, 7))
+                status = 'COMPLETED' if end < today else rng.choice(['PENDING', 'ACTIVE'])
+                rentals[i].append((rng.choice(patrons), start, end, status))
+                start = end + timedelta(days=1)
+            items.append(item)
+
+        Equipment.objects.bulk_create(items, batch_size=batch_size)
+        items = list(Equipment.objects.filter(
+            equipment_id__in=[item.equipment_id for item in items]
+        ).order_by('equipment_id'))
+
+        review_rows, rental_rows, memberships = [], [], []
+        for i, item in zip(range(offset, offset + len(items)), items):
+            review_rows += [
+                Review(equipment_id=item.id, user=user, rating=rating, comment='Synthetic review')
+                for user, rating in reviews[i]
+            ]
+            rental_rows += [
+                Rental(
+                    equipment_id=item.id, patron=patron, rental_duration='DAILY', rental_status=status,
+                    rental_price=item.rental_price * ((end - start).days + 1),
+                    due_date=timezone.make_aware(datetime.combine(end, datetime.min.time())),
+                    start_date=start, end_date=end, checked_out_condition=item.condition,
+                )
+                for patron, start, end, status in rentals[i]
+            ]
+            if rng.random() < 0.2:
+                memberships.append(Equipment.collections.through(
+                    equipment_id=item.id, collection_id=rng.choice(collections).id
+                ))
+        Review.objects.bulk_create(review_rows, batch_size=batch_size)
+        Rental.objects.bulk_create(rental_rows, batch_size=batch_size)
+        Equipment.collections.through.objects.bulk_create(memberships, batch_size=batch_size)
+
+        counts.update(equipment=len(items), reviews=len(review_rows), rentals=len(rental_rows))
+        log(f'Created {counts["equipment"]} of {equipment} equipment items')
+
+    # bulk_create doesn't send the signals that keep these in sync
+    search.rebuild_index()
+    visibility.invalidate()
+    typeahead.invalidate()
+    return dict(counts)
+
+
+def clear():
+    """Delete every synthetic row created by ``generate()``."""
+    equipment = Equipment.objects.filter(equipment_id__startswith=EQUIPMENT_PREFIX)
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    Rental.objects.filter(equipment__in=equipment).delete()
+    Rental.objects.filter(patron__in=users).delete()
+    equipment.delete()
+    Collection.objects.filter(title__startswith='Benchmark collection').delete()
+    users.delete()
+    search.rebuild_index()
+    visibility.invalidate()
+    typeahead.invalidate()
+
+
+class Scenario:
+    """One timed request, made as ``user``, with optional per-run setup."""
+
+    def __init__(self, name, user, request, setup=None):
+        self.name = name
+        self.user = user
+        self.request = request
+        self.setup = setup
+
+
+def _checkout_setup(patron, equipment_ids):
+    def setup():
+        cart, _ = Cart.objects.get_or_create(user=patron)
+        start = timezone.now() + timedelta(days=200)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, equipment_id=pk, start_date=start, end_date=start + timedelta(days=2))
+            for pk in equipment_ids
+        ])
+    return setup
+
+
+def scenarios(seed=0):
+    """Build the benchmark scenarios against the synthetic data."""
+    rng = random.Random(seed)
+    patron = User.objects.filter(username__startswith=f'{USERNAME_PREFIX}user_').order_by('id').first()
+    librarian = User.objects.filter(username__startswith=f'{USERNAME_PREFIX}librarian_').order_by('id').first()
+    item_ids = list(
+        Equipment.objects.filter(equipment_id__startswith=EQUIPMENT_PREFIX, is_available=True)
+        .order_by('id').values_list('id', flat=True)[:1000]
+    )
+    if patron is None or librarian is None or not item_ids:
+        raise ValueError('No synthetic data found; run generate_benchmark_data first.')
+
+    index_url = reverse('equipment:index')
+    result = []
+    for size in range(len(INDEX_FILTERS) + 1):
+        for names in itertools.combinations(INDEX_FILTERS, size):
+            params = {}
+            for name in names:
+                params.update(INDEX_FILTERS[name])
+            label = '+'.join(names) or 'all'
+            result.append(Scenario(
+                f'index[{label}]', patron, lambda client, params=params: client.get(index_url, params)
+            ))
+    for sort in ('price-low', 'rating'):
+        result.append(Scenario(
+            f'index[sort={sort}]', patron, lambda client, sort=sort: client.get(index_url, {'sort': sort})
+        ))
+    result.append(Scenario(
+        'index[search]', patron, lambda client: client.get(index_url, {'search': 'atomic bent'})
+    ))
+
+    search_url = reverse('equipment:search_equipment')
+    result.append(Scenario(
+        'search_equipment', patron, lambda client: client.get(search_url, {'q': 'rossignol'})
+    ))
+    result.append(Scenario(
+        'search_equipment[autocomplete]', patron,
+        lambda client: client.get(search_url, {'q': 'sal', 'mode': 'autocomplete'})
+    ))
+
+    detail_ids = rng.sample(item_ids, min(10, len(item_ids)))
+    detail_ids = itertools.cycle(detail_ids)
+    result.append(Scenario(
+        'detail', patron, lambda client: client.get(reverse('equipment:detail', args=[next(detail_ids)]))
+    ))
+
+    result.append(Scenario(
+        'checkout[3 items]', patron,
+        lambda client: client.post(reverse('equipment:submit_rental_request')),
+        setup=_checkout_setup(patron, rng.sample(item_ids, min(3, len(item_ids)))),
+    ))
+    result.append(Scenario('librarian_dashboard', librarian, lambda client: client.get(reverse('librarian'))))
+    return result
+
+
+def _summary(values):
+    values = sorted(values)
+    return {
+        'min': round(values[0], 3),
+        'median': round(statistics.median(values), 3),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        'mean': round(statistics.fmean(values), 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=settings.BASE_DIR, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    # Templates can be rendered without running collectstatic first
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+def run(repeat=5, warmup=1, seed=0, only=None, log=None):
+    """Time every scenario (optionally only those whose name contains ``only``) and return the report."""
+    log = log or (lambda message: None)
+    last = {}
+
+    def record(sender, profile, **kwargs):
+        last['profile'] = profile
+
+    clients = {}
+    report = {}
+    profiling.request_profiled.connect(record)
+    try:
+        for scenario in scenarios(seed):
+            if only and only not in scenario.name:
+                continue
+            client = clients.get(scenario.user.pk)
+            if client is None:
+                client = clients[scenario.user.pk] = Client(SERVER_NAME='localhost')
+                client.force_login(scenario.user)
+
+            samples = []
+            for iteration in range(warmup + repeat):
+                with transaction.atomic():
+                    if scenario.setup:
+                        scenario.setup()
+                    last.clear()
+                    start = time.perf_counter()
+                    response = scenario.request(client)
+                    wall = (time.perf_counter() - start) * 1000
+                    transaction.set_rollback(True)
+                if iteration >= warmup:
+                    samples.append((wall, last.get('profile'), response.status_code))
+
+            profiles = [profile for _, profile, _ in samples if profile is not None]
+            report[scenario.name] = {
+                'status': samples[-1][2],
+                'queries': max((profile.queries for profile in profiles), default=None),
+                'wall_ms': _summary([wall for wall, _, _ in samples]),
+                'sql_ms': _summary([profile.sql_time * 1000 for profile in profiles]) if profiles else None,
+                'template_ms': (
+                    _summary([profile.template_time * 1000 for profile in profiles]) if profiles else None
+                ),
+            }
+            log(f"{scenario.name}: {report[scenario.name]['wall_ms']['median']} ms, "
+                f"{report[scenario.name]['queries']} queries")
+    finally:
+        profiling.request_profiled.disconnect(record)
+
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'git_commit': _git_commit(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'seed': seed,
+            'repeat': repeat,
+            'warmup': warmup,
+            'dataset': {
+                'equipment': Equipment.objects.filter(equipment_id__startswith=EQUIPMENT_PREFIX).count(),
+                'users': User.objects.filter(username__startswith=USERNAME_PREFIX).count(),
+                'rentals': Rental.objects.filter(equipment__equipment_id__startswith=EQUIPMENT_PREFIX).count(),
+                'reviews': Review.objects.filter(equipment__equipment_id__startswith=EQUIPMENT_PREFIX).count(),
+            },
+        },
+        'scenarios': report,
+    }
+
+
+def compare(baseline, current):
+    """
+    Return ``(name, baseline ms, current ms, change %, query change)`` rows for
+    the scenarios in both reports, comparing median wall times.
+    """
+    rows = []
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        old, new = before['wall_ms']['median'], result['wall_ms']['median']
+        change = (new - old) / old * 100 if old else 0.0
+        queries = None
+        if before['queries'] is not None and result['queries'] is not None:
+            queries = result['queries'] - before['queries']
+        rows.append((name, old, new, round(change, 1), queries))
+    return rows
@@ -0,0 +1,116 @@
+"""
+Cached read paths with tag-based invalidation.
+
+``cached_query`` caches what a function returns, under a key built from its
+name and positional arguments, in the ``catalog`` cache (see ``CACHES`` in
+the settings). Each cached value is filed under one or more tags, named
+after the models it was computed from::
+
+    @cached_query('top_rated', ttl=300, tags=['equipment', 'collection'])
+    def top_rated(visibility_class, user=None):
+        ...
+
+Every tag has a version number in the cache that is part of the key of
+everything filed under it. ``invalidate_tags`` bumps the versions, so all
+values computed from the old data are skipped at once and left to expire.
+``equipment.signals`` invalidates the tag of each model in ``MODEL_TAGS``
+whenever one of its rows is saved or deleted; code that changes rows without
+sending signals (``update()``, ``bulk_update()``) calls ``invalidate_tags``
+itself.
+
+Rendered template fragments live in the ``fragments`` cache, under the
+``{% cache %}`` tag. An equipment card is keyed by the item's ID and
+``Equipment.card_version``, so edits re-render it without any invalidation;
+``invalidate_card`` covers the one thing the version can't see, a change to
+the gallery image shown when there is no main image.
+"""
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import QuerySet
+
+# Cache that cached_query stores values and tag versions in
+CACHE_ALIAS = 'catalog'
+
+# Cache that rendered template fragments are stored in
+FRAGMENT_CACHE_ALIAS = 'fragments'
+
+# Fragments showing one item's card, keyed by its ID and card_version
+CARD_FRAGMENTS = ('equipment_card', 'top_rated_card')
+
+# Tag invalidated when a row of each model changes
+MODEL_TAGS = {
+    'equipment.Equipment': 'equipment',
+    'equipment.Collection': 'collection',
+    'equipment.Rental': 'rental',
+    'equipment.Review': 'review',
+}
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def tag_versions(tags):
+    """Return the current version of each tag, creating missing ones."""
+    cache = caches[CACHE_ALIAS]
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, 1, None)
+            versions[key] = cache.get(key, 1)
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    """Make every value cached under any of ``tags`` stale."""
+    cache = caches[CACHE_ALIAS]
+    for tag in tags:
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:
+            # Never used, so there is nothing cached under it yet
+            cache.add(_tag_key(tag), 1, None)
+
+
+def cached_query(key, ttl, tags):
+    """
+    Decorator that caches the function's result for ``ttl`` seconds under
+    ``tags``.
+
+    Positional arguments are part of the cache key, so they must have stable
+    ``str()`` values (IDs, names). Keyword arguments are passed through but
+    not keyed; use them for things the positional arguments already
+    identify. A returned QuerySet is evaluated into a list before caching.
+    """
+    tags = list(tags)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            versions = '.'.join(map(str, tag_versions(tags)))
+            full_key = ':'.join(['query', key, versions, *map(str, args)])
+            cache = caches[CACHE_ALIAS]
+            value = cache.get(full_key)
+            if value is None:
+                value = func(*args, **kwargs)
+                if isinstance(value, QuerySet):
+                    value = list(value)
+                cache.set(full_key, value, ttl)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
+
+
+def invalidate_card(equipment):
+    """Drop the cached cards of ``equipment`` at its current ``card_version``."""
+    keys = [
+        make_template_fragment_key(name, [equipment.id, equipment.card_version])
+        for name in CARD_FRAGMENTS
+    ]
+    caches[FRAGMENT_CACHE_ALIAS].delete_many(keys)
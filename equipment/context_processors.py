@@ -0,0 +1,6 @@
+from . import events
+
+
+def notification_events(request):
+    """Whether a page's notification stream hears about every event, so it can skip polling."""
+    return {'notification_events_shared': events.get_backend().shared}
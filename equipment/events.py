@@ -0,0 +1,209 @@
+"""
+Pub/sub for pushing notification events to open browser tabs.
+
+Each tab holds one Server-Sent Events connection (``notification_stream``)
+subscribed to two channels: its user's own channel and the channel of the
+user's role, which receives broadcast notifications. New notifications are
+published once their transaction commits, and the notifications API
+publishes a ``read`` event whenever the user marks something read, so every
+tab's badge updates as soon as something changes. Pages poll every 30
+seconds only while their stream is down, or when the backend isn't
+``shared`` and the stream can miss events (see below).
+
+The backend is chosen with the ``NOTIFICATION_EVENT_BACKEND`` setting:
+
+* ``LocalEventBackend`` delivers to streams served by the same process. It
+  needs nothing extra and is what development and the tests use. With more
+  than one worker a stream misses the events published by the others, and
+  the page's polling picks them up late.
+* ``RedisEventBackend`` goes through Redis pub/sub so events reach streams on
+  every worker and dyno. It needs the ``redis`` package and ``REDIS_URL``.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# This process's backend instance, created on first use
+_backend = None
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def role_channel(role):
+    return f'role:{role}'
+
+
+def channels_for(user):
+    """Return the channels a user's stream listens on."""
+    channels = [user_channel(user.pk)]
+    role = getattr(getattr(user, 'userprofile', None), 'user_type', None)
+    if role:
+        channels.append(role_channel(role))
+    return channels
+
+
+class LocalEventBackend:
+    """Deliver events to subscribers in this process only."""
+
+    # Streams only hear about events published by their own process
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # channel -> {(event loop, queue)} of the streams listening on it
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, event):
+        # Publishers run in request threads, subscribers on the event loop
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has closed; it will unsubscribe itself
+                pass
+
+    def subscribe(self, channels):
+        """Return a context manager yielding a queue that receives the events published to ``channels``."""
+        return _LocalSubscription(self, channels)
+
+
+class _LocalSubscription:
+    """
+    One stream's subscription to a ``LocalEventBackend``.
+
+    A class rather than an ``asynccontextmanager``: when a client disconnects
+    the stream generator is often only closed by the garbage collector, and a
+    generator-based context manager inside it may be finalized first, which
+    makes the stream's cleanup fail with "generator didn't stop after athrow()".
+    """
+
+    def __init__(self, backend, channels):
+        self.backend = backend
+        self.channels = channels
+        self.subscriber = None
+
+    async def __aenter__(self):
+        self.subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.backend._lock:
+            for channel in self.channels:
+                self.backend._subscribers[channel].add(self.subscriber)
+        return self.subscriber[1]
+
+    async def __aexit__(self, *exc_info):
+        subscribers = self.backend._subscribers
+        with self.backend._lock:
+            for channel in self.channels:
+                subscribers[channel].discard(self.subscriber)
+                if not subscribers[channel]:
+                    del subscribers[channel]
+
+
+class RedisEventBackend:
+    """Share events between processes through Redis pub/sub."""
+
+    shared = True
+
+    def __init__(self, url=None):
+        try:
+            import redis  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured("RedisEventBackend requires the 'redis' package.")
+        self.url = url or getattr(settings, 'REDIS_URL', None)
+        if not self.url:
+            raise ImproperlyConfigured("RedisEventBackend requires the REDIS_URL setting.")
+        self._client = None
+
+    def publish(self, channel, event):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, json.dumps(event))
+
+    def subscribe(self, channels):
+        """Return a context manager yielding a queue that receives the events published to ``channels``."""
+        return _RedisSubscription(self.url, channels)
+
+
+class _RedisSubscription:
+    """One stream's Redis pub/sub subscription; see ``_LocalSubscription``."""
+
+    def __init__(self, url, channels):
+        self.url = url
+        self.channels = channels
+
+    async def __aenter__(self):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(self.url)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(*self.channels)
+        queue = asyncio.Queue()
+
+        async def forward():
+            async for message in self.pubsub.listen():
+                if message['type'] == 'message':
+                    queue.put_nowait(json.loads(message['data']))
+
+        self.reader = asyncio.create_task(forward())
+        return queue
+
+    async def __aexit__(self, *exc_info):
+        self.reader.cancel()
+        await self.pubsub.unsubscribe()
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+def get_backend():
+    """Return this process's event backend."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'NOTIFICATION_EVENT_BACKEND', 'equipment.events.LocalEventBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+def serialize_notification(notification, read=False):
+    """The JSON form of a notification used by the API and the stream."""
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'message': notification.message,
+        'url': notification.related_url,
+        'created_at': notification.created_at.strftime('%b %d, %Y %H:%M'),
+        'is_read': read,
+    }
+
+
+def publish_notifications(notifications):
+    """Announce new notifications to their recipients once the transaction commits."""
+    events = [
+        (
+            user_channel(notification.user_id) if notification.user_id else role_channel(notification.audience),
+            {'type': 'notification', 'notification': serialize_notification(notification)},
+        )
+        for notification in notifications
+    ]
+
+    def send():
+        backend = get_backend()
+        for channel, event in events:
+            backend.publish(channel, event)
+
+    transaction.on_commit(send)
+
+
+def publish_read(user):
+    """Tell a user's other tabs that their unread count has gone down."""
+    transaction.on_commit(lambda: get_backend().publish(user_channel(user.pk), {'type': 'read'}))
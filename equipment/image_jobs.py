@@ -0,0 +1,182 @@
+"""
+Background storage of uploaded gallery images.
+
+Storing an image is slow: with S3 every save is an upload, and saving an
+EquipmentImage also makes its resized copies (equipment/images.py). So the
+upload view only stages each file on local disk, in the ``image_jobs``
+storage under FILE_UPLOAD_TEMP_DIR, and queues an ``ImageUploadJob`` for it;
+worker threads store the files, and the page polls the jobs for progress.
+
+Workers run in two places:
+
+* ``IMAGE_JOB_THREADS`` threads in each web process (2 unless set in the
+  settings) start on new jobs as soon as the upload's transaction commits.
+  This is what runs the jobs on Heroku.
+* ``manage.py process_image_jobs`` runs a pool of worker threads that polls
+  the job table. It picks up jobs that the web process didn't finish (e.g.
+  because it restarted), and does all the work if IMAGE_JOB_THREADS is 0.
+  It can only read files staged on its own machine, so it is for servers
+  whose web processes share FILE_UPLOAD_TEMP_DIR with it, not for a separate
+  Heroku worker dyno.
+
+Workers claim jobs with a conditional ``UPDATE ... WHERE status
+= 'QUEUED'``, so any number of them can share the table without running a
+job twice. A failed job is retried up to ``MAX_ATTEMPTS`` times, and a job
+left running by a worker that died is queued again after ``STALE_AFTER``.
+"""
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import EquipmentImage, ImageUploadJob
+
+logger = logging.getLogger(__name__)
+
+# Worker threads in each web process; 0 leaves every job to process_image_jobs
+IMAGE_JOB_THREADS = getattr(settings, 'IMAGE_JOB_THREADS', 2)
+
+# Tries per job before it is marked as failed
+MAX_ATTEMPTS = 3
+
+# How long a job can run before its worker is assumed to have died
+STALE_AFTER = timedelta(minutes=10)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def staging():
+    """The storage where uploads wait for a worker."""
+    return storages['image_jobs']
+
+
+def stage(upload):
+    """Save an uploaded file in the staging storage and return its name there."""
+    extension = os.path.splitext(upload.name)[1].lower()
+    return staging().save(f'{uuid.uuid4().hex}{extension}', upload)
+
+
+def _discard(name):
+    staging().delete(name)
+
+
+def enqueue(equipment, uploads, user=None):
+    """Stage ``uploads`` and queue a job storing each as a gallery image of ``equipment``."""
+    jobs = ImageUploadJob.objects.bulk_create([
+        ImageUploadJob(
+            equipment=equipment,
+            uploaded_by=user,
+            staged_path=stage(upload),
+            original_name=os.path.basename(upload.name),
+        )
+        for upload in uploads
+    ])
+    if IMAGE_JOB_THREADS:
+        job_ids = [job.id for job in jobs]
+        transaction.on_commit(lambda: _start(job_ids))
+    return jobs
+
+
+def _start(job_ids):
+    """Hand new jobs to this process's worker threads."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(IMAGE_JOB_THREADS, thread_name_prefix='image-jobs')
+    for _ in range(min(len(job_ids), IMAGE_JOB_THREADS)):
+        _executor.submit(_threaded_work, job_ids)
+
+
+def claim(limit=1, job_ids=None):
+    """
+    Mark up to ``limit`` queued jobs (the oldest, or the oldest of ``job_ids``)
+    as running and return them. A job another worker claims first is skipped.
+    """
+    queued = ImageUploadJob.objects.filter(status='QUEUED')
+    if job_ids is not None:
+        queued = queued.filter(id__in=job_ids)
+
+    claimed = []
+    for job_id in queued.order_by('id').values_list('id', flat=True)[:limit]:
+        updated = ImageUploadJob.objects.filter(id=job_id, status='QUEUED').update(
+            status='RUNNING', started_at=now(), attempts=F('attempts') + 1
+        )
+        if updated:
+            claimed.append(job_id)
+    return list(ImageUploadJob.objects.select_related('equipment').filter(id__in=claimed).order_by('id'))
+
+
+def run(job):
+    """Store a claimed job's staged file as a gallery image and record how it went."""
+    try:
+        with staging().open(job.staged_path, 'rb') as staged:
+            job.image = EquipmentImage.objects.create(
+                equipment=job.equipment, image=File(staged, name=job.original_name)
+            )
+    except Exception as error:
+        logger.exception("Image upload job %s failed", job.id)
+        retry = job.attempts < MAX_ATTEMPTS and staging().exists(job.staged_path)
+        job.status = 'QUEUED' if retry else 'FAILED'
+        job.error = str(error)
+        job.finished_at = None if retry else now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        if not retry:
+            _discard(job.staged_path)
+        return False
+
+    job.status = 'DONE'
+    job.error = ''
+    job.finished_at = now()
+    job.save(update_fields=['status', 'image', 'error', 'finished_at'])
+    _discard(job.staged_path)
+    return True
+
+
+def requeue_stale():
+    """Queue again the jobs left running by workers that died, or fail them if they are out of tries."""
+    stale = ImageUploadJob.objects.filter(status='RUNNING', started_at__lt=now() - STALE_AFTER)
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='FAILED', error='The worker stopped while storing this image.', finished_at=now()
+    )
+    return stale.update(status='QUEUED')
+
+
+def _work(job_ids=None):
+    ran = 0
+    while jobs := claim(1, job_ids):
+        run(jobs[0])
+        ran += 1
+    return ran
+
+
+def _threaded_work(job_ids=None):
+    try:
+        return _work(job_ids)
+    except Exception:
+        logger.exception("Image upload worker crashed")
+        raise
+    finally:
+        # Each thread has its own connection
+        connection.close()
+
+
+def process_queued(threads=1, job_ids=None):
+    """
+    Run queued jobs (all of them, or those in ``job_ids``) on ``threads``
+    worker threads until none are left, and return how many ran. With one
+    thread they run in the calling thread.
+    """
+    if threads <= 1:
+        return _work(job_ids)
+    with ThreadPoolExecutor(threads, thread_name_prefix='image-jobs') as pool:
+        return sum(pool.map(_threaded_work, [job_ids] * threads))
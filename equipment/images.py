@@ -0,0 +1,152 @@
+"""
+Resized copies of uploaded equipment images.
+
+Catalog cards show pictures a few hundred pixels wide, so sending them the
+uploaded original wastes bandwidth. When a main image or gallery image is
+saved, ``make_renditions`` writes a WebP and a JPEG copy at each of
+``WIDTHS`` (up to the original's width) through the original's own storage,
+so it works the same on the local file system and on S3. It returns a
+record that is stored next to the image (``Equipment.main_image_renditions``,
+``EquipmentImage.renditions``)::
+
+    {'source': 'equipment_images/a.jpg', 'width': 3000, 'height': 2000,
+     'renditions': [{'name': 'equipment_images/renditions/a-320w.webp',
+                     'width': 320, 'height': 213, 'format': 'WEBP'}, ...]}
+
+The record names its source, so an image that has been replaced is easy to
+spot (``needs_renditions``). Pillow only writes EXIF data when asked to, so
+the copies carry none; ``strip_metadata`` removes it from originals before
+they are stored. ``Picture`` turns a record into ``srcset`` values for
+templates.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Widths of the resized copies, in pixels
+WIDTHS = (320, 640, 1280)
+
+# Formats of the resized copies, with their file extensions
+FORMATS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+# Encoder quality of the resized copies
+QUALITY = 80
+
+# Directory under the original's directory that the copies are written to
+RENDITION_DIR = 'renditions'
+
+# What Pillow raises for files it can't decode, or won't (decompression bombs)
+UNREADABLE = (UnidentifiedImageError, Image.DecompressionBombError, OSError)
+
+
+def _open(field_file):
+    """Open and decode an image, turned upright if EXIF says it was rotated."""
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image.load()
+    finally:
+        field_file.close()
+    return ImageOps.exif_transpose(image)
+
+
+def _encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(upload):
+    """
+    Return ``upload`` without its EXIF data (camera details, GPS position),
+    re-encoded upright in its own format. Files without EXIF data, and files
+    that aren't images, are returned unchanged.
+    """
+    try:
+        upload.seek(0)
+        image = Image.open(upload)
+        if not image.getexif():
+            return upload
+        image_format = image.format
+        image.load()
+    except UNREADABLE:
+        return upload
+    finally:
+        upload.seek(0)
+
+    content = _encode(ImageOps.exif_transpose(image), image_format, quality=90)
+    return ContentFile(content, name=os.path.basename(upload.name))
+
+
+def needs_renditions(field_file, record):
+    """Whether the image in ``field_file`` has no renditions ``record`` yet."""
+    return bool(field_file) and (record or {}).get('source') != field_file.name
+
+
+def make_renditions(field_file):
+    """
+    Write the resized copies of the image in ``field_file`` to its storage
+    and return their record. An unreadable image gets a record without
+    copies, so it isn't retried on every save.
+    """
+    record = {'source': field_file.name, 'renditions': []}
+    try:
+        image = _open(field_file)
+    except UNREADABLE:
+        logger.warning("Could not read image %s to resize it", field_file.name)
+        return record
+    record['width'], record['height'] = image.size
+
+    directory, filename = os.path.split(field_file.name)
+    stem = os.path.splitext(filename)[0]
+    # Never upscale; an image narrower than every width gets one copy at its own size
+    widths = [width for width in WIDTHS if width < image.width] or [image.width]
+    if image.width <= WIDTHS[-1] and image.width not in widths:
+        widths.append(image.width)
+
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS
+        )
+        for image_format, extension in FORMATS.items():
+            name = field_file.storage.save(
+                os.path.join(directory, RENDITION_DIR, f'{stem}-{width}w.{extension}'),
+                ContentFile(_encode(resized, image_format, quality=QUALITY)),
+            )
+            record['renditions'].append({
+                'name': name, 'width': resized.width, 'height': resized.height, 'format': image_format,
+            })
+    return record
+
+
+class Picture:
+    """
+    An image to show in a ``<picture>`` element: the original's URL in
+    ``src`` and, when its renditions exist, ``webp_srcset`` and
+    ``jpeg_srcset``.
+    """
+
+    def __init__(self, storage, name, record=None):
+        self.src = storage.url(name)
+        record = record or {}
+        renditions = record.get('renditions', []) if record.get('source') == name else []
+        self.width = record.get('width')
+        self.height = record.get('height')
+        self.webp_srcset = self._srcset(storage, renditions, 'WEBP')
+        self.jpeg_srcset = self._srcset(storage, renditions, 'JPEG')
+
+    @staticmethod
+    def _srcset(storage, renditions, image_format):
+        return ', '.join(
+            f"{storage.url(rendition['name'])} {rendition['width']}w"
+            for rendition in renditions if rendition['format'] == image_format
+        )
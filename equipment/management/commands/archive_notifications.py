@@ -0,0 +1,37 @@
+import gzip
+
+from django.core.management.base import BaseCommand
+
+from equipment.notification_archive import (
+    DEFAULT_BATCH_SIZE, DEFAULT_RETENTION_DAYS, archive_notifications,
+)
+
+
+class Command(BaseCommand):
+    help = 'Moves read notifications older than the retention period out of the notification table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=DEFAULT_RETENTION_DAYS,
+            help='Archive read notifications older than this many days'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of notifications moved per transaction'
+        )
+        parser.add_argument(
+            '--output',
+            help='Append archived notifications to this gzipped JSON Lines file '
+                 'instead of the archive table'
+        )
+
+    def handle(self, *args, **options):
+        if options['output']:
+            with gzip.open(options['output'], 'at', encoding='utf-8') as output:
+                count = archive_notifications(options['days'], options['batch_size'], output)
+            destination = options['output']
+        else:
+            count = archive_notifications(options['days'], options['batch_size'])
+            destination = 'the archive table'
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} notifications to {destination}'))
@@ -0,0 +1,12 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from equipment import caching
+
+
+class Command(BaseCommand):
+    help = 'Clears the cached template fragments, which go stale when templates change'
+
+    def handle(self, *args, **options):
+        caches[caching.FRAGMENT_CACHE_ALIAS].clear()
+        self.stdout.write(self.style.SUCCESS('Fragment cache cleared'))
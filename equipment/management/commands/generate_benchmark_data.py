@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from equipment import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Creates a deterministic synthetic catalog (users, equipment, reviews, rentals, collections) for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--equipment', type=int, default=10000,
+            help='Number of equipment items to create'
+        )
+        parser.add_argument(
+            '--users', type=int,
+            help='Number of patrons to create (default: one per ten items, at least 50)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed; the same seed always produces the same data'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Number of rows written per INSERT batch'
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete previously generated benchmark data first'
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            benchmark.clear()
+            self.stdout.write('Deleted existing benchmark data')
+
+        counts = benchmark.generate(
+            equipment=options['equipment'],
+            users=options['users'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in sorted(counts.items()))
+        self.stdout.write(self.style.SUCCESS(f'Created {summary}'))
@@ -0,0 +1,30 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from equipment import caching, images
+from equipment.models import Equipment, EquipmentImage
+
+
+class Command(BaseCommand):
+    help = 'Makes the resized copies of images uploaded before they were made on upload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Remake copies that already exist')
+
+    def handle(self, *args, **options):
+        made = 0
+        for model, image_field, record_field in (
+            (Equipment, 'main_image', 'main_image_renditions'),
+            (EquipmentImage, 'image', 'renditions'),
+        ):
+            queryset = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+            for instance in queryset.only('pk', image_field, record_field).iterator():
+                field_file = getattr(instance, image_field)
+                if options['force'] or images.needs_renditions(field_file, getattr(instance, record_field)):
+                    record = images.make_renditions(field_file)
+                    model.objects.filter(pk=instance.pk).update(**{record_field: record})
+                    made += 1
+        if made:
+            # Cached cards were rendered without the new copies
+            caches[caching.FRAGMENT_CACHE_ALIAS].clear()
+        self.stdout.write(self.style.SUCCESS(f'Made renditions of {made} images'))
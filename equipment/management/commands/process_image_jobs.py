@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from equipment import image_jobs
+
+
+class Command(BaseCommand):
+    help = 'Stores queued image uploads, polling the job table for new ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Number of worker threads')
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait before checking again when there are no jobs'
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            requeued = image_jobs.requeue_stale()
+            if requeued:
+                self.stdout.write(f'Queued {requeued} stalled jobs again')
+
+            ran = image_jobs.process_queued(options['threads'])
+            if ran:
+                self.stdout.write(f'Ran {ran} image upload jobs')
+            if options['once']:
+                break
+            if not ran:
+                time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS('Image upload queue is empty'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from equipment import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the equipment full-text search index from the catalog'
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from equipment.models import RATING_COUNT_FIELDS, Equipment, Review
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized review counts and average rating of all equipment'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of equipment rows written per UPDATE batch'
+        )
+
+    def handle(self, *args, **options):
+        # One GROUP BY over all reviews
+        counts = {}
+        rows = Review.objects.order_by().values_list('equipment_id', 'rating').annotate(count=Count('id'))
+        for equipment_id, rating, count in rows:
+            counts.setdefault(equipment_id, {})[rating] = count
+
+        fields = ['average_rating', 'rating_count', *RATING_COUNT_FIELDS.values()]
+        changed = []
+        for equipment in Equipment.objects.only('id', *fields):
+            before = [getattr(equipment, field) for field in fields]
+            equipment.set_rating_counts(counts.get(equipment.id, {}))
+            if [getattr(equipment, field) for field in fields] != before:
+                changed.append(equipment)
+
+        with transaction.atomic():
+            Equipment.objects.bulk_update(changed, fields, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Updated rating counts for {len(changed)} equipment items'))
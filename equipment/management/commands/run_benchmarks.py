@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Times the benchmark scenarios against the synthetic catalog and writes a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Timed runs of each scenario'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=1,
+            help='Untimed runs of each scenario before timing starts'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed used to pick the items scenarios request'
+        )
+        parser.add_argument(
+            '--only',
+            help='Only run scenarios whose name contains this text'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file instead of standard output'
+        )
+        parser.add_argument(
+            '--compare',
+            help='A previous report to compare median times and query counts against'
+        )
+
+    def handle(self, *args, **options):
+        log = self.stderr.write if not options['output'] else self.stdout.write
+        try:
+            report = benchmark.run(
+                repeat=options['repeat'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                only=options['only'],
+                log=log,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        content = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote report to {options['output']}"))
+        else:
+            self.stdout.write(content)
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+            for name, old, new, change, queries in benchmark.compare(baseline, report):
+                query_change = '' if queries is None else f', {queries:+d} queries'
+                log(f'{name}: {old} -> {new} ms ({change:+.1f}%{query_change})')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from equipment.rental_states import mark_started_rentals
+
+
+class Command(BaseCommand):
+    help = 'Marks equipment out once its approved rental has started; schedule it at least daily'
+
+    def handle(self, *args, **options):
+        count = mark_started_rentals()
+        self.stdout.write(self.style.SUCCESS(f'Marked {count} items as rented out'))
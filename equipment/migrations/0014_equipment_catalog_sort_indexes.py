@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0013_remove_equipment_hourly_rate_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['date_added', 'id'], name='equipment_date_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['rental_price', 'id'], name='equipment_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['average_rating', 'id'], name='equipment_rating_idx'),
+        ),
+    ]
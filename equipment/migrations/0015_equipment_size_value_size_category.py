@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:49
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of equipment.models.parse_size as it was when this migration was written
+STANDARD_SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+SIZE_NUMBER_RE = re.compile(r'[0-9]+(\.[0-9]+)?')
+
+
+def parse_size(size):
+    size_str = str(size or '').strip().upper()
+    if size_str in STANDARD_SIZES:
+        return None, size_str
+
+    match = SIZE_NUMBER_RE.search(size_str)
+    if match:
+        return float(match.group(0)), ''
+    return None, ''
+
+
+def backfill_sizes(apps, schema_editor):
+    Equipment = apps.get_model('equipment', 'Equipment')
+    items = list(Equipment.objects.only('id', 'size'))
+    for item in items:
+        item.size_value, item.size_category = parse_size(item.size)
+    Equipment.objects.bulk_update(items, ['size_value', 'size_category'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0014_equipment_catalog_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='size_category',
+            field=models.CharField(blank=True, editable=False, max_length=5),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='size_value',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_sizes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['equipment_type', 'size_value'], name='equipment_size_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['equipment_type', 'size_category'], name='equipment_size_category_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Frozen copy of the search fields in equipment.search when this migration
+# was written, with their PostgreSQL rank weights
+SEARCH_FIELDS = {
+    'equipment_id': 'A',
+    'brand': 'A',
+    'model': 'A',
+    'equipment_type': 'B',
+    'notes': 'D',
+}
+
+# The GIN index is on the same expression PostgresSearchBackend.VECTOR
+# compiles to, so that searches can use it
+POSTGRES_VECTOR = ' || '.join(
+    f"setweight(to_tsvector('simple'::regconfig, COALESCE(\"{field}\", '')), '{weight}')"
+    for field, weight in SEARCH_FIELDS.items()
+)
+POSTGRES_INDEX = 'equipment_search_idx'
+
+SQLITE_TABLE = 'equipment_search'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    Equipment = apps.get_model('equipment', 'Equipment')
+    table = Equipment._meta.db_table
+    if vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX "{POSTGRES_INDEX}" ON "{table}" USING gin (({POSTGRES_VECTOR}))')
+    elif vendor == 'sqlite':
+        fields = ', '.join(SEARCH_FIELDS)
+        schema_editor.execute(f'CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5({fields})')
+        schema_editor.execute(
+            f'INSERT INTO {SQLITE_TABLE} (rowid, {fields}) '
+            f'SELECT id, {fields} FROM {table}'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{POSTGRES_INDEX}"')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0015_equipment_size_value_size_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
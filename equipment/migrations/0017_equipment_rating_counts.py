@@ -0,0 +1,69 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_counts(apps, schema_editor):
+    Equipment = apps.get_model('equipment', 'Equipment')
+    Review = apps.get_model('equipment', 'Review')
+
+    counts = {}
+    rows = Review.objects.order_by().values_list('equipment_id', 'rating').annotate(count=Count('id'))
+    for equipment_id, rating, count in rows:
+        counts.setdefault(equipment_id, {})[rating] = count
+
+    items = [item for item in Equipment.objects.only('id') if item.id in counts]
+    for item in items:
+        stars = counts[item.id]
+        for star in range(1, 6):
+            setattr(item, f'rating_{star}_count', stars.get(star, 0))
+        item.rating_count = sum(stars.values())
+        rating_sum = sum(star * count for star, count in stars.items())
+        item.average_rating = round(Decimal(rating_sum) / item.rating_count, 2)
+
+    fields = ['average_rating', 'rating_count'] + [f'rating_{star}_count' for star in range(1, 6)]
+    Equipment.objects.bulk_update(items, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0016_equipment_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_counts, migrations.RunPython.noop),
+    ]
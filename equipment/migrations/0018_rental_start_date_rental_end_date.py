@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_booked_periods(apps, schema_editor):
+    Rental = apps.get_model('equipment', 'Rental')
+    rentals = list(Rental.objects.only('id', 'checkout_date', 'due_date'))
+    for rental in rentals:
+        rental.start_date = timezone.localdate(rental.checkout_date)
+        rental.end_date = max(timezone.localdate(rental.due_date), rental.start_date)
+    Rental.objects.bulk_update(rentals, ['start_date', 'end_date'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0017_equipment_rating_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rental',
+            name='start_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rental',
+            name='end_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(backfill_booked_periods, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+import django.contrib.postgres.operations
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import RangeOperators
+from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.fields import DateRangeField
+from django.db import migrations, models
+from django.db.models import Exists, Func, OuterRef, Value
+
+# Frozen copies of equipment.availability.CONFIRMED_STATUSES and RENTAL_PERIOD
+CONFIRMED_STATUSES = ('ACTIVE', 'OVERDUE')
+RENTAL_PERIOD = Func(
+    'start_date', 'end_date', Value('[]'), function='daterange', output_field=DateRangeField()
+)
+
+# PostgreSQL-only: GiST index for daterange overlap queries, and an exclusion
+# constraint so two confirmed rentals of one item can never overlap
+PERIOD_INDEX = GistIndex('equipment', RENTAL_PERIOD, name='rental_period_gist_idx')
+NO_OVERLAP = ExclusionConstraint(
+    name='rental_confirmed_no_overlap',
+    expressions=[('equipment', RangeOperators.EQUAL), (RENTAL_PERIOD, RangeOperators.OVERLAPS)],
+    condition=models.Q(rental_status__in=CONFIRMED_STATUSES),
+)
+
+
+def check_confirmed_overlaps(apps, schema_editor):
+    """
+    Refuse to go on while confirmed rentals of one item overlap.
+
+    Approval used to check only Equipment.is_available, so such rentals can
+    exist, and the exclusion constraint can't be added over them (PostgreSQL
+    has no NOT VALID exclusion constraints). Which of two overlapping
+    rentals should stand is a decision for the rental desk, so the
+    migration lists them instead of cancelling any: complete, cancel or
+    re-date them in the admin, then run migrate again.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Rental = apps.get_model('equipment', 'Rental')
+    confirmed = Rental.objects.using(schema_editor.connection.alias).filter(rental_status__in=CONFIRMED_STATUSES)
+    overlapping = confirmed.filter(Exists(
+        confirmed.filter(
+            equipment=OuterRef('equipment'),
+            start_date__lte=OuterRef('end_date'),
+            end_date__gte=OuterRef('start_date'),
+        ).exclude(pk=OuterRef('pk'))
+    ))
+    clashes = list(overlapping.order_by('equipment_id', 'start_date').values_list('id', 'equipment_id'))
+    if clashes:
+        listed = ', '.join(f'rental {rental_id} (equipment {equipment_id})' for rental_id, equipment_id in clashes[:50])
+        raise RuntimeError(
+            f"{len(clashes)} active or overdue rentals overlap another rental of the same item: {listed}. "
+            "Complete, cancel or re-date them, then run migrate again."
+        )
+
+
+def add_postgres_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Rental = apps.get_model('equipment', 'Rental')
+    schema_editor.add_index(Rental, PERIOD_INDEX)
+    schema_editor.add_constraint(Rental, NO_OVERLAP)
+
+
+def remove_postgres_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Rental = apps.get_model('equipment', 'Rental')
+    schema_editor.remove_constraint(Rental, NO_OVERLAP)
+    schema_editor.remove_index(Rental, PERIOD_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0018_rental_start_date_rental_end_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rental',
+            name='start_date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='rental',
+            name='end_date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['equipment', 'start_date', 'end_date'], name='rental_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rental',
+            constraint=models.CheckConstraint(condition=models.Q(('end_date__gte', models.F('start_date'))), name='rental_period_ordered'),
+        ),
+        # No-op on databases other than PostgreSQL
+        django.contrib.postgres.operations.BtreeGistExtension(),
+        migrations.RunPython(check_confirmed_overlaps, migrations.RunPython.noop),
+        migrations.RunPython(add_postgres_constraints, remove_postgres_constraints),
+    ]
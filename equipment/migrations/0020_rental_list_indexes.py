@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0019_rental_booked_period_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['-checkout_date', '-id'], name='rental_checkout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['rental_status', '-checkout_date', '-id'], name='rental_status_checkout_idx'),
+        ),
+    ]
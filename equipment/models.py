@@ -1,10 +1,58 @@
 from django.db import models
+from django.db.models import Count, F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
-from datetime import timedelta
+from datetime import datetime, timedelta
+from django.utils import timezone
 from users.models import UserProfile
 from decimal import Decimal
+import re
+
+from .images import Picture
+
+# Categorical sizes used for apparel (helmets, goggles, gloves, jackets, pants)
+STANDARD_SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+
+_SIZE_NUMBER_RE = re.compile(r'[0-9]+(\.[0-9]+)?')
+
+def _as_date(value):
+    """Return the local calendar date of a datetime (dates pass through)."""
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+# Per-star review count column on Equipment for each rating
+RATING_COUNT_FIELDS = {star: f'rating_{star}_count' for star in range(1, 6)}
+
+
+def rating_count_field(stars):
+    """The count field for a rating of ``stars``, or None if it isn't 1-5."""
+    try:
+        return RATING_COUNT_FIELDS.get(int(stars))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_size(size):
+    """
+    Split a free-text size into its normalized parts.
+
+    Returns a ``(size_value, size_category)`` tuple: the first number found in
+    the size (e.g. 175 for skis, 25.5 for boots) and the standard apparel size
+    it names (e.g. 'M'). Parts that don't apply are ``None`` and ``''``.
+    """
+    size_str = str(size or '').strip().upper()
+    if size_str in STANDARD_SIZES:
+        return None, size_str
+
+    match = _SIZE_NUMBER_RE.search(size_str)
+    if match:
+        return float(match.group(0)), ''
+    return None, ''
+
 
 class Collection(models.Model):
     """
@@ -32,6 +80,25 @@ class Collection(models.Model):
             return f"{self.title} (Private)"
 
 
+class EquipmentQuerySet(models.QuerySet):
+    def with_card_image(self):
+        """
+        Annotate each item with ``card_image``, the file name of its first
+        gallery image (None if it has none), and ``card_image_renditions``,
+        its renditions record, with subqueries instead of a query per card.
+        ``Equipment.card_image_url`` and ``card_picture`` pick them up.
+        """
+        first_image = EquipmentImage.objects.filter(
+            equipment=models.OuterRef('pk')
+        ).order_by('order', 'id')[:1]
+        return self.annotate(
+            card_image=models.Subquery(first_image.values('image')),
+            card_image_renditions=models.Subquery(
+                first_image.values('renditions'), output_field=models.JSONField()
+            ),
+        )
+
+
 class Equipment(models.Model):
     """
     Represents a piece of winter sports equipment available for rental.
@@ -45,6 +112,8 @@ class Equipment(models.Model):
         brand (str): Manufacturer of the equipment
         model (str): Model name/number of the equipment
         size (str): Size specification of the equipment
+        size_value (float): Numeric part of the size, used for range filters
+        size_category (str): Standard apparel size (XS-XXL), if any
         condition (str): Current condition of the equipment
         date_added (DateTime): Date when equipment was added to inventory
         last_maintained (DateTime): Date of last maintenance
@@ -54,6 +123,7 @@ class Equipment(models.Model):
         rent_to_own_price (Decimal): Optional purchase price for rent-to-own
         total_rentals (int): Number of times equipment has been rented
         average_rating (Decimal): Average customer rating (0-5)
+        rating_count (int): Number of reviews, kept in sync with rating_<n>_count
     """
     
     # Equipment types order by most frequently rented
@@ -115,6 +185,9 @@ class Equipment(models.Model):
     brand = models.CharField(max_length=100)
     model = models.CharField(max_length=100)
     size = models.CharField(max_length=20)
+    # Normalized from `size` on save so size filters can use an index
+    size_value = models.FloatField(null=True, blank=True, editable=False)
+    size_category = models.CharField(max_length=5, blank=True, editable=False)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES)
     date_added = models.DateTimeField(auto_now_add=True)
     last_maintained = models.DateTimeField(auto_now=True)
@@ -151,8 +224,30 @@ class Equipment(models.Model):
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)],
         default=0.0
     )
+    # Review counts, maintained by Review writes so pages don't re-count reviews
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
     # Default main image for the equipment
     main_image = models.ImageField(upload_to='equipment_images/', null=True, blank=True)
+    # Resized copies of main_image (see equipment/images.py)
+    main_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = EquipmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Catalog sort keys, each with an id tiebreaker for keyset pagination
+            models.Index(fields=['date_added', 'id'], name='equipment_date_added_idx'),
+            models.Index(fields=['rental_price', 'id'], name='equipment_price_idx'),
+            models.Index(fields=['average_rating', 'id'], name='equipment_rating_idx'),
+            # Size range and apparel size filters
+            models.Index(fields=['equipment_type', 'size_value'], name='equipment_size_value_idx'),
+            models.Index(fields=['equipment_type', 'size_category'], name='equipment_size_category_idx'),
+        ]
 
     def clean(self):
         """
@@ -210,7 +305,7 @@ class Equipment(models.Model):
 
         elif self.equipment_type in ['HELMET', 'GOGGLES', 'GLOVES', 'JACKET', 'PANTS', 'OTHER']:
             # Categorical sizes
-            valid_sizes = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+            valid_sizes = STANDARD_SIZES
             if size_str not in valid_sizes:
                 raise ValidationError({
                     'size': f"Size must be one of: {', '.join(valid_sizes)}"
@@ -222,70 +317,140 @@ class Equipment(models.Model):
     def get_price_for_duration(self, duration):
         """
         Returns the appropriate price for the specified rental duration.
-        Falls back to calculated values if specific rates aren't set.
+        Falls back to the default multiple of the daily rate if a specific
+        rate isn't set (see equipment.pricing.RATES).
         """
-        if duration == 'DAILY':
-            return self.rental_price
-        
-        elif duration == 'WEEKLY':
-            if self.weekly_rate is not None:
-                return self.weekly_rate
-            # Default weekly rate to 5 times daily rate if not specifically set
-            return self.rental_price * 5
-        
-        elif duration == 'SEASONAL':
-            if self.seasonal_rate is not None:
-                return self.seasonal_rate
-            # Default seasonal rate to 90 times daily rate if not specifically set
-            return self.rental_price * 90
-        
-        # Default to daily rate if unknown duration
-        return self.rental_price
-        
+        from .pricing import RATES, rate
+
+        return rate(duration, self.rental_price, {field: getattr(self, field) for field, _ in RATES.values()})
+
+    def set_rating_counts(self, counts):
+        """
+        Set the review counts and average rating from a ``{stars: count}`` dict
+        (without saving).
+        """
+        total = 0
+        rating_sum = 0
+        for star, field in RATING_COUNT_FIELDS.items():
+            count = counts.get(star, 0)
+            setattr(self, field, count)
+            total += count
+            rating_sum += star * count
+        self.rating_count = total
+        self.average_rating = round(Decimal(rating_sum) / total, 2) if total else Decimal('0.00')
+
     def update_average_rating(self):
-        """Update the average rating based on all reviews for this equipment"""
-        reviews = self.review_set.all()
-        if reviews:
-            total_rating = sum(review.rating for review in reviews)
-            self.average_rating = round(total_rating / reviews.count(), 2)
-        else:
-            self.average_rating = 0.0
-        self.save(update_fields=['average_rating'])
-        
+        """Recount this equipment's reviews with one GROUP BY and save the results"""
+        counts = dict(
+            self.review_set.order_by().values_list('rating').annotate(count=Count('id'))
+        )
+        self.set_rating_counts(counts)
+        self.save(update_fields=['average_rating', 'rating_count', *RATING_COUNT_FIELDS.values()])
+
+    def apply_rating_change(self, added=None, removed=None):
+        """
+        Record a review being added (``added`` stars), deleted (``removed``
+        stars) or edited (both) with a single UPDATE.
+
+        The counts are adjusted with F() expressions, so concurrent reviews
+        can't overwrite each other's changes, and the average is derived from
+        the new counts in the same statement. A rating outside 1-5 has no
+        count to adjust, so the reviews are recounted instead.
+        """
+        added_field = None if added is None else rating_count_field(added)
+        removed_field = None if removed is None else rating_count_field(removed)
+        if (added is not None and added_field is None) or (removed is not None and removed_field is None):
+            self.update_average_rating()
+            return
+
+        deltas = {}
+        if added_field:
+            deltas[added_field] = 1
+        if removed_field:
+            deltas[removed_field] = deltas.get(removed_field, 0) - 1
+        count_delta = (added is not None) - (removed is not None)
+        if not any(deltas.values()):
+            return
+
+        new_counts = {
+            field: F(field) + deltas.get(field, 0)
+            for field in RATING_COUNT_FIELDS.values()
+        }
+        new_total = F('rating_count') + count_delta
+        new_sum = sum(star * new_counts[field] for star, field in RATING_COUNT_FIELDS.items())
+
+        updated = Equipment.objects.filter(pk=self.pk).update(
+            rating_count=new_total,
+            average_rating=Coalesce(
+                Round(Cast(new_sum, FloatField()) / NullIf(new_total, 0), 2),
+                Value(0.0),
+            ),
+            **{field: new_counts[field] for field in deltas},
+        )
+        if updated:
+            self.refresh_from_db(fields=['average_rating', 'rating_count', *RATING_COUNT_FIELDS.values()])
+
+    def _card_image(self):
+        """
+        The file name and renditions record of the picture on this item's
+        catalog card: the main image, else the first gallery image. None if
+        there is neither. Querysets built with ``with_card_image()`` have the
+        gallery image already; otherwise it costs a query.
+        """
+        if self.main_image:
+            return self.main_image.name, self.main_image_renditions
+        if hasattr(self, 'card_image'):
+            return (self.card_image, self.card_image_renditions) if self.card_image else None
+        first_image = self.images.first()
+        return (first_image.image.name, first_image.renditions) if first_image else None
+
+    @property
+    def card_image_url(self):
+        """URL of the original picture on this item's catalog card, or None."""
+        card_image = self._card_image()
+        return self.main_image.storage.url(card_image[0]) if card_image else None
+
+    @property
+    def card_picture(self):
+        """The picture on this item's catalog card with its resized copies, or None."""
+        card_image = self._card_image()
+        return Picture(self.main_image.storage, *card_image) if card_image else None
+
+    @property
+    def card_version(self):
+        """
+        Version of this item's catalog card, for keying its cached fragment.
+
+        ``last_maintained`` moves on every save(); the rating, availability
+        and condition are included as well because the review counters and
+        the rental state machine change them with update().
+        """
+        return f"{self.last_maintained:%Y%m%d%H%M%S%f}:{self.rating_count}:{self.average_rating}:{self.is_available:d}:{self.condition}"
+
     def get_rating_distribution(self):
         """Get the distribution of ratings (1-5 stars) for this equipment"""
-        reviews = self.review_set.all()
-        total_reviews = reviews.count()
-        
-        if total_reviews == 0:
-            return {
-                '5': 0,
-                '4': 0,
-                '3': 0,
-                '2': 0,
-                '1': 0,
-                'total': 0
-            }
-            
+        total_reviews = self.rating_count
+
         distribution = {
-            '5': reviews.filter(rating=5).count(),
-            '4': reviews.filter(rating=4).count(),
-            '3': reviews.filter(rating=3).count(),
-            '2': reviews.filter(rating=2).count(),
-            '1': reviews.filter(rating=1).count(),
-            'total': total_reviews
+            str(star): getattr(self, field)
+            for star, field in sorted(RATING_COUNT_FIELDS.items(), reverse=True)
         }
-        
+        distribution['total'] = total_reviews
+
+        if total_reviews == 0:
+            return distribution
+
         # Add percentages
         for rating in ['5', '4', '3', '2', '1']:
             distribution[f'{rating}_percent'] = int((distribution[rating] / total_reviews) * 100)
-            
+
         return distribution
 
-    # fixes subtype if incorrect
+    # fixes subtype if incorrect and keeps the normalized size fields in sync
     def save(self, *args, **kwargs):
         if self.equipment_type != 'SKI':
             self.equipment_subtype = None
+        self.size_value, self.size_category = parse_size(self.size)
         super().save(*args, **kwargs)
 
 
@@ -297,6 +462,8 @@ class EquipmentImage(models.Model):
     """
     equipment = models.ForeignKey(Equipment, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='equipment_images/')
+    # Resized copies of image (see equipment/images.py)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.CharField(max_length=200, blank=True)
     order = models.PositiveIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -308,6 +475,44 @@ class EquipmentImage(models.Model):
         return f"Image for {self.equipment} ({self.id})"
 
 
+class ImageUploadJob(models.Model):
+    """
+    A gallery image waiting to be stored, for the background workers in
+    equipment/image_jobs.py.
+
+    The upload is staged in the ``image_jobs`` storage, as ``staged_path``; a worker
+    stores it as an EquipmentImage (which also makes its resized copies) and
+    records the result here, so the uploader can poll for progress.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    equipment = models.ForeignKey(Equipment, on_delete=models.CASCADE, related_name='image_jobs')
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    staged_path = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    image = models.ForeignKey(EquipmentImage, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued jobs first
+            models.Index(fields=['status', 'id'], name='image_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload of {self.original_name} for {self.equipment} ({self.status})"
+
+
 class MaintenanceRecord(models.Model):
     """
     Tracks maintenance history for equipment items.
@@ -349,6 +554,8 @@ class Rental(models.Model):
         rental_price (Decimal): Total price for the rental
         checkout_date (DateTime): When equipment was checked out
         due_date (DateTime): When equipment is due back
+        start_date (Date): First day the equipment is booked for
+        end_date (Date): Last day the equipment is booked for (inclusive)
         return_date (DateTime): When equipment was actually returned
         extension_requested (bool): Whether extension was requested
         checked_out_condition (str): Condition at checkout
@@ -392,10 +599,36 @@ class Rental(models.Model):
     )
     checkout_notes = models.TextField(blank=True)
     return_notes = models.TextField(blank=True)
+    # Booked period, used for availability checks (see equipment.availability)
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['equipment', 'start_date', 'end_date'], name='rental_period_idx'),
+            # Librarian rental list: newest first, optionally by status
+            models.Index(fields=['-checkout_date', '-id'], name='rental_checkout_idx'),
+            models.Index(fields=['rental_status', '-checkout_date', '-id'], name='rental_status_checkout_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end_date__gte=models.F('start_date')),
+                name='rental_period_ordered',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.equipment} - {self.patron.username} ({self.checkout_date.date()})"
 
+    def save(self, *args, **kwargs):
+        # Default the booked period to checkout through due date
+        if self.start_date is None:
+            self.start_date = _as_date(self.checkout_date or timezone.now())
+        if self.end_date is None:
+            self.end_date = _as_date(self.due_date)
+        self.end_date = max(self.end_date, self.start_date)
+        super().save(*args, **kwargs)
+
 
 class Review(models.Model):
     """
@@ -421,6 +654,13 @@ class Review(models.Model):
     
     class Meta:
         unique_together = ['equipment', 'user']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so an edit can move the equipment's counts
+        instance._saved_rating = instance.__dict__.get('rating')
+        return instance
         
     def __str__(self):
         return f"{self.equipment} - {self.rating}/5 by {self.user.username}"
@@ -437,23 +677,32 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
     
+    @property
+    def pricing(self):
+        """Items and totals of this cart, loaded once per instance (see equipment.pricing)."""
+        if not hasattr(self, '_pricing'):
+            from .pricing import CartPricing
+            self._pricing = CartPricing(self)
+        return self._pricing
+    
     def get_total_price(self):
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.pricing.subtotal
     
     def clear(self):
         self.items.all().delete()
+        self.__dict__.pop('_pricing', None)
     
     def get_subtotal_with_insurance(self):
         """Calculate subtotal including insurance fee"""
-        return self.get_total_price() + Decimal('25.00')
+        return self.pricing.subtotal_with_insurance
     
     def get_tax_amount(self):
         """Calculate tax amount based on subtotal with insurance"""
-        return round(self.get_subtotal_with_insurance() * Decimal('0.085'), 2)
+        return self.pricing.tax
     
     def get_total_with_tax(self):
         """Calculate final total including insurance and tax"""
-        return round(self.get_subtotal_with_insurance() + self.get_tax_amount(), 2)
+        return self.pricing.total
 
 
 class CartItem(models.Model):
@@ -477,28 +726,18 @@ class CartItem(models.Model):
     
     def get_rental_days(self):
         """Calculate the number of days between start and end date (inclusive)"""
-        # Convert to date objects to ignore time component
-        start = self.start_date.date()
-        end = self.end_date.date()
+        # Local dates, as checkout books them, so times near midnight count alike
+        start = _as_date(self.start_date)
+        end = _as_date(self.end_date)
         return (end - start).days + 1
     
     def get_subtotal(self):
         """Calculate the subtotal based on the rental duration and time period"""
-        if self.rental_duration == 'DAILY':
-            # Daily rate multiplied by number of days
-            return self.equipment.get_price_for_duration('DAILY') * self.get_rental_days()
-        
-        elif self.rental_duration == 'WEEKLY':
-            # Weekly rate applies to each week or partial week
-            weeks = (self.get_rental_days() + 6) // 7  # Round up to nearest week
-            return self.equipment.get_price_for_duration('WEEKLY') * weeks
-        
-        elif self.rental_duration == 'SEASONAL':
-            # Seasonal rate is flat regardless of exact duration
-            return self.equipment.get_price_for_duration('SEASONAL')
-        
-        # Default to daily rate if unknown duration
-        return self.equipment.rental_price * self.get_rental_days()
+        from .pricing import billed_units
+
+        # Weekly rates apply to each started week, the seasonal rate is flat
+        units = billed_units(self.rental_duration, self.get_rental_days())
+        return self.equipment.get_price_for_duration(self.rental_duration) * units
     
     def get_rental_duration_display(self):
         """Return the human-readable rental duration."""
@@ -0,0 +1,96 @@
+"""
+Retention for the notification table.
+
+Read notifications older than the retention period are moved out of
+``users.Notification``, either into the compact ``ArchivedNotification``
+table or into a gzipped JSON Lines file, and then deleted. The work is done
+in small batches, each in its own short transaction, so the live table is
+never locked for long and the job can be interrupted and rerun at any point.
+
+A personal notification is archivable once its recipient has read it. A
+broadcast is archivable once everyone in its audience has read it, so it
+stays in the feed of any librarian who hasn't seen it yet. Only active
+members who had the role when it was sent and have logged in during the
+retention period count, so a departed or dormant librarian doesn't keep
+every broadcast forever.
+
+``archive_notifications`` is what the ``archive_notifications`` management
+command runs; schedule that command (e.g. daily with Heroku Scheduler) or
+call the function from any other scheduler.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from users.models import ArchivedNotification, Notification, NotificationReceipt, UserProfile
+
+from . import notification_counts
+
+# Archive read notifications older than this many days by default
+DEFAULT_RETENTION_DAYS = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+
+# Rows moved per transaction
+DEFAULT_BATCH_SIZE = 500
+
+# Columns copied into the archive
+ARCHIVE_FIELDS = ('id', 'user_id', 'audience', 'notification_type', 'message', 'related_url', 'created_at')
+
+
+def archivable(older_than):
+    """Return the read notifications created before ``older_than``."""
+    unread_by_someone = UserProfile.objects.filter(
+        user_type=OuterRef('audience'),
+        user__is_active=True,
+        role_since__lte=OuterRef('created_at'),
+        user__last_login__gte=older_than,
+    ).filter(~Exists(
+        NotificationReceipt.objects.filter(notification=OuterRef(OuterRef('pk')), user=OuterRef('user'))
+    ))
+    read_broadcast = Q(user__isnull=True) & ~Exists(unread_by_someone)
+    return Notification.objects.filter(created_at__lt=older_than).filter(
+        Q(user__isnull=False, is_read=True) | read_broadcast
+    )
+
+
+def archive_notifications(days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE, output=None):
+    """
+    Archive and delete read notifications older than ``days``.
+
+    Rows go to ArchivedNotification, or, if ``output`` (a text file opened for
+    writing) is given, to it as one JSON object per line. Returns the number
+    of notifications archived.
+    """
+    queryset = archivable(timezone.now() - timedelta(days=days)).order_by('id')
+    archived = 0
+    user_ids, roles = set(), set()
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+
+            if output is not None:
+                for row in rows:
+                    output.write(json.dumps({**row, 'created_at': row['created_at'].isoformat()}) + '\n')
+            else:
+                ArchivedNotification.objects.bulk_create(
+                    [ArchivedNotification(**row) for row in rows], ignore_conflicts=True
+                )
+            Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+        archived += len(rows)
+        for row in rows:
+            if row['user_id']:
+                user_ids.add(row['user_id'])
+            else:
+                roles.add(row['audience'])
+
+    # Archived rows no longer count towards anyone's total
+    if roles:
+        user_ids.update(UserProfile.objects.filter(user_type__in=roles).values_list('user_id', flat=True))
+    notification_counts.invalidate(user_ids)
+    return archived
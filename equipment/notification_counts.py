@@ -0,0 +1,90 @@
+"""
+Cached per-user notification counts for the notification badge.
+
+Each user has two counters in the cache, their total and unread
+notifications (personal ones plus broadcasts to their role). A counter is
+filled from the database the first time it's needed and then kept current:
+
+* new notifications increment it (``notifications_created``),
+* marking notifications read decrements it (``marked_read``).
+
+Updates are applied when the transaction commits. A counter that hasn't been
+loaded is left alone rather than created, and every counter expires after
+``COUNT_CACHE_TIMEOUT`` so any drift (e.g. from a concurrent recount) is
+reconciled by a fresh count soon after.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from users.models import Notification, UserProfile
+
+# How long a counter lives before it is recounted from the database (seconds)
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+
+def _key(kind, user_id):
+    return f'notifications:{kind}:{user_id}'
+
+
+def get_counts(user):
+    """Return ``{'total_count', 'unread_count'}`` for ``user``, from the cache if possible."""
+    keys = {kind: _key(kind, user.pk) for kind in ('total', 'unread')}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        return {f'{kind}_count': cached[key] for kind, key in keys.items()}
+
+    counts = Notification.objects.for_user(user).aggregate(
+        total_count=Count('id'),
+        unread_count=Count('id', filter=Q(read=False)),
+    )
+    cache.set_many(
+        {key: counts[f'{kind}_count'] for kind, key in keys.items()},
+        COUNT_CACHE_TIMEOUT,
+    )
+    return counts
+
+
+def unread_count(user):
+    return get_counts(user)['unread_count']
+
+
+def _add(user_ids, delta, kinds=('total', 'unread')):
+    for user_id in user_ids:
+        for kind in kinds:
+            key = _key(kind, user_id)
+            try:
+                value = cache.incr(key, delta)
+            except ValueError:
+                # Not loaded; it will be counted from the database when needed
+                continue
+            if value < 0:
+                cache.delete(key)
+
+
+def invalidate(user_ids):
+    """Drop the cached counts of ``user_ids`` so they are recounted."""
+    cache.delete_many([_key(kind, user_id) for user_id in user_ids for kind in ('total', 'unread')])
+
+
+def notifications_created(notifications):
+    """Count new notifications towards their recipients once the transaction commits."""
+    per_user = Counter(n.user_id for n in notifications if n.user_id)
+    per_role = Counter(n.audience for n in notifications if not n.user_id)
+
+    def apply():
+        for user_id, count in per_user.items():
+            _add([user_id], count)
+        for role, count in per_role.items():
+            members = UserProfile.objects.filter(user_type=role).values_list('user_id', flat=True)
+            _add(members, count)
+
+    transaction.on_commit(apply)
+
+
+def marked_read(user, count):
+    """Take ``count`` newly read notifications off ``user``'s unread counter."""
+    if count:
+        transaction.on_commit(lambda: _add([user.pk], -count, kinds=('unread',)))
@@ -0,0 +1,147 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page is fetched with a WHERE clause on the sort key of
+the last row already shown, so the cost of a page doesn't depend on how deep
+into the result set it is. Cursors are opaque URL-safe strings that encode
+the sort key values of that last row.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor can't be decoded for the paginated queryset."""
+
+
+def _serialize(value):
+    # Keep full precision; DjangoJSONEncoder truncates microseconds, which
+    # would break equality on timestamp sort keys.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPage:
+    """A single page of results, with the cursor needed to fetch the next one."""
+
+    def __init__(self, object_list, paginator, cursor, next_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f"<KeysetPage ({len(self)} items)>"
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return bool(self.cursor)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate an ordered queryset by its sort key.
+
+    The queryset's ``order_by()`` fields must be concrete fields on the model.
+    If the ordering doesn't already end in the primary key, ``id`` is appended
+    as a tiebreaker so that every row has a unique, stable position.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.per_page = per_page
+        self.ordering = self._get_ordering(queryset)
+        self.queryset = queryset.order_by(
+            *[f"-{name}" if descending else name for name, descending in self.ordering]
+        )
+
+    def _get_ordering(self, queryset):
+        ordering = []
+        for field in queryset.query.order_by or queryset.model._meta.ordering:
+            if not isinstance(field, str):
+                raise ValueError("KeysetPaginator only supports ordering by field names.")
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.name
+            ordering.append((name, descending))
+
+        pk_name = queryset.model._meta.pk.name
+        if pk_name not in [name for name, _ in ordering]:
+            # Break ties on the primary key, in the same direction as the last key
+            descending = ordering[-1][1] if ordering else False
+            ordering.append((pk_name, descending))
+        return ordering
+
+    @cached_property
+    def count(self):
+        """Total number of rows across all pages (runs a COUNT query)."""
+        return self.queryset.count()
+
+    def encode_cursor(self, obj):
+        values = [_serialize(getattr(obj, name)) for name, _ in self.ordering]
+        payload = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            raise InvalidCursor(cursor)
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+
+        model = self.queryset.model
+        decoded = []
+        for (name, _), value in zip(self.ordering, values):
+            try:
+                decoded.append(model._meta.get_field(name).to_python(value))
+            except (FieldDoesNotExist, ValidationError):
+                raise InvalidCursor(cursor)
+        return decoded
+
+    def _after(self, values):
+        """Build the WHERE clause selecting rows that sort after ``values``."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending else 'gt'
+            clause = Q(**{f"{name}__{lookup}": values[index]})
+            for (previous_name, _), previous_value in zip(self.ordering[:index], values[:index]):
+                clause &= Q(**{previous_name: previous_value})
+            condition |= clause
+        return condition
+
+    def get_page(self, cursor=None):
+        """Return the page that starts right after ``cursor`` (or the first page)."""
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+
+        # Fetch one extra row to find out whether there is a next page
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = self.encode_cursor(rows[-1]) if has_next else None
+        return KeysetPage(rows, self, cursor, next_cursor)
@@ -0,0 +1,225 @@
+"""
+Rental and cart pricing.
+
+A cart's price is the sum of its items' subtotals, plus a flat insurance fee,
+plus tax on both. There are two ways to compute it:
+
+* ``CartPricing`` prices one cart for a page: it loads the items with their
+  equipment in one query and computes each figure once, so the cart page
+  costs the same single query however many times the template asks for a
+  total. ``Cart.pricing`` keeps one per cart instance.
+* ``with_totals`` prices many carts at once for reporting, entirely in SQL:
+  each cart is annotated with its item count and subtotal.
+
+``quote`` prices any number of (item, duration, days) combinations at once,
+e.g. a whole package across every duration for the quote API, from one query
+for the items' rates.
+
+The pricing rules are defined once, here, and ``Equipment.get_price_for_duration``
+and ``CartItem.get_subtotal`` use them too: daily items pay the daily rate per
+day, weekly items the weekly rate per started week, and seasonal items the
+flat seasonal rate (``BILLING_DAYS``). Missing weekly and seasonal rates
+default to 5 and 90 times the daily rate (``RATES``).
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Func, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.functional import cached_property
+
+from .models import Equipment
+
+# Flat insurance fee added to every cart
+INSURANCE_FEE = Decimal('25.00')
+
+# Tax charged on the subtotal plus insurance
+TAX_RATE = Decimal('0.085')
+
+# Default weekly and seasonal rates, as multiples of the daily rate
+WEEKLY_MULTIPLIER = 5
+SEASONAL_MULTIPLIER = 90
+
+# Rental durations with their own rate
+DURATIONS = ('DAILY', 'WEEKLY', 'SEASONAL')
+
+# Rates besides the daily rate: the Equipment field holding each, and the
+# multiple of the daily rate charged when that field is empty
+RATES = {
+    'WEEKLY': ('weekly_rate', WEEKLY_MULTIPLIER),
+    'SEASONAL': ('seasonal_rate', SEASONAL_MULTIPLIER),
+}
+
+# Days covered by one charge of each duration's rate; every started period
+# is charged in full. None means a flat charge for the whole rental.
+BILLING_DAYS = {'DAILY': 1, 'WEEKLY': 7, 'SEASONAL': None}
+
+# Output type of the SQL price expressions
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def totals(subtotal):
+    """Return the insurance, tax and grand total for a cart ``subtotal``."""
+    with_insurance = subtotal + INSURANCE_FEE
+    tax = round(with_insurance * TAX_RATE, 2)
+    return {
+        'subtotal': subtotal,
+        'subtotal_with_insurance': with_insurance,
+        'tax': tax,
+        'total': round(with_insurance + tax, 2),
+    }
+
+
+class CartPricing:
+    """The items and totals of one cart, each loaded or computed once."""
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    @cached_property
+    def items(self):
+        return list(self.cart.items.select_related('equipment'))
+
+    @cached_property
+    def totals(self):
+        return totals(sum((item.get_subtotal() for item in self.items), Decimal('0')))
+
+    @property
+    def subtotal(self):
+        return self.totals['subtotal']
+
+    @property
+    def subtotal_with_insurance(self):
+        return self.totals['subtotal_with_insurance']
+
+    @property
+    def tax(self):
+        return self.totals['tax']
+
+    @property
+    def total(self):
+        return self.totals['total']
+
+
+class DaysBetween(Func):
+    """Number of days from the second date expression to the first."""
+
+    arity = 2
+    function = 'DATEDIFF'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS integer)',
+            arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+
+def subtotal_expression(prefix=''):
+    """
+    SQL expression for a cart item's subtotal. ``prefix`` is the lookup path
+    from the queried model to the cart item, e.g. ``'items__'`` from Cart.
+    """
+    def field(name):
+        return F(prefix + name)
+
+    # Days between the local dates, like CartItem.get_rental_days and checkout
+    days = DaysBetween(TruncDate(field('end_date')), TruncDate(field('start_date'))) + 1
+    daily_rate = field('equipment__rental_price')
+
+    def units_sql(duration):
+        # billed_units() in SQL: integer division rounds down, as // does
+        period = BILLING_DAYS.get(duration, 1)
+        if period is None:
+            return Value(1)
+        return days if period == 1 else (days + (period - 1)) / period
+
+    def rate_sql(duration):
+        if duration not in RATES:
+            return daily_rate
+        rate_field, multiplier = RATES[duration]
+        return Coalesce(field('equipment__' + rate_field), daily_rate * multiplier, output_field=MONEY)
+
+    return Case(
+        *[
+            When(**{prefix + 'rental_duration': duration}, then=rate_sql(duration) * units_sql(duration))
+            for duration in DURATIONS
+        ],
+        # Unknown durations are charged the daily rate
+        default=rate_sql('DAILY') * units_sql('DAILY'),
+        output_field=MONEY,
+    )
+
+
+def with_totals(queryset):
+    """
+    Annotate a Cart queryset with each cart's ``item_count`` and ``subtotal``,
+    computed in the same query.
+    """
+    return queryset.annotate(
+        item_count=Count('items'),
+        subtotal=Coalesce(Sum(subtotal_expression('items__')), Value(Decimal('0')), output_field=MONEY),
+    )
+
+
+def rate(duration, daily, rates):
+    """
+    The rate charged for ``duration``, given an item's ``daily`` rate and its
+    other rates as a dict keyed by the field names in ``RATES``. Unknown
+    durations are charged the daily rate.
+    """
+    if duration not in RATES:
+        return daily
+    field, multiplier = RATES[duration]
+    own_rate = rates.get(field)
+    return own_rate if own_rate is not None else daily * multiplier
+
+
+def billed_units(duration, days):
+    """How many times the ``duration``'s rate is charged for a rental of ``days`` days."""
+    period = BILLING_DAYS.get(duration, 1)
+    if period is None:
+        return 1
+    return (days + period - 1) // period
+
+
+def quote(equipment_ids, durations, days, queryset=None):
+    """
+    Price many rentals at once.
+
+    The three sequences are read in parallel: the i-th price is for renting
+    ``equipment_ids[i]`` on the ``durations[i]`` rate for ``days[i]`` days.
+    Returns a list of Decimal prices, with None for IDs that aren't in
+    ``queryset`` (by default, every item not deleted). The rates of all the
+    items are loaded with one query, and each item's rate table is built once
+    however many times it is quoted.
+    """
+    if not len(equipment_ids) == len(durations) == len(days):
+        raise ValueError("equipment_ids, durations and days must be the same length.")
+
+    if queryset is None:
+        queryset = Equipment.objects.filter(is_deleted=False)
+    rows = queryset.filter(id__in=set(equipment_ids)).values_list(
+        'id', 'rental_price', 'weekly_rate', 'seasonal_rate'
+    )
+
+    rates = {}
+    for equipment_id, daily, weekly, seasonal in rows:
+        own_rates = {'weekly_rate': weekly, 'seasonal_rate': seasonal}
+        rates[equipment_id] = {duration: rate(duration, daily, own_rates) for duration in DURATIONS}
+
+    prices = []
+    for equipment_id, duration, day_count in zip(equipment_ids, durations, days):
+        item_rates = rates.get(equipment_id)
+        if item_rates is None:
+            prices.append(None)
+            continue
+        if duration not in item_rates:
+            # Unknown durations are charged the daily rate
+            duration = 'DAILY'
+        prices.append(item_rates[duration] * billed_units(duration, day_count))
+    return prices
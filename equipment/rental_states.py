@@ -0,0 +1,362 @@
+"""
+The rental state machine.
+
+Rentals change status only along these transitions, and only through the
+functions in this module:
+
+* ``approve_rentals``:  PENDING -> ACTIVE
+* ``reject_rentals``:   PENDING -> CANCELLED (by a librarian)
+* ``cancel_rentals``:   PENDING -> CANCELLED (by the patron who asked)
+* ``complete_rentals``: ACTIVE  -> COMPLETED
+
+Each function takes a list of rental IDs (the single-rental views pass a
+list of one) and handles the whole batch in one transaction that stays
+correct when two librarians act on the same rentals or equipment at once:
+
+1. the rentals and their equipment are locked with ``select_for_update``;
+2. the transitions are checked as a set, in request order, so that two
+   requests for the same item in one batch are judged against each other
+   as well as against the rentals already approved;
+3. every status change is a conditional ``UPDATE ... WHERE rental_status =
+   <expected status>``. If it changes fewer rows than expected, another
+   request got there first: ``RentalConflict`` is raised and the whole batch
+   is rolled back;
+4. approving a request also cancels the other pending requests for the same
+   item whose dates overlap it, and tells their patrons;
+5. patron notifications are inserted with one ``bulk_create``.
+
+Every function returns one ``{'id', 'success', 'message'}`` result per
+requested ID, in the order the IDs were given.
+
+``Equipment.is_available`` says whether an item is on the shelf today: it is
+cleared when an approved rental starts and set again when the item comes back
+with no other approved rental covering today. Approval can happen days before
+the start date, so ``mark_started_rentals`` clears the flag for the rentals
+that have started since; the ``start_rentals`` management command runs it and
+should be scheduled at least daily (e.g. with Heroku Scheduler). An item that
+is unavailable without any approved rental covering today has been taken out
+of service by a librarian, and requests for it can't be approved.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.urls import reverse
+from django.utils.timezone import localdate, now
+
+from users.models import Notification
+
+from . import availability, caching, events, notification_counts
+from .models import Equipment, Rental
+
+# Equipment conditions from best to worst
+CONDITION_RANK = {value: rank for rank, (value, _) in enumerate(Equipment.CONDITION_CHOICES)}
+
+
+class RentalConflict(Exception):
+    """Raised when a rental's status was changed by another request mid-transition."""
+
+
+def _result(rental_id, success, message):
+    return {'id': rental_id, 'success': success, 'message': message}
+
+
+def _label(rental):
+    return f"{rental.equipment.brand} {rental.equipment.model}"
+
+
+def _lock(rental_ids, **filters):
+    """Lock and return the requested rentals, keyed by ID, with equipment and patron joined."""
+    rentals = (
+        Rental.objects
+        .select_for_update(of=('self', 'equipment'))
+        .select_related('equipment', 'patron')
+        .filter(id__in=rental_ids, **filters)
+        .order_by('id')
+    )
+    rentals = {rental.id: rental for rental in rentals}
+
+    # One object per item, so changes made for one rental are seen by the next
+    equipment = {}
+    for rental in rentals.values():
+        rental.equipment = equipment.setdefault(rental.equipment_id, rental.equipment)
+    return rentals
+
+
+def _ordered(rental_ids):
+    """Drop repeated IDs, keeping the first occurrence."""
+    return list(dict.fromkeys(rental_ids))
+
+
+def _transition(rentals, from_status, **changes):
+    """
+    Apply ``changes`` to ``rentals`` with one UPDATE that only matches rows
+    still in ``from_status``.
+    """
+    if not rentals:
+        return
+    updated = Rental.objects.filter(
+        id__in=[rental.id for rental in rentals], rental_status=from_status
+    ).update(**changes)
+    if updated != len(rentals):
+        raise RentalConflict(f"{len(rentals) - updated} of the rentals are no longer {from_status.lower()}.")
+    for rental in rentals:
+        for field, value in changes.items():
+            setattr(rental, field, value)
+    # update() sends no signals
+    caching.invalidate_tags('rental')
+
+
+def _notification(rental, notification_type, message):
+    return Notification(
+        user=rental.patron,
+        notification_type=notification_type,
+        message=message.format(item=_label(rental)),
+        related_url=reverse('equipment:detail', args=[rental.equipment_id]),
+    )
+
+
+def _notify(notifications):
+    notifications = Notification.objects.bulk_create(notifications)
+    notification_counts.notifications_created(notifications)
+    events.publish_notifications(notifications)
+
+
+def _conflicting_requests(approved):
+    """Lock and return the other pending requests overlapping the ``approved`` rentals."""
+    if not approved:
+        return []
+    overlaps = Q()
+    for rental in approved:
+        overlaps |= Q(
+            equipment_id=rental.equipment_id,
+            start_date__lte=rental.end_date,
+            end_date__gte=rental.start_date,
+        )
+    return list(
+        Rental.objects
+        .select_for_update(of=('self',))
+        .select_related('equipment', 'patron')
+        .filter(overlaps, rental_status='PENDING')
+        .exclude(id__in=[rental.id for rental in approved])
+        .order_by('id')
+    )
+
+
+@transaction.atomic
+def approve_rentals(rental_ids):
+    """
+    Approve pending rental requests.
+
+    Whether a request can be approved depends only on its dates: a request
+    overlapping an approved rental (including one approved earlier in the
+    same batch) is refused, and then cancelled with the other pending
+    requests overlapping the approved ones. Requests for other dates stay
+    pending and can still be approved. Requests for equipment taken out of
+    service are cancelled. Equipment is only marked unavailable for rentals
+    that have already started.
+    """
+    rental_ids = _ordered(rental_ids)
+    rentals = _lock(rental_ids)
+    equipment_ids = {rental.equipment_id for rental in rentals.values()}
+    confirmed = availability.BookingIndex(equipment_ids, statuses=availability.CONFIRMED_STATUSES)
+    # Periods approved so far in this batch, per item
+    approved_periods = {}
+    today = localdate()
+
+    results, approved, unavailable = [], [], []
+    for rental_id in rental_ids:
+        rental = rentals.get(rental_id)
+        if rental is None:
+            results.append(_result(rental_id, False, "Rental not found."))
+            continue
+        if rental.rental_status != 'PENDING':
+            results.append(_result(
+                rental_id, False, "This rental request cannot be approved because it is not pending."
+            ))
+            continue
+
+        equipment = rental.equipment
+        # Unavailable with nobody renting it today: taken out of service
+        if not equipment.is_available and confirmed.is_free(equipment.id, today, today):
+            unavailable.append(rental)
+            results.append(_result(rental_id, False, f"{_label(rental)} is no longer available."))
+            continue
+
+        period = (rental.start_date, rental.end_date)
+        overlaps_batch = any(
+            start <= period[1] and end >= period[0]
+            for start, end in approved_periods.get(equipment.id, [])
+        )
+        if overlaps_batch or not confirmed.is_free(equipment.id, *period):
+            results.append(_result(
+                rental_id, False, f"{_label(rental)} is already rented out for some of the requested dates."
+            ))
+            continue
+
+        approved_periods.setdefault(equipment.id, []).append(period)
+        approved.append(rental)
+        results.append(_result(rental_id, True, f"Rental request for {_label(rental)} has been approved."))
+
+    _transition(approved, 'PENDING', rental_status='ACTIVE')
+    conflicting = [rental for rental in _conflicting_requests(approved) if rental not in unavailable]
+    _transition(unavailable + conflicting, 'PENDING', rental_status='CANCELLED')
+    # A rental starting later leaves the item free to rent until then
+    started = {rental.equipment_id for rental in approved if rental.start_date <= today}
+    if started:
+        Equipment.objects.filter(id__in=started).update(is_available=False)
+        for rental in approved:
+            if rental.equipment_id in started:
+                rental.equipment.is_available = False
+        caching.invalidate_tags('equipment')
+
+    _notify(
+        [_notification(rental, 'RENTAL_APPROVED', "Your rental request for {item} has been approved.")
+         for rental in approved]
+        + [_notification(rental, 'RENTAL_DENIED',
+                         "Your rental request for {item} was cancelled because it has been rented out for those dates.")
+           for rental in conflicting]
+        + [_notification(rental, 'RENTAL_DENIED',
+                         "Your rental request for {item} was cancelled because it is no longer available.")
+           for rental in unavailable]
+    )
+    return results
+
+
+@transaction.atomic
+def reject_rentals(rental_ids):
+    """Reject pending rental requests."""
+    rental_ids = _ordered(rental_ids)
+    rentals = _lock(rental_ids)
+
+    results, rejected = [], []
+    for rental_id in rental_ids:
+        rental = rentals.get(rental_id)
+        if rental is None:
+            results.append(_result(rental_id, False, "Rental not found."))
+            continue
+        if rental.rental_status != 'PENDING':
+            results.append(_result(
+                rental_id, False, "This rental request cannot be rejected because it is not pending."
+            ))
+            continue
+
+        rejected.append(rental)
+        results.append(_result(rental_id, True, f"Rental request for {_label(rental)} has been rejected."))
+
+    _transition(rejected, 'PENDING', rental_status='CANCELLED')
+    _notify([
+        _notification(rental, 'RENTAL_DENIED', "Your rental request for {item} has been rejected.")
+        for rental in rejected
+    ])
+    return results
+
+
+@transaction.atomic
+def cancel_rentals(rental_ids, patron):
+    """Cancel pending rental requests on behalf of the ``patron`` who made them."""
+    rental_ids = _ordered(rental_ids)
+    rentals = _lock(rental_ids, patron=patron)
+
+    results, cancelled = [], []
+    for rental_id in rental_ids:
+        rental = rentals.get(rental_id)
+        if rental is None:
+            results.append(_result(rental_id, False, "Rental not found."))
+            continue
+        if rental.rental_status != 'PENDING':
+            results.append(_result(
+                rental_id, False, "This rental request cannot be cancelled because it is not pending."
+            ))
+            continue
+
+        cancelled.append(rental)
+        results.append(_result(
+            rental_id, True, f"Your rental request for {_label(rental)} has been cancelled."
+        ))
+
+    _transition(cancelled, 'PENDING', rental_status='CANCELLED')
+    return results
+
+
+@transaction.atomic
+def complete_rentals(rental_ids, return_conditions=None, return_notes=None):
+    """
+    Mark active rentals as returned.
+
+    ``return_conditions`` and ``return_notes`` map rental IDs to what was
+    recorded at the counter; a rental without a recorded condition comes back
+    in the condition it went out in. Equipment that came back in a worse
+    condition is downgraded to it.
+    """
+    return_conditions = return_conditions or {}
+    return_notes = return_notes or {}
+    rental_ids = _ordered(rental_ids)
+    rentals = _lock(rental_ids)
+
+    results, completed = [], []
+    for rental_id in rental_ids:
+        rental = rentals.get(rental_id)
+        if rental is None:
+            results.append(_result(rental_id, False, "Rental not found."))
+            continue
+        if rental.rental_status != 'ACTIVE':
+            results.append(_result(
+                rental_id, False, "This rental cannot be completed because it is not active."
+            ))
+            continue
+
+        condition = return_conditions.get(rental_id) or rental.checked_out_condition
+        if condition not in CONDITION_RANK:
+            results.append(_result(rental_id, False, f"Unknown return condition '{condition}'."))
+            continue
+
+        rental.return_condition = condition
+        rental.return_notes = return_notes.get(rental_id, '')
+
+        equipment = rental.equipment
+        if CONDITION_RANK[condition] > CONDITION_RANK[equipment.condition]:
+            equipment.condition = condition
+
+        completed.append(rental)
+        results.append(_result(rental_id, True, f"Rental for {_label(rental)} has been marked as returned."))
+
+    _transition(completed, 'ACTIVE', rental_status='COMPLETED', return_date=now())
+    Rental.objects.bulk_update(completed, ['return_condition', 'return_notes'])
+
+    returns = Counter(rental.equipment_id for rental in completed)
+    equipment = {rental.equipment_id: rental.equipment for rental in completed}
+    # An item stays out if another approved rental of it has started
+    today = localdate()
+    confirmed = availability.BookingIndex(list(equipment), statuses=availability.CONFIRMED_STATUSES)
+    for equipment_id, count in returns.items():
+        equipment[equipment_id].is_available = confirmed.is_free(equipment_id, today, today)
+        equipment[equipment_id].total_rentals = F('total_rentals') + count
+    if equipment:
+        Equipment.objects.bulk_update(equipment.values(), ['is_available', 'condition', 'total_rentals'])
+        caching.invalidate_tags('equipment')
+
+    _notify([
+        _notification(rental, 'RENTAL_APPROVED', "Your rental for {item} has been marked as completed.")
+        for rental in completed
+    ])
+    return results
+
+
+@transaction.atomic
+def mark_started_rentals():
+    """
+    Mark the equipment of approved rentals that have started by today as
+    unavailable, and return how many items were marked.
+    """
+    today = localdate()
+    started = Rental.objects.filter(
+        equipment=OuterRef('pk'),
+        rental_status__in=availability.CONFIRMED_STATUSES,
+        start_date__lte=today,
+        end_date__gte=today,
+    )
+    marked = Equipment.objects.filter(Exists(started), is_available=True).update(is_available=False)
+    if marked:
+        caching.invalidate_tags('equipment')
+    return marked
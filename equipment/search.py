@@ -0,0 +1,201 @@
+"""
+Full-text search over the equipment catalog.
+
+Two backends share one interface and are picked by database vendor:
+
+* PostgreSQL (Heroku) matches against a ``SearchVector`` expression that is
+  covered by a GIN index, and ranks with ``SearchRank``.
+* SQLite (local development and CI) keeps an FTS5 virtual table in sync with
+  the equipment table via the signals in ``equipment.signals``, and ranks
+  with ``bm25()``.
+
+Any other database falls back to the old ``icontains`` scan so search keeps
+working, just without an index.
+
+Every term in the query is matched as a prefix ("ross exp" finds "Rossignol
+Experience 88"), and all terms must match.
+"""
+import operator
+import re
+from functools import reduce
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Equipment fields covered by the search index, with their rank weight
+# (PostgreSQL's A-D labels: a match in the brand counts for more than one
+# buried in the notes)
+SEARCH_FIELDS = {
+    'equipment_id': 'A',
+    'brand': 'A',
+    'model': 'A',
+    'equipment_type': 'B',
+    'notes': 'D',
+}
+
+# Default SearchRank weight of each label, reused for bm25() on SQLite
+WEIGHT_VALUES = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def parse_terms(query):
+    """Split a search box query into lowercase terms, dropping punctuation."""
+    return _TERM_RE.findall((query or '').lower())
+
+
+class BasicSearchBackend:
+    """Unindexed fallback: every term must appear in one of the search fields."""
+
+    def filter(self, queryset, terms):
+        for term in terms:
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def rank(self, queryset, terms):
+        return queryset.annotate(search_rank=Value(0.0))
+
+    def update(self, equipment):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    """
+    Match with ``to_tsvector(...) @@ to_tsquery(...)`` on PostgreSQL.
+
+    The vector is computed from the row itself, so there is nothing to keep in
+    sync; the GIN index created by migration 0016 is on the SQL ``VECTOR``
+    compiles to, so a change to the fields or weights needs a new migration.
+    """
+
+    CONFIG = 'simple'
+    VECTOR = reduce(operator.add, [
+        SearchVector(field, weight=weight, config='simple')
+        for field, weight in SEARCH_FIELDS.items()
+    ])
+    INDEX = GinIndex(VECTOR, name='equipment_search_idx')
+
+    def _query(self, terms):
+        tsquery = ' & '.join(f"'{term}':*" for term in terms)
+        return SearchQuery(tsquery, search_type='raw', config=self.CONFIG)
+
+    def filter(self, queryset, terms):
+        return queryset.alias(search_document=self.VECTOR).filter(
+            search_document=self._query(terms)
+        )
+
+    def rank(self, queryset, terms):
+        return queryset.annotate(search_rank=SearchRank(self.VECTOR, self._query(terms)))
+
+
+class SQLiteSearchBackend(BasicSearchBackend):
+    """
+    Match against the ``equipment_search`` FTS5 table on SQLite.
+
+    The FTS table's rowid is the equipment primary key. It is populated by the
+    migration that creates it and kept current by ``update()``/``remove()``.
+    """
+
+    TABLE = 'equipment_search'
+
+    def _match(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def filter(self, queryset, terms):
+        matches = RawSQL(
+            f'SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH %s',
+            (self._match(terms),)
+        )
+        return queryset.filter(pk__in=matches)
+
+    def rank(self, queryset, terms):
+        # bm25() is lower-is-better, so negate it to rank like SearchRank
+        table = queryset.model._meta.db_table
+        weights = ', '.join(str(WEIGHT_VALUES[weight]) for weight in SEARCH_FIELDS.values())
+        score = RawSQL(
+            f'SELECT -bm25({self.TABLE}, {weights}) FROM {self.TABLE} '
+            f'WHERE {self.TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (self._match(terms),)
+        )
+        return queryset.annotate(search_rank=score)
+
+    def update(self, equipment):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE} WHERE rowid = %s', [equipment.pk])
+            cursor.execute(
+                f'INSERT INTO {self.TABLE} (rowid, {", ".join(SEARCH_FIELDS)}) '
+                f'VALUES (%s, {", ".join(["%s"] * len(SEARCH_FIELDS))})',
+                [equipment.pk] + [getattr(equipment, field) or '' for field in SEARCH_FIELDS]
+            )
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        from .models import Equipment
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE}')
+            cursor.execute(
+                f'INSERT INTO {self.TABLE} (rowid, {", ".join(SEARCH_FIELDS)}) '
+                f'SELECT id, {", ".join(SEARCH_FIELDS)} FROM {Equipment._meta.db_table}'
+            )
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend():
+    """Return the search backend for the default database."""
+    return _BACKENDS.get(connection.vendor, BasicSearchBackend)()
+
+
+def search(queryset, query, ranked=True):
+    """
+    Restrict an equipment queryset to the items matching ``query``.
+
+    With ``ranked=True`` the results are annotated with ``search_rank`` and
+    ordered best match first; pass ``ranked=False`` to keep the queryset's own
+    ordering (e.g. when the user picked a sort). A query with no searchable
+    terms leaves the queryset unchanged.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return queryset
+
+    backend = get_backend()
+    queryset = backend.filter(queryset, terms)
+    if ranked:
+        queryset = backend.rank(queryset, terms).order_by(F('search_rank').desc(), 'id')
+    return queryset
+
+
+def update_index(equipment):
+    """Add or refresh a single item in the search index."""
+    get_backend().update(equipment)
+
+
+def remove_from_index(pk):
+    """Drop a single item from the search index."""
+    get_backend().remove(pk)
+
+
+def rebuild_index():
+    """Re-index the whole catalog, e.g. after bulk updates that skip signals."""
+    get_backend().rebuild()
@@ -0,0 +1,125 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import Notification, UserProfile
+
+from . import caching, events, images, notification_counts, search, typeahead, visibility
+from .models import Collection, Equipment, EquipmentImage, Review
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def collection_changed(sender, **kwargs):
+    """Sharing type or creator may have changed, so cached visibility is stale."""
+    visibility.invalidate()
+
+
+@receiver(m2m_changed, sender=Collection.items.through)
+@receiver(m2m_changed, sender=Collection.authorized_users.through)
+def collection_membership_changed(sender, action, **kwargs):
+    """Items or authorized users were added to or removed from a collection."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        visibility.invalidate()
+        caching.invalidate_tags('collection')
+
+
+def model_changed(sender, **kwargs):
+    """Make queries cached under the changed model's tag stale."""
+    caching.invalidate_tags(caching.MODEL_TAGS[sender._meta.label])
+
+
+for label in caching.MODEL_TAGS:
+    post_save.connect(model_changed, sender=apps.get_model(label), dispatch_uid=f'cache_tags:save:{label}')
+    post_delete.connect(model_changed, sender=apps.get_model(label), dispatch_uid=f'cache_tags:delete:{label}')
+
+
+# Fields the typeahead index is built from
+TYPEAHEAD_FIELDS = {'brand', 'model', 'is_deleted'}
+
+
+@receiver(post_save, sender=Equipment)
+def equipment_saved(sender, instance, update_fields=None, **kwargs):
+    """Keep the search and typeahead indexes in step with the catalog."""
+    search.update_index(instance)
+    if update_fields is None or TYPEAHEAD_FIELDS & set(update_fields):
+        typeahead.invalidate()
+
+
+@receiver(post_delete, sender=Equipment)
+def equipment_deleted(sender, instance, **kwargs):
+    search.remove_from_index(instance.pk)
+    typeahead.invalidate()
+
+
+# Image field and renditions record field of each model with uploaded images
+IMAGE_FIELDS = {
+    Equipment: ('main_image', 'main_image_renditions'),
+    EquipmentImage: ('image', 'renditions'),
+}
+
+
+@receiver(pre_save, sender=Equipment)
+@receiver(pre_save, sender=EquipmentImage)
+def image_uploading(sender, instance, **kwargs):
+    """Strip EXIF data from a new upload before it is stored."""
+    image_field, _ = IMAGE_FIELDS[sender]
+    field_file = getattr(instance, image_field)
+    if field_file and not field_file._committed:
+        setattr(instance, image_field, images.strip_metadata(field_file.file))
+
+
+@receiver(post_save, sender=Equipment)
+@receiver(post_save, sender=EquipmentImage)
+def image_saved(sender, instance, **kwargs):
+    """Make the resized copies of a newly stored image."""
+    image_field, record_field = IMAGE_FIELDS[sender]
+    field_file = getattr(instance, image_field)
+    if images.needs_renditions(field_file, getattr(instance, record_field)):
+        setattr(instance, record_field, images.make_renditions(field_file))
+        # update() so the record is saved without sending this signal again
+        sender.objects.filter(pk=instance.pk).update(**{record_field: getattr(instance, record_field)})
+
+
+@receiver(post_save, sender=EquipmentImage)
+@receiver(post_delete, sender=EquipmentImage)
+def equipment_image_changed(sender, instance, **kwargs):
+    """Cards without a main image show the first gallery image, which may have changed."""
+    equipment = Equipment.objects.filter(pk=instance.equipment_id).first()
+    if equipment is not None and not equipment.main_image:
+        caching.invalidate_card(equipment)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    """Move the equipment's rating counts from the old rating to the new one."""
+    previous = None if created else getattr(instance, '_saved_rating', None)
+    if created or previous is not None:
+        instance.equipment.apply_rating_change(added=instance.rating, removed=previous)
+    else:
+        # Old rating unknown (instance wasn't loaded from the database): recount
+        instance.equipment.update_average_rating()
+    instance._saved_rating = int(instance.rating)
+    # Ratings are stored on the equipment with update(), which sends no signal
+    caching.invalidate_tags('equipment')
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    rating = getattr(instance, '_saved_rating', instance.rating)
+    Equipment(pk=instance.equipment_id).apply_rating_change(removed=rating)
+    caching.invalidate_tags('equipment')
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    """Push new notifications to the recipients' open streams."""
+    if created:
+        notification_counts.notifications_created([instance])
+        events.publish_notifications([instance])
+
+
+@receiver(post_save, sender=UserProfile)
+def user_profile_saved(sender, instance, **kwargs):
+    """A change of user type changes which broadcasts the user receives."""
+    notification_counts.invalidate([instance.user_id])
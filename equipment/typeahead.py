@@ -0,0 +1,126 @@
+"""
+Search-as-you-type suggestions for the equipment catalog.
+
+Suggestions come from an in-memory prefix index over the words in each item's
+brand and model: a sorted list of ``(token, equipment id)`` pairs that is
+searched with ``bisect``, so a lookup never touches the database. Each worker
+process builds its index on first use and rebuilds it when the catalog
+changes; ``equipment.signals`` bumps a generation number in the shared cache
+on every relevant save or delete, so all processes notice.
+
+Finished responses are also cached per (prefix, visibility class) for a short
+time, since everyone typing the same letters gets the same answer.
+"""
+import re
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from . import visibility
+from .models import Equipment
+
+# How many suggestions to return
+SUGGESTION_LIMIT = 10
+
+# How long a finished list of suggestions is cached (seconds)
+SUGGESTION_CACHE_TIMEOUT = 60
+
+_VERSION_KEY = 'typeahead:version'
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# This process's index, rebuilt whenever the shared generation moves on
+_index = None
+
+
+def _generation():
+    generation = cache.get(_VERSION_KEY)
+    if generation is None:
+        generation = 1
+        cache.add(_VERSION_KEY, generation, None)
+    return generation
+
+
+def invalidate():
+    """Mark every process's prefix index (and cached suggestions) as stale."""
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.add(_VERSION_KEY, 1, None)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+class PrefixIndex:
+    """Sorted token list over the brand and model of every catalog item."""
+
+    def __init__(self, rows, generation=None):
+        self.generation = generation
+        self.labels = {}
+        tokens = set()
+        for row in rows:
+            self.labels[row['id']] = f"{row['brand']} {row['model']}"
+            for token in tokenize(self.labels[row['id']]):
+                tokens.add((token, row['id']))
+        self.tokens = sorted(tokens)
+
+    @classmethod
+    def build(cls, generation=None):
+        rows = Equipment.objects.filter(is_deleted=False).values('id', 'brand', 'model')
+        return cls(rows, generation)
+
+    def ids_with_prefix(self, prefix):
+        """Return the IDs of items with a brand or model word starting with ``prefix``."""
+        ids = set()
+        position = bisect_left(self.tokens, (prefix,))
+        while position < len(self.tokens) and self.tokens[position][0].startswith(prefix):
+            ids.add(self.tokens[position][1])
+            position += 1
+        return ids
+
+    def lookup(self, terms, exclude=frozenset(), limit=SUGGESTION_LIMIT):
+        """
+        Return up to ``limit`` ``{'id', 'label'}`` suggestions, sorted by label,
+        for items where every term prefixes one of the words.
+        """
+        if not terms:
+            return []
+
+        ids = self.ids_with_prefix(terms[0])
+        for term in terms[1:]:
+            ids &= self.ids_with_prefix(term)
+        ids -= exclude
+
+        matches = sorted(ids, key=lambda pk: (self.labels[pk].lower(), pk))
+        return [{'id': pk, 'label': self.labels[pk]} for pk in matches[:limit]]
+
+
+def get_index():
+    """Return this process's prefix index, rebuilding it if the catalog changed."""
+    global _index
+    generation = _generation()
+    if _index is None or _index.generation != generation:
+        _index = PrefixIndex.build(generation)
+    return _index
+
+
+def suggest(user, query):
+    """Return the suggestions for ``query`` that this user is allowed to see."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    key = 'typeahead:{}:{}:{}:{}'.format(
+        _generation(),
+        visibility.cache_version(),
+        visibility.visibility_class(user),
+        '+'.join(terms),
+    )
+    suggestions = cache.get(key)
+    if suggestions is None:
+        exclude = visibility.excluded_equipment_ids(user)
+        suggestions = get_index().lookup(terms, exclude)
+        cache.set(key, suggestions, SUGGESTION_CACHE_TIMEOUT)
+    return suggestions
@@ -8,6 +8,7 @@ urlpatterns = [
     path("<int:pk>/", views.DetailView.as_view(), name="detail"),
     path("<int:equipment_id>/delete/", views.delete_equipment, name="delete_equipment"),
     path("<int:equipment_id>/add-images/", views.add_equipment_images, name="add_images"),
+    path("<int:equipment_id>/image-jobs/", views.image_job_status, name="image_job_status"),
     path("images/<int:image_id>/delete/", views.delete_equipment_image, name="delete_image"),
     path("cart/add/<int:equipment_id>/", views.add_to_cart, name="add_to_cart"),
     path("cart/remove/<int:item_id>/", views.remove_from_cart, name="remove_from_cart"),
@@ -18,6 +19,9 @@ urlpatterns = [
     path("rentals/reject/<int:rental_id>/", views.reject_rental, name="reject_rental"),
     path("rentals/complete/<int:rental_id>/", views.complete_rental, name="complete_rental"),
     path("rentals/cancel/<int:rental_id>/", views.cancel_rental, name="cancel_rental"),
+    path("rentals/bulk/approve/", views.bulk_approve_rentals, name="bulk_approve_rentals"),
+    path("rentals/bulk/reject/", views.bulk_reject_rentals, name="bulk_reject_rentals"),
+    path("rentals/bulk/complete/", views.bulk_complete_rentals, name="bulk_complete_rentals"),
     path("collections/", views.CollectionListView.as_view(), name="collections"),
     path("collections/<int:pk>/", views.CollectionDetailView.as_view(), name="collection_detail"),
     path("collections/create/", views.create_collection, name="create_collection"),
@@ -33,6 +37,8 @@ urlpatterns = [
     path("<int:equipment_id>/review/", views.add_review, name="add_review"),
     path("quick-rent/<int:equipment_id>/", views.quick_rent, name="quick_rent"),
     path("api/search/", views.search_equipment, name="search_equipment"),
+    path("api/quote/", views.quote_prices, name="quote_prices"),
     path("api/notifications/", views.get_notifications, name="get_notifications"),
+    path("api/notifications/stream/", views.notification_stream, name="notification_stream"),
     path("<int:pk>/edit/", views.EditView.as_view(), name="edit_equipment"),
 ]
\ No newline at end of file
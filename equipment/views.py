@@ -1,4 +1,6 @@
 from django.utils import timezone
+import asyncio
+import json
 import os
 from django.conf import settings
 from django.core.files.base import ContentFile
@@ -13,65 +15,45 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils.timezone import make_aware, is_naive
 from django.contrib.auth.models import User
 
-from django.http import JsonResponse
-from django.db.models import Q, Avg, Count, Func, Value
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.db.models import Q, Avg, Count, Value
 from django.db import transaction
 from datetime import datetime, timedelta
 from decimal import Decimal
 from django.contrib import messages
 from django.urls import reverse
-from django.utils.timezone import now
-from .models import Equipment, EquipmentImage, Rental, Collection, Review, Cart, CartItem, CollectionAccessRequest
+from django.utils.dateparse import parse_date
+from .models import (
+    Equipment, EquipmentImage, ImageUploadJob, Rental, Collection, Review, Cart, CartItem, CollectionAccessRequest,
+    rating_count_field,
+)
 from users.models import UserProfile, Notification
 from .forms import EquipmentForm, MultipleImageUploadForm, CollectionForm, EquipmentImageForm
+from .visibility import visible_equipment
+from .pagination import KeysetPaginator, InvalidCursor
+from . import availability, caching, events, image_jobs, notification_counts, pricing, rental_states, search, typeahead, visibility
 
 # Helper functions for notifications
-def create_rental_approved_notification(rental):
-    """Create a notification when a rental is approved"""
-    message = f"Your rental request for {rental.equipment.brand} {rental.equipment.model} has been approved."
-    Notification.objects.create(
-        user=rental.patron,
-        notification_type='RENTAL_APPROVED',
-        message=message,
-        related_url=reverse('equipment:detail', args=[rental.equipment.id]),
-    )
-
-def create_rental_request_notification(rental):
-    """Create a notification for librarians when a rental request is submitted"""
-    message = f"{rental.patron.username} has requested to rent {rental.equipment.brand} {rental.equipment.model}."
-    
-    # Get all librarians
-    from users.models import UserProfile
-    librarians = UserProfile.objects.filter(user_type='LIBRARIAN')
-    
-    # Create notification for each librarian
-    for librarian in librarians:
-        Notification.objects.create(
-            user=librarian.user,
+def create_rental_request_notifications(rentals):
+    """
+    Tell the librarians about a batch of rental requests: one broadcast
+    notification per rental, addressed to the LIBRARIAN role rather than
+    copied to every librarian, all in one bulk insert.
+    """
+    related_url = reverse('librarian')
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            audience='LIBRARIAN',
             notification_type='RENTAL_REQUEST',
-            message=message,
-            related_url=reverse('librarian'),
+            message=f"{rental.patron.username} has requested to rent {rental.equipment.brand} {rental.equipment.model}.",
+            related_url=related_url,
         )
-
-def create_rental_rejected_notification(rental):
-    """Create a notification when a rental is rejected"""
-    message = f"Your rental request for {rental.equipment.brand} {rental.equipment.model} has been rejected."
-    Notification.objects.create(
-        user=rental.patron,
-        notification_type='RENTAL_DENIED',
-        message=message,
-        related_url=reverse('equipment:detail', args=[rental.equipment.id]),
-    )
-
-def create_rental_completed_notification(rental):
-    """Create a notification when a rental is completed"""
-    message = f"Your rental for {rental.equipment.brand} {rental.equipment.model} has been marked as completed."
-    Notification.objects.create(
-        user=rental.patron,
-        notification_type='RENTAL_APPROVED',
-        message=message,
-        related_url=reverse('equipment:detail', args=[rental.equipment.id]),
-    )
+        for rental in rentals
+    ])
+    notification_counts.notifications_created(notifications)
+    events.publish_notifications(notifications)
 
 def create_collection_access_request_notification(access_request):
     """Create a notification for collection owner when access is requested"""
@@ -108,65 +90,91 @@ class RegexpReplace(Func):
 
 # Create your views here.
 
+@caching.cached_query('top_rated', ttl=300, tags=['equipment', 'collection'])
+def top_rated_equipment(visibility_class, user=None):
+    """The four best rated available items ``user`` can see, shared by their visibility class."""
+    return visible_equipment(
+        user, Equipment.objects.filter(is_deleted=False, is_available=True).with_card_image()
+    ).order_by('-average_rating')[:4]
+
+
 class IndexView(generic.ListView):
     template_name = 'equipment/index.html'
     context_object_name = 'equipment_list'
-    paginate_by = None  # Show 12 items per page
+    paginate_by = 24  # Items per page, further pages are fetched by cursor
+
+    # Sort options, each ending in a unique key so keyset pagination is stable
+    SORT_ORDERINGS = {
+        'newest': ('-date_added', '-id'),
+        'price-low': ('rental_price', 'id'),
+        'price-high': ('-rental_price', '-id'),
+        'rating': ('-average_rating', '-id'),
+    }
+
+    # Size range options for different equipment types, shown in the filter sidebar
+    SKI_SIZE_RANGES = [
+        {'range': '70-99', 'display': '70-99 cm'},
+        {'range': '100-129', 'display': '100-129 cm'},
+        {'range': '130-159', 'display': '130-159 cm'},
+        {'range': '160-189', 'display': '160-189 cm'},
+        {'range': '190-200', 'display': '190-200 cm'}
+    ]
+
+    SNOWBOARD_SIZE_RANGES = [
+        {'range': '80-119', 'display': '80-119 cm'},
+        {'range': '120-139', 'display': '120-139 cm'},
+        {'range': '140-159', 'display': '140-159 cm'},
+        {'range': '160-180', 'display': '160-180 cm'}
+    ]
+
+    BOOT_SIZE_RANGES = [
+        {'range': '15.0-20.0', 'display': '15.0-20.0 (Mondopoint)'},
+        {'range': '20.5-25.0', 'display': '20.5-25.0 (Mondopoint)'},
+        {'range': '25.5-30.0', 'display': '25.5-30.0 (Mondopoint)'},
+        {'range': '30.5-33.0', 'display': '30.5-33.0 (Mondopoint)'}
+    ]
+
+    POLE_SIZE_RANGES = [
+        {'range': '70-89', 'display': '70-89 cm'},
+        {'range': '90-109', 'display': '90-109 cm'},
+        {'range': '110-129', 'display': '110-129 cm'},
+        {'range': '130-140', 'display': '130-140 cm'}
+    ]
+
+    STANDARD_SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
 
     def get(self, request, *args, **kwargs):
         if 'ajax' in request.GET:
+            # Grid-only response used by the filters and the "Load more" button
             self.object_list = self.get_queryset()
             context = self.get_context_data()
-            return render(request, 'equipment/_equipment_grid.html', context)
+            response = render(request, 'equipment/_equipment_grid.html', context)
+            page = context['page_obj']
+            response['X-Next-Cursor'] = page.next_cursor or ''
+            if not page.has_previous():
+                response['X-Total-Count'] = context['paginator'].count
+            return response
         return super().get(request, *args, **kwargs)
 
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.get_page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_queryset(self):
-        queryset = Equipment.objects.filter(is_deleted=False)
+        # Hide items in private collections the user isn't allowed to see
+        queryset = visible_equipment(
+            self.request.user, Equipment.objects.filter(is_deleted=False).with_card_image()
+        )
 
-        # Filter items based on collection visibility rules
-        user = self.request.user
-        
-        if not user.is_authenticated or not hasattr(user, 'userprofile') or user.userprofile.user_type != 'LIBRARIAN':
-            # For anonymous users and patrons:
-            # 1. Show items that are not in any collection
-            # 2. Show items that are in PUBLIC collections
-            # 3. Hide items that are in PRIVATE collections (unless the user has access)
-            
-            # Get all items that are in private collections
-            items_in_private_collections = Equipment.objects.filter(
-                collections__sharing_type='PRIVATE'
-            ).distinct()
-            
-            if user.is_authenticated:
-                # For authenticated users, get items from private collections they have access to
-                accessible_private_items = Equipment.objects.filter(
-                    collections__sharing_type='PRIVATE',
-                    collections__authorized_users=user
-                ).distinct() | Equipment.objects.filter(
-                    collections__sharing_type='PRIVATE',
-                    collections__creator=user
-                ).distinct()
-                
-                # First, exclude all items in private collections
-                queryset = queryset.exclude(id__in=items_in_private_collections.values_list('id', flat=True))
-                # Then, add back items from accessible private collections
-                # Ensure both querysets have the same distinctness by making both distinct
-                queryset = queryset.distinct()
-                accessible_private_items = accessible_private_items.distinct()
-                queryset = queryset | accessible_private_items
-            else:
-                # For anonymous users, exclude all items in private collections
-                queryset = queryset.exclude(id__in=items_in_private_collections.values_list('id', flat=True))
-        
         # Handle search
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(
-                Q(brand__icontains=search_query) |
-                Q(model__icontains=search_query) |
-                Q(equipment_type__icontains=search_query) |
-                Q(notes__icontains=search_query)
-            )
+            # Keep the user's chosen sort order rather than ranking by relevance
+            queryset = search.search(queryset, search_query, ranked=False)
 
         # Handle equipment type filter
         equipment_type = self.request.GET.get('type')
@@ -194,9 +202,9 @@ class IndexView(generic.ListView):
         if max_price and max_price != '100':
             queryset = queryset.filter(rental_price__lte=Decimal(max_price))
 
-        # Handle availability filter
+        # Handle availability filter (on by default, matching the sidebar checkbox)
         available_only = self.request.GET.get('available_only')
-        if available_only == 'true':
+        if available_only != 'false':
             queryset = queryset.filter(is_available=True)
 
         # Handle condition filter
@@ -207,81 +215,29 @@ class IndexView(generic.ListView):
         # Handle size filters - Process multiple selected sizes with ranges
         size_filters = self.request.GET.getlist('size')
         if size_filters:
-            # Split sizes into numerical ranges (like '70-99') and categorical (like 'S', 'M', 'L')
-            numerical_size_filters = [s for s in size_filters if '-' in s]
-            categorical_size_filters = [s for s in size_filters if '-' not in s]
-
-            # Build Q objects for OR filtering
+            # Numerical ranges (like '70-99') match size_value, categorical sizes
+            # (like 'S', 'M', 'L') match size_category; both are indexed
             size_conditions = Q()
-
-            # Handle numerical ranges using a SQLite-compatible approach
-            if numerical_size_filters:
-                # For each piece of equipment, we'll check if its size (as a number) falls within any of the ranges
-                for size_range in numerical_size_filters:
+            for size in size_filters:
+                if '-' in size:
                     try:
-                        lower, upper = map(float, size_range.split('-'))
-
-                        # Get all equipment with sizes that could be numerical in this range
-                        for digit in range(int(lower), int(upper) + 1):
-                            size_conditions |= Q(size__contains=str(digit))
+                        lower, upper = map(float, size.split('-'))
                     except ValueError:
                         # Skip invalid ranges
-                        pass
-
-            # Handle categorical sizes (XS, S, M, L, XL, XXL)
-            if categorical_size_filters:
-                for size in categorical_size_filters:
-                    size_conditions |= Q(size__iexact=size)
+                        continue
+                    size_conditions |= Q(size_value__range=(lower, upper))
+                else:
+                    size_conditions |= Q(size_category=size.strip().upper())
 
-            # Apply size filter conditions if any exist
             if size_conditions:
                 queryset = queryset.filter(size_conditions)
 
-                # For numerical ranges, we need to post-filter in Python
-                # since SQLite can't properly convert and compare the size values
-                if numerical_size_filters:
-                    filtered_queryset = []
-                    for equipment in queryset:
-                        try:
-                            # Extract numbers from size field
-                            import re
-                            size_value_match = re.search(r'[0-9]+(\.[0-9]+)?', equipment.size)
-                            if size_value_match:
-                                size_value = float(size_value_match.group(0))
-
-                                # Check if size value is in any of the selected ranges
-                                for size_range in numerical_size_filters:
-                                    lower, upper = map(float, size_range.split('-'))
-                                    if lower <= size_value <= upper:
-                                        filtered_queryset.append(equipment.id)
-                                        break
-                        except (ValueError, TypeError):
-                            # Skip if size can't be parsed
-                            continue
-
-                    # Apply the filtered IDs
-                    if filtered_queryset:
-                        queryset = queryset.filter(id__in=filtered_queryset)
-                    else:
-                        # If no equipment matches the numerical filters, return empty queryset
-                        queryset = Equipment.objects.none()
-
-        # Handle sorting
+        # Handle sorting (default sort by newest)
         sort_by = self.request.GET.get('sort')
-        if sort_by:
-            if sort_by == 'price-low':
-                queryset = queryset.order_by('rental_price')
-            elif sort_by == 'price-high':
-                queryset = queryset.order_by('-rental_price')
-            elif sort_by == 'rating':
-                queryset = queryset.order_by('-average_rating')
-            elif sort_by == 'newest':
-                queryset = queryset.order_by('-date_added')
-        else:
-            # Default sort by newest
-            queryset = queryset.order_by('-date_added')
+        ordering = self.SORT_ORDERINGS.get(sort_by, self.SORT_ORDERINGS['newest'])
+        queryset = queryset.order_by(*ordering)
 
-        return queryset.distinct()
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -292,41 +248,10 @@ class IndexView(generic.ListView):
         # Add ski subtypes choices
         context['ski_subtypes'] = Equipment.SKI_TYPES
 
-        #Get top 3 rated skis - apply same privacy filters as main queryset
-        top_rated_query = Equipment.objects.filter(is_deleted=False, is_available=True)
-        
-        # Apply the same privacy filters as the main queryset
-        user = self.request.user
-        
-        if not user.is_authenticated or not hasattr(user, 'userprofile') or user.userprofile.user_type != 'LIBRARIAN':
-            # Get all items that are in private collections
-            items_in_private_collections = Equipment.objects.filter(
-                collections__sharing_type='PRIVATE'
-            ).distinct()
-            
-            if user.is_authenticated:
-                # For authenticated users, get items from private collections they have access to
-                accessible_private_items = Equipment.objects.filter(
-                    collections__sharing_type='PRIVATE',
-                    collections__authorized_users=user
-                ).distinct() | Equipment.objects.filter(
-                    collections__sharing_type='PRIVATE',
-                    collections__creator=user
-                ).distinct()
-                
-                # First, exclude all items in private collections
-                top_rated_query = top_rated_query.exclude(id__in=items_in_private_collections.values_list('id', flat=True))
-                # Then, add back items from accessible private collections
-                top_rated_query = top_rated_query.distinct()
-                accessible_private_items = accessible_private_items.distinct()
-                top_rated_query = top_rated_query | accessible_private_items
-            else:
-                # For anonymous users, exclude all items in private collections
-                top_rated_query = top_rated_query.exclude(id__in=items_in_private_collections.values_list('id', flat=True))
-        
-        # Get the top rated equipment with privacy filters applied
-        top_rated = top_rated_query.order_by('-average_rating')[:4]
-        context['top_rated'] = top_rated
+        # Top rated equipment, with the same privacy filters as the main queryset
+        context['top_rated'] = top_rated_equipment(
+            visibility.visibility_class(self.request.user), user=self.request.user
+        )
         # Add condition choices
         context['condition_choices'] = Equipment.CONDITION_CHOICES
 
@@ -341,40 +266,23 @@ class IndexView(generic.ListView):
         context['available_only'] = self.request.GET.get('available_only') != 'false'
         context['sort_by'] = self.request.GET.get('sort', 'newest')
 
-        # Flag for showing standard sizes (for apparel items)
-        context['show_standard_sizes'] = context['selected_types'] in ['HELMET', 'GOGGLES', 'GLOVES', 'JACKET', 'PANTS']
+        # The sidebar fragment is cached without the selection, which the page's script applies
+        context['filter_state'] = {
+            'type': context['selected_types'],
+            'ski_subtypes': context['selected_subtypes'],
+            'sizes': context['selected_sizes'],
+            'skill_level': context['selected_skill_level'],
+            'conditions': context['selected_conditions'],
+            'available_only': context['available_only'],
+        }
+        context['catalog_version'] = caching.tag_versions(['equipment'])[0]
 
         # Size range options for different equipment types
-        context['ski_size_ranges'] = [
-            {'range': '70-99', 'display': '70-99 cm'},
-            {'range': '100-129', 'display': '100-129 cm'},
-            {'range': '130-159', 'display': '130-159 cm'},
-            {'range': '160-189', 'display': '160-189 cm'},
-            {'range': '190-200', 'display': '190-200 cm'}
-        ]
-
-        context['snowboard_size_ranges'] = [
-            {'range': '80-119', 'display': '80-119 cm'},
-            {'range': '120-139', 'display': '120-139 cm'},
-            {'range': '140-159', 'display': '140-159 cm'},
-            {'range': '160-180', 'display': '160-180 cm'}
-        ]
-
-        context['boot_size_ranges'] = [
-            {'range': '15.0-20.0', 'display': '15.0-20.0 (Mondopoint)'},
-            {'range': '20.5-25.0', 'display': '20.5-25.0 (Mondopoint)'},
-            {'range': '25.5-30.0', 'display': '25.5-30.0 (Mondopoint)'},
-            {'range': '30.5-33.0', 'display': '30.5-33.0 (Mondopoint)'}
-        ]
-
-        context['pole_size_ranges'] = [
-            {'range': '70-89', 'display': '70-89 cm'},
-            {'range': '90-109', 'display': '90-109 cm'},
-            {'range': '110-129', 'display': '110-129 cm'},
-            {'range': '130-140', 'display': '130-140 cm'}
-        ]
-
-        context['standard_sizes'] = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+        context['ski_size_ranges'] = self.SKI_SIZE_RANGES
+        context['snowboard_size_ranges'] = self.SNOWBOARD_SIZE_RANGES
+        context['boot_size_ranges'] = self.BOOT_SIZE_RANGES
+        context['pole_size_ranges'] = self.POLE_SIZE_RANGES
+        context['standard_sizes'] = self.STANDARD_SIZES
 
         # Add user recommendations if user is logged in and has preferences - TODO this is unused and could be cool!
         if self.request.user.is_authenticated:
@@ -428,31 +336,17 @@ class DetailView(generic.DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Add today's date for calendar min date
-        from datetime import date, timedelta
+        from datetime import date
         today = date.today()
         context['today_date'] = today.isoformat()
 
-        # Add future dates for the next 30 days to help with availability display
         equipment = self.get_object()
 
-        # Check for rentals of this equipment
-        future_rentals = Rental.objects.filter(
-            equipment=equipment,
-            checkout_date__gte=today,
-            rental_status__in=['ACTIVE', 'PENDING']
-        ).order_by('checkout_date')
-
-        # Get all unavailable dates (equipment is already booked)
-        unavailable_dates = []
-        for rental in future_rentals:
-            current_date = rental.checkout_date
-            end_date = rental.due_date or current_date + timedelta(days=1)
-
-            while current_date <= end_date:
-                unavailable_dates.append(current_date.isoformat())
-                current_date += timedelta(days=1)
-
-        context['unavailable_dates'] = unavailable_dates
+        # Booked periods from today on, as merged [start, end] ranges for the calendar
+        context['booked_ranges'] = [
+            {'start': start.isoformat(), 'end': end.isoformat()}
+            for start, end in availability.booked_ranges(equipment, start=today)
+        ]
 
         # Add rating distribution data
         context['rating_distribution'] = equipment.get_rating_distribution()
@@ -466,7 +360,7 @@ class DetailView(generic.DetailView):
         context['additional_images'] = equipment.images.all()
 
         # Get reviews
-        context['reviews'] = equipment.review_set.all().order_by('-date_posted')
+        context['reviews'] = equipment.review_set.select_related('user__userprofile').order_by('-date_posted')
 
         return context
 
@@ -661,20 +555,19 @@ def add_equipment_images(request, equipment_id):
                     'equipment': equipment
                 })
 
-            for f in files:
-                EquipmentImage.objects.create(
-                    equipment=equipment,
-                    image=f
-                )
+            # Stored by background workers; the page polls image_job_status for progress
+            jobs = image_jobs.enqueue(equipment, files, request.user)
 
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
                     'success': True,
-                    'message': 'Images uploaded successfully!',
-                    'count': len(files)
+                    'message': 'Images uploaded, processing...',
+                    'count': len(files),
+                    'jobs': [job.id for job in jobs],
+                    'status_url': reverse('equipment:image_job_status', args=[equipment.id]),
                 })
 
-            messages.success(request, 'Images added successfully!')
+            messages.success(request, 'Images uploaded! They will appear in a moment.')
             return redirect('equipment:detail', pk=equipment_id)
         else:
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -690,6 +583,34 @@ def add_equipment_images(request, equipment_id):
         'equipment': equipment
     })
 
+@login_required
+def image_job_status(request, equipment_id):
+    """Report the progress of this item's image uploads (``?jobs=1,2,3``) as JSON."""
+    if not hasattr(request.user, 'userprofile') or request.user.userprofile.user_type != 'LIBRARIAN':
+        return JsonResponse({
+            'success': False,
+            'message': 'You do not have permission to view image uploads.'
+        }, status=403)
+
+    try:
+        job_ids = [int(job_id) for job_id in request.GET.get('jobs', '').split(',') if job_id]
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid job IDs.'}, status=400)
+
+    jobs = ImageUploadJob.objects.filter(equipment_id=equipment_id, id__in=job_ids).order_by('id')
+    results = [{
+        'id': job.id,
+        'name': job.original_name,
+        'status': job.status,
+        'error': job.error,
+        'image': job.image_id,
+    } for job in jobs]
+    return JsonResponse({
+        'success': True,
+        'jobs': results,
+        'finished': all(job['status'] in ('DONE', 'FAILED') for job in results),
+    })
+
 @login_required
 def delete_equipment_image(request, image_id):
     """Delete an equipment image."""
@@ -749,6 +670,11 @@ def add_to_cart(request, equipment_id):
             messages.error(request, 'This item is no longer available.')
             return redirect('equipment:detail', pk=equipment_id)
 
+        # Check that nobody else has booked it for these dates
+        if not availability.is_free(equipment, start_date.date(), end_date.date()):
+            messages.error(request, 'This item is already booked for some of those dates.')
+            return redirect('equipment:detail', pk=equipment_id)
+
         # Get or create user's cart
         cart, created = Cart.objects.get_or_create(user=request.user)
 
@@ -815,7 +741,7 @@ class CartView(LoginRequiredMixin, generic.TemplateView):
         context = super().get_context_data(**kwargs)
         cart, created = Cart.objects.get_or_create(user=self.request.user)
         context['cart'] = cart
-        context['cart_items'] = cart.items.all()
+        context['cart_items'] = cart.pricing.items
         return context
 
 class CollectionListView(generic.ListView):
@@ -916,19 +842,13 @@ class CollectionDetailView(generic.DetailView):
         # Filter items based on search query if provided
         if search_query and collection.items.exists():
             # Filter collection items by search query
-            filtered_items = collection.items.filter(
-                Q(brand__icontains=search_query) |
-                Q(model__icontains=search_query) |
-                Q(equipment_type__icontains=search_query) |
-                Q(notes__icontains=search_query) |
-                Q(equipment_id__icontains=search_query)
-            ).distinct()
+            filtered_items = search.search(collection.items.with_card_image(), search_query)
 
             context['filtered_items'] = filtered_items
             context['is_search'] = True
         else:
             # No search query, return all items
-            context['filtered_items'] = collection.items.all()
+            context['filtered_items'] = collection.items.with_card_image()
             context['is_search'] = False
 
         # Add flag to check if user can request access
@@ -1264,28 +1184,31 @@ def add_review(request, equipment_id):
         if not rating:
             messages.error(request, 'Rating is required')
             return redirect('equipment:detail', pk=equipment_id)
+        if rating_count_field(rating) is None:
+            messages.error(request, 'Rating must be a whole number from 1 to 5')
+            return redirect('equipment:detail', pk=equipment_id)
 
-        # Check if user already has a review for this equipment
-        existing_review = Review.objects.filter(equipment=equipment, user=request.user).first()
-
-        if existing_review:
-            # Update existing review
-            existing_review.rating = rating
-            existing_review.comment = comment
-            existing_review.save()
-            messages.success(request, 'Your review has been updated')
-        else:
-            # Create new review
-            Review.objects.create(
-                equipment=equipment,
-                user=request.user,
-                rating=rating,
-                comment=comment
-            )
-            messages.success(request, 'Your review has been added')
-
-        # Update the average rating
-        equipment.update_average_rating()
+        # Saving the review also updates the equipment's rating counts and
+        # average (see equipment.signals), in the same transaction
+        with transaction.atomic():
+            # Check if user already has a review for this equipment
+            existing_review = Review.objects.filter(equipment=equipment, user=request.user).first()
+
+            if existing_review:
+                # Update existing review
+                existing_review.rating = rating
+                existing_review.comment = comment
+                existing_review.save()
+                messages.success(request, 'Your review has been updated')
+            else:
+                # Create new review
+                Review.objects.create(
+                    equipment=equipment,
+                    user=request.user,
+                    rating=rating,
+                    comment=comment
+                )
+                messages.success(request, 'Your review has been added')
 
         return redirect(f"{reverse('equipment:detail', kwargs={'pk': equipment_id})}#reviews-tab")
 
@@ -1311,33 +1234,49 @@ def submit_rental_request(request):
             messages.error(request, "Your cart is empty. Please add items before submitting a request.")
             return redirect('equipment:index')
 
-        # Process each cart item
-        request_count = 0
-        for item in cart.items.all():
-            # Check if the equipment is still available (this would need more robust logic in a real system)
-            if not item.equipment.is_available:
-                messages.warning(
-                    request,
-                    f"{item.equipment.brand} {item.equipment.model} is no longer available. It has been removed from your cart."
-                )
-                item.delete()
-                continue
-
-            # Create a rental request with PENDING status
-            rental = Rental.objects.create(
-                equipment=item.equipment,
-                patron=request.user,
-                rental_duration=item.rental_duration,  # Use the cart item's rental duration
-                rental_status='PENDING',
-                rental_price=item.get_subtotal(),
-                due_date= make_aware(datetime.combine(item.end_date, datetime.min.time())),  # Convert date to datetime
-                checked_out_condition=item.equipment.condition  # Use current condition
-            )
-            
-            # Notify librarians about the rental request
-            create_rental_request_notification(rental)
-            
-            request_count += 1
+        # Everything below runs as a fixed number of queries, whatever the cart size
+        with transaction.atomic():
+            cart_items = list(cart.items.select_related('equipment'))
+            # Existing bookings of everything in the cart, loaded in one query
+            bookings = availability.BookingIndex([item.equipment_id for item in cart_items])
+
+            rentals = []
+            unavailable_items = []
+            for item in cart_items:
+                start_date = timezone.localdate(item.start_date)
+                end_date = max(timezone.localdate(item.end_date), start_date)
+
+                # Check if the equipment is still available for the requested dates
+                if not item.equipment.is_available or not bookings.is_free(item.equipment_id, start_date, end_date):
+                    messages.warning(
+                        request,
+                        f"{item.equipment.brand} {item.equipment.model} is no longer available. It has been removed from your cart."
+                    )
+                    unavailable_items.append(item.id)
+                    continue
+
+                # Create a rental request with PENDING status
+                rentals.append(Rental(
+                    equipment=item.equipment,
+                    patron=request.user,
+                    rental_duration=item.rental_duration,  # Use the cart item's rental duration
+                    rental_status='PENDING',
+                    rental_price=item.get_subtotal(),
+                    due_date=make_aware(datetime.combine(end_date, datetime.min.time())),  # Convert date to datetime
+                    start_date=start_date,
+                    end_date=end_date,
+                    checked_out_condition=item.equipment.condition  # Use current condition
+                ))
+
+            if unavailable_items:
+                CartItem.objects.filter(id__in=unavailable_items).delete()
+
+            if rentals:
+                Rental.objects.bulk_create(rentals)
+                # Notify librarians about the rental requests
+                create_rental_request_notifications(rentals)
+
+        request_count = len(rentals)
 
         # Clear the cart after creating all rental requests
         if request_count > 0:
@@ -1354,6 +1293,23 @@ def submit_rental_request(request):
     # If not a POST request, redirect to cart
     return redirect('cart')
 
+def _apply_rental_transition(request, transition, rental_id, **kwargs):
+    """
+    Run a ``rental_states`` transition on one rental and report the outcome
+    as a flash message. Returns True if the rental changed status.
+    """
+    try:
+        result, = transition([rental_id], **kwargs)
+    except rental_states.RentalConflict:
+        messages.error(request, "This rental was changed by someone else at the same time. Please try again.")
+        return False
+
+    if result['success']:
+        messages.success(request, result['message'])
+    else:
+        messages.error(request, result['message'])
+    return result['success']
+
 @login_required
 def approve_rental(request, rental_id):
     """
@@ -1371,36 +1327,7 @@ def approve_rental(request, rental_id):
 
     if request.method == 'POST':
         rental = get_object_or_404(Rental, id=rental_id)
-
-        # Only pending rentals can be approved
-        if rental.rental_status != 'PENDING':
-            messages.error(request, "This rental request cannot be approved because it is not pending.")
-            return redirect('librarian')
-
-        # Check if equipment is still available
-        if not rental.equipment.is_available:
-            messages.error(request, "This equipment is no longer available.")
-            rental.rental_status = 'CANCELLED'
-            rental.save()
-            return redirect('librarian')
-
-        # Set the rental status to ACTIVE
-        rental.rental_status = 'ACTIVE'
-        rental.save()
-
-        # Update equipment availability
-        equipment = rental.equipment
-        equipment.is_available = False
-        equipment.save()
-
-        # Create notification for the patron
-        create_rental_approved_notification(rental)
-
-        messages.success(request, f"Rental request for {rental.equipment.brand} {rental.equipment.model} has been approved.")
-
-        # TODO: Send notification to user (could be email, in-app notification, etc.)
-
-        return redirect('librarian')
+        _apply_rental_transition(request, rental_states.approve_rentals, rental.id)
 
     return redirect('librarian')
 
@@ -1421,24 +1348,7 @@ def reject_rental(request, rental_id):
 
     if request.method == 'POST':
         rental = get_object_or_404(Rental, id=rental_id)
-
-        # Only pending rentals can be rejected
-        if rental.rental_status != 'PENDING':
-            messages.error(request, "This rental request cannot be rejected because it is not pending.")
-            return redirect('librarian')
-
-        # Set the rental status to CANCELLED
-        rental.rental_status = 'CANCELLED'
-        rental.save()
-
-        # Create notification for the patron
-        create_rental_rejected_notification(rental)
-
-        messages.success(request, f"Rental request for {rental.equipment.brand} {rental.equipment.model} has been rejected.")
-
-        # TODO: Send notification to user (could be email, in-app notification, etc.)
-
-        return redirect('librarian')
+        _apply_rental_transition(request, rental_states.reject_rentals, rental.id)
 
     return redirect('librarian')
 
@@ -1460,43 +1370,108 @@ def complete_rental(request, rental_id):
     if request.method == 'POST':
         rental = get_object_or_404(Rental, id=rental_id)
 
-        # Only active rentals can be completed
-        if rental.rental_status != 'ACTIVE':
-            messages.error(request, "This rental cannot be completed because it is not active.")
-            return redirect('librarian')
+        # Condition and notes recorded at the return counter
+        _apply_rental_transition(
+            request, rental_states.complete_rentals, rental.id,
+            return_conditions={rental.id: request.POST.get('return_condition')},
+            return_notes={rental.id: request.POST.get('return_notes', '')},
+        )
 
-        # Set the rental status to COMPLETED
-        rental.rental_status = 'COMPLETED'
-        rental.return_date = now()
+    return redirect('librarian')
 
-        # Get return condition from form
-        return_condition = request.POST.get('return_condition', rental.checked_out_condition)
-        return_notes = request.POST.get('return_notes', '')
+def _run_rental_batch(request, action):
+    """
+    Apply a ``rental_states`` transition to the rental IDs posted as ``rental_ids``.
+    Answers AJAX requests with the per-rental results as JSON, and form posts
+    with a summary message and a redirect back to the rental list.
+    """
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-        rental.return_condition = return_condition
-        rental.return_notes = return_notes
-        rental.save()
+    # Check if user is a librarian
+    try:
+        is_librarian = request.user.userprofile.user_type == 'LIBRARIAN'
+    except UserProfile.DoesNotExist:
+        is_librarian = False
+    if not is_librarian:
+        if is_ajax:
+            return JsonResponse({
+                'success': False,
+                'message': "You don't have permission to manage rental requests."
+            }, status=403)
+        messages.error(request, "You don't have permission to manage rental requests.")
+        return redirect('home')
 
-        # Update equipment availability and condition
-        equipment = rental.equipment
-        equipment.is_available = True
+    if request.method != 'POST':
+        return redirect('equipment:manage_rentals')
 
-        # If condition has worsened, update equipment condition
-        if (list(Equipment.CONDITION_CHOICES).index((return_condition, dict(Equipment.CONDITION_CHOICES)[return_condition])) >
-            list(Equipment.CONDITION_CHOICES).index((equipment.condition, dict(Equipment.CONDITION_CHOICES)[equipment.condition]))):
-            equipment.condition = return_condition
+    try:
+        rental_ids = [int(rental_id) for rental_id in request.POST.getlist('rental_ids')]
+    except ValueError:
+        rental_ids = None
+    if not rental_ids:
+        if is_ajax:
+            return JsonResponse({
+                'success': False,
+                'message': 'Select at least one rental.'
+            }, status=400)
+        messages.error(request, 'Select at least one rental.')
+        return redirect('equipment:manage_rentals')
 
-        equipment.total_rentals += 1
-        equipment.save()
+    try:
+        results = action(rental_ids)
+    except rental_states.RentalConflict:
+        message = "Some of these rentals were changed by someone else at the same time. Please try again."
+        if is_ajax:
+            return JsonResponse({'success': False, 'message': message}, status=409)
+        messages.error(request, message)
+        return redirect('equipment:manage_rentals')
+
+    succeeded = sum(result['success'] for result in results)
+    summary = f"{succeeded} of {len(results)} rentals updated."
+
+    if is_ajax:
+        return JsonResponse({
+            'success': succeeded == len(results),
+            'message': summary,
+            'results': results,
+        })
 
-        # Create notification for the patron
-        create_rental_completed_notification(rental)
+    if succeeded:
+        messages.success(request, summary)
+    for result in results:
+        if not result['success']:
+            messages.error(request, f"Rental #{result['id']}: {result['message']}")
+    return redirect('equipment:manage_rentals')
 
-        messages.success(request, f"Rental for {rental.equipment.brand} {rental.equipment.model} has been marked as returned.")
+@login_required
+def bulk_approve_rentals(request):
+    """Approve several pending rental requests at once. Only librarians can approve rentals."""
+    return _run_rental_batch(request, rental_states.approve_rentals)
 
-        return redirect('librarian')
+@login_required
+def bulk_reject_rentals(request):
+    """Reject several pending rental requests at once. Only librarians can reject rentals."""
+    return _run_rental_batch(request, rental_states.reject_rentals)
 
-    return redirect('librarian')
+@login_required
+def bulk_complete_rentals(request):
+    """
+    Mark several rentals as returned at once. The condition and notes for
+    each rental may be posted as ``return_condition_<id>`` and
+    ``return_notes_<id>``. Only librarians can complete rentals.
+    """
+    def complete(rental_ids):
+        return rental_states.complete_rentals(
+            rental_ids,
+            return_conditions={
+                rental_id: request.POST.get(f'return_condition_{rental_id}') for rental_id in rental_ids
+            },
+            return_notes={
+                rental_id: request.POST.get(f'return_notes_{rental_id}', '') for rental_id in rental_ids
+            },
+        )
+
+    return _run_rental_batch(request, complete)
 
 @login_required
 def cancel_rental(request, rental_id):
@@ -1512,17 +1487,7 @@ def cancel_rental(request, rental_id):
         return redirect('patron')
 
     if request.method == 'POST':
-        # Set the rental status to CANCELLED
-        rental.rental_status = 'CANCELLED'
-        rental.save()
-
-        # Make sure equipment stays available
-        equipment = rental.equipment
-        equipment.is_available = True
-        equipment.save()
-
-        messages.success(request, f"Your rental request for {rental.equipment.brand} {rental.equipment.model} has been cancelled.")
-
+        _apply_rental_transition(request, rental_states.cancel_rentals, rental.id, patron=request.user)
         return redirect('patron')
 
     return render(request, 'equipment/confirm_cancel.html', {
@@ -1536,23 +1501,56 @@ class ManageRentalsView(LoginRequiredMixin, generic.ListView):
     model = Rental
     template_name = 'equipment/manage_rentals.html'
     context_object_name = 'rentals'
+    paginate_by = 50  # Rentals per page, further pages are fetched by cursor
+
+    def is_librarian(self):
+        try:
+            return self.request.user.userprofile.user_type == 'LIBRARIAN'
+        except UserProfile.DoesNotExist:
+            return False
+
+    def get_date_range(self):
+        """Return the ``(from, to)`` dates picked in the filter form (either may be None)."""
+        dates = []
+        for param in ('from', 'to'):
+            try:
+                dates.append(parse_date(self.request.GET.get(param, '')))
+            except ValueError:
+                dates.append(None)
+        return tuple(dates)
+
+    def get_rentals_in_range(self):
+        """Rentals whose booked period overlaps the selected date range."""
+        if not self.is_librarian():
+            return Rental.objects.none()
+
+        queryset = Rental.objects.all()
+        date_from, date_to = self.get_date_range()
+        if date_from and date_to:
+            queryset = availability.overlapping(queryset, date_from, date_to)
+        elif date_from:
+            queryset = queryset.filter(end_date__gte=date_from)
+        elif date_to:
+            queryset = queryset.filter(start_date__lte=date_to)
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.get_page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_queryset(self):
         """
         Only librarians can access this view.
         """
-        try:
-            if self.request.user.userprofile.user_type != 'LIBRARIAN':
-                # Return empty queryset for non-librarians
-                return Rental.objects.none()
-        except:
-            return Rental.objects.none()
-
         # Get rental status filter
         status = self.request.GET.get('status', 'all')
 
-        # Base queryset
-        queryset = Rental.objects.all().order_by('-checkout_date')
+        # Base queryset, with the columns shown for each row joined in
+        queryset = self.get_rentals_in_range().select_related('equipment', 'patron').order_by('-checkout_date', '-id')
 
         # Apply status filter
         if status != 'all':
@@ -1564,11 +1562,25 @@ class ManageRentalsView(LoginRequiredMixin, generic.ListView):
         context = super().get_context_data(**kwargs)
         context['today_date'] = datetime.now().date()
 
-        # Count rentals by status
-        context['pending_count'] = Rental.objects.filter(rental_status='PENDING').count()
-        context['active_count'] = Rental.objects.filter(rental_status='ACTIVE').count()
-        context['completed_count'] = Rental.objects.filter(rental_status='COMPLETED').count()
-        context['cancelled_count'] = Rental.objects.filter(rental_status='CANCELLED').count()
+        # Count rentals by status in one pass
+        counts = self.get_rentals_in_range().aggregate(**{
+            f'{status.lower()}_count': Count('id', filter=Q(rental_status=status))
+            for status in ('PENDING', 'ACTIVE', 'COMPLETED', 'CANCELLED')
+        })
+        context.update(counts)
+
+        # Filter values, and the query string of the next page
+        context['date_from'] = self.request.GET.get('from', '')
+        context['date_to'] = self.request.GET.get('to', '')
+        page = context['page_obj']
+        if page and page.has_next():
+            query = self.request.GET.copy()
+            query['cursor'] = page.next_cursor
+            context['next_page_query'] = query.urlencode()
+        if page and page.has_previous():
+            query = self.request.GET.copy()
+            query.pop('cursor', None)
+            context['first_page_query'] = query.urlencode()
 
         return context
 
@@ -1615,6 +1627,10 @@ def quick_rent(request, equipment_id):
     # Check if item already in cart
     existing_item = CartItem.objects.filter(cart=cart, equipment=equipment).first()
 
+    if not existing_item and not availability.is_free(equipment, today, end_date):
+        messages.error(request, f"Sorry, {equipment.brand} {equipment.model} is already booked for those dates.")
+        return redirect('equipment:detail', pk=equipment_id)
+
     if existing_item:
         messages.info(request, f"{equipment.brand} {equipment.model} is already in your cart.")
     else:
@@ -1730,53 +1746,27 @@ def patron_view(request):
 def search_equipment(request):
     """
     API endpoint to search for equipment. Returns JSON results.
+
+    With ``mode=autocomplete`` it returns lightweight id/label suggestions
+    from the in-memory typeahead index instead.
     """
     search_term = request.GET.get('q', '')
-    
+    autocomplete = request.GET.get('mode') == 'autocomplete'
+
     if len(search_term) < 2:
-        return JsonResponse({'equipment': []})
-    
-    equipment_list = Equipment.objects.filter(
-        Q(brand__icontains=search_term) |
-        Q(model__icontains=search_term) |
-        Q(equipment_type__icontains=search_term) |
-        Q(notes__icontains=search_term)
-    ).distinct()
-    
-    # Apply collection visibility rules - similar to what we do in IndexView
-    user = request.user
-    
-    if not user.is_authenticated or not hasattr(user, 'userprofile') or user.userprofile.user_type != 'LIBRARIAN':
-        # For anonymous users and patrons:
-        # Hide items that are in private collections (unless the user has access)
-        
-        # Get all items that are in private collections
-        items_in_private_collections = Equipment.objects.filter(
-            collections__sharing_type='PRIVATE'
-        ).distinct()
-        
-        if user.is_authenticated:
-            # For authenticated users, get items from private collections they have access to
-            accessible_private_items = Equipment.objects.filter(
-                collections__sharing_type='PRIVATE',
-                collections__authorized_users=user
-            ).distinct() | Equipment.objects.filter(
-                collections__sharing_type='PRIVATE',
-                collections__creator=user
-            ).distinct()
-            
-            # First, exclude all items in private collections
-            equipment_list = equipment_list.exclude(id__in=items_in_private_collections.values_list('id', flat=True))
-            # Then, add back items from accessible private collections
-            equipment_list = equipment_list.distinct()
-            accessible_private_items = accessible_private_items.distinct()
-            equipment_list = equipment_list | accessible_private_items
-        else:
-            # For anonymous users, exclude all items in private collections
-            equipment_list = equipment_list.exclude(id__in=items_in_private_collections.values_list('id', flat=True))
-    
+        return JsonResponse({'suggestions': []} if autocomplete else {'equipment': []})
+
+    if autocomplete:
+        return JsonResponse({'suggestions': typeahead.suggest(request.user, search_term)})
+
+    # Best matches first
+    equipment_list = search.search(Equipment.objects.all(), search_term)
+
+    # Apply collection visibility rules
+    equipment_list = visible_equipment(request.user, equipment_list)
+
     # Limit to 20 results
-    equipment_list = equipment_list.distinct()[:20]
+    equipment_list = equipment_list[:20]
     
     results = []
     for item in equipment_list:
@@ -1792,6 +1782,78 @@ def search_equipment(request):
     
     return JsonResponse({'equipment': results})
 
+# Most items one quote request may price
+MAX_QUOTE_ITEMS = 50
+
+def quote_prices(request):
+    """
+    API endpoint that prices a package of items in one go. Returns JSON.
+
+    Takes one or more ``equipment`` IDs, one or more ``duration`` values
+    (DAILY, WEEKLY or SEASONAL; all three if none are given) and the rental
+    length, either as ``days`` or as a ``start``/``end`` date pair. Returns
+    each item's price for every duration and the package total per duration.
+    """
+    try:
+        equipment_ids = list(dict.fromkeys(int(pk) for pk in request.GET.getlist('equipment')))
+    except ValueError:
+        equipment_ids = []
+    durations = request.GET.getlist('duration') or list(pricing.DURATIONS)
+
+    try:
+        if 'days' in request.GET:
+            days = int(request.GET['days'])
+        else:
+            start, end = parse_date(request.GET.get('start', '')), parse_date(request.GET.get('end', ''))
+            days = (end - start).days + 1
+    except (TypeError, ValueError):
+        days = 0
+
+    if not equipment_ids or len(equipment_ids) > MAX_QUOTE_ITEMS:
+        message = f'Give between 1 and {MAX_QUOTE_ITEMS} equipment IDs.'
+    elif any(duration not in pricing.DURATIONS for duration in durations):
+        message = 'Invalid rental duration.'
+    elif days < 1:
+        message = 'Give the rental length as days, or as start and end dates.'
+    else:
+        message = None
+    if message:
+        return JsonResponse({'success': False, 'message': message}, status=400)
+
+    # One (item, duration) pair per price, all priced in one pass
+    pairs = [(equipment_id, duration) for equipment_id in equipment_ids for duration in durations]
+    prices = pricing.quote(
+        [equipment_id for equipment_id, _ in pairs],
+        [duration for _, duration in pairs],
+        [days] * len(pairs),
+        queryset=visible_equipment(request.user, Equipment.objects.filter(is_deleted=False)),
+    )
+
+    quotes = {equipment_id: {} for equipment_id in equipment_ids}
+    for (equipment_id, duration), price in zip(pairs, prices):
+        if price is not None:
+            quotes[equipment_id][duration] = price
+
+    missing = [equipment_id for equipment_id, item_prices in quotes.items() if not item_prices]
+    if missing:
+        return JsonResponse({
+            'success': False,
+            'message': f"Equipment not found: {', '.join(map(str, missing))}."
+        }, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'days': days,
+        'quotes': [
+            {'equipment_id': equipment_id, 'prices': item_prices}
+            for equipment_id, item_prices in quotes.items()
+        ],
+        'totals': {
+            duration: sum((quotes[equipment_id][duration] for equipment_id in equipment_ids), Decimal('0'))
+            for duration in durations
+        },
+    })
+
 @login_required
 def request_collection_access(request, collection_id):
     """
@@ -2032,26 +2094,14 @@ def manage_collection_users(request, collection_id):
     }
     return render(request, 'equipment/manage_collection_users.html', context)
 
+# Notifications per page when viewing the full history
+NOTIFICATIONS_PAGE_SIZE = 50
+
 @login_required
 def get_notifications(request):
-    """Get all notifications for the current user"""
-    # Get all notifications for the user
-    all_notifications = Notification.objects.filter(user=request.user)
-    
-    # Count all notifications
-    total_count = all_notifications.count()
-    
-    # Count unread notifications separately
-    unread_count = all_notifications.filter(is_read=False).count()
-    
-    # Check if we should return all notifications
-    view_all = request.GET.get('all') == 'true'
-    
-    # Get the notifications based on the view_all parameter
-    if view_all:
-        notifications = all_notifications.order_by('-created_at')
-    else:
-        notifications = all_notifications.order_by('-created_at')[:10]
+    """Get all notifications for the current user, including broadcasts to their role"""
+    # Personal and broadcast notifications, each annotated with ``read`` for this user
+    all_notifications = Notification.objects.for_user(request.user)
     
     if request.method == 'POST':
         # Mark notifications as read
@@ -2059,36 +2109,102 @@ def get_notifications(request):
         if notification_id:
             # Mark specific notification as read
             try:
-                notification = Notification.objects.get(id=notification_id, user=request.user)
-                notification.is_read = True
-                notification.save()
+                notification = all_notifications.get(id=notification_id)
+                if notification.mark_as_read(request.user):
+                    notification_counts.marked_read(request.user, 1)
+                events.publish_read(request.user)
                 return JsonResponse({'success': True})
-            except Notification.DoesNotExist:
+            except (Notification.DoesNotExist, ValueError):
                 return JsonResponse({'success': False, 'message': 'Notification not found'})
         else:
             # Mark all notifications as read
-            all_notifications.filter(is_read=False).update(is_read=True)
+            notification_counts.marked_read(request.user, all_notifications.mark_read(request.user))
+            events.publish_read(request.user)
             return JsonResponse({'success': True})
     
+    # Just the badge counts, for pages that keep the list they already show
+    if request.GET.get('counts') == 'true':
+        return JsonResponse(notification_counts.get_counts(request.user))
+    
+    # Check if we should return all notifications
+    view_all = request.GET.get('all') == 'true'
+    
+    # Get the notifications based on the view_all parameter; the full history
+    # is paged by cursor
+    next_cursor = None
+    if view_all:
+        paginator = KeysetPaginator(all_notifications.order_by('-created_at'), NOTIFICATIONS_PAGE_SIZE)
+        try:
+            page = paginator.get_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+        notifications = page.object_list
+        next_cursor = page.next_cursor
+    else:
+        notifications = all_notifications.order_by('-created_at')[:10]
+    
+    # Badge counts, kept in the cache rather than counted on every request
+    counts = notification_counts.get_counts(request.user)
+    total_count = counts['total_count']
+    unread_count = counts['unread_count']
+    
     # Format notifications for the response
-    notifications_list = []
-    for notification in notifications:
-        notifications_list.append({
-            'id': notification.id,
-            'type': notification.notification_type,
-            'message': notification.message,
-            'url': notification.related_url,
-            'created_at': notification.created_at.strftime('%b %d, %Y %H:%M'),
-            'is_read': notification.is_read
-        })
+    notifications_list = [
+        events.serialize_notification(notification, notification.read)
+        for notification in notifications
+    ]
     
     return JsonResponse({
         'notifications': notifications_list,
         'unread_count': unread_count,
-        'total_count': total_count
+        'total_count': total_count,
+        'next_cursor': next_cursor
     })
 
 
+# Seconds between keep-alive comments on an idle notification stream (Heroku's
+# router closes connections that send nothing for 55 seconds)
+STREAM_KEEPALIVE = 20
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@login_required
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of the current user's notifications
+
+    Sends the unread count straight away, then a ``notification`` event for
+    each new notification and a ``read`` event whenever the user marks
+    notifications read in another tab. Streaming needs an ASGI server; under
+    WSGI this answers 204 so the browser stops reconnecting and keeps polling
+    ``get_notifications`` instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    channels = await sync_to_async(events.channels_for)(user)
+    unread_count = sync_to_async(notification_counts.unread_count)
+
+    async def stream():
+        async with events.get_backend().subscribe(channels) as queue:
+            # Subscribed before counting, so nothing can slip in between
+            yield "retry: 5000\n" + _sse('read', {'unread_count': await unread_count(user)})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event['type'], {**event, 'unread_count': await unread_count(user)})
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 
 
 
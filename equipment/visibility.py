@@ -0,0 +1,125 @@
+"""
+Visibility rules for equipment that lives in PRIVATE collections.
+
+Equipment in a PRIVATE collection is hidden from everyone except librarians,
+the collection's creator and the collection's authorized users. Rather than
+re-deriving that with several joins on every request, the set of hidden
+equipment IDs and each user's allowed IDs are computed once, cached, and
+invalidated by the collection signals in ``equipment.signals``.
+
+The cached sets are keyed by a generation number, kept as the version of the
+``visibility`` tag in the shared catalog cache (``equipment.caching``), so a
+sharing change made in one worker process is seen by all of them at once.
+"""
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import caching
+from .models import Equipment
+
+# How long computed ID sets live in the cache (seconds)
+VISIBILITY_CACHE_TIMEOUT = 60 * 15
+
+# Tag whose version is the cache generation
+VERSION_TAG = 'visibility'
+
+
+def cache_version():
+    """
+    Return the current cache generation, creating it if needed.
+
+    Other caches whose contents depend on visibility can include this in
+    their keys to be invalidated along with it.
+    """
+    return caching.tag_versions([VERSION_TAG])[0]
+
+
+def _key(suffix):
+    return f'visibility:{cache_version()}:{suffix}'
+
+
+def invalidate():
+    """Drop every cached visibility set by moving to a new cache generation."""
+    caching.invalidate_tags(VERSION_TAG)
+
+
+def can_see_private(user):
+    """Librarians can see every item regardless of collection privacy."""
+    return (
+        user.is_authenticated and
+        hasattr(user, 'userprofile') and
+        user.userprofile.user_type == 'LIBRARIAN'
+    )
+
+
+def hidden_equipment_ids():
+    """Return the IDs of all equipment that belongs to a PRIVATE collection."""
+    key = _key('hidden')
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            Equipment.collections.through.objects.filter(
+                collection__sharing_type='PRIVATE'
+            ).values_list('equipment_id', flat=True)
+        )
+        cache.set(key, ids, VISIBILITY_CACHE_TIMEOUT)
+    return ids
+
+
+def allowed_equipment_ids(user):
+    """
+    Return the IDs of private-collection equipment this user may still see,
+    i.e. items in private collections they created or were authorized for.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    key = _key(f'user:{user.pk}')
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            Equipment.collections.through.objects.filter(
+                Q(collection__authorized_users=user) | Q(collection__creator=user),
+                collection__sharing_type='PRIVATE',
+            ).values_list('equipment_id', flat=True)
+        )
+        cache.set(key, ids, VISIBILITY_CACHE_TIMEOUT)
+    return ids
+
+
+def excluded_equipment_ids(user):
+    """Return the IDs that must be filtered out of any listing shown to this user."""
+    if can_see_private(user):
+        return frozenset()
+    return hidden_equipment_ids() - allowed_equipment_ids(user)
+
+
+def visibility_class(user):
+    """
+    Name the set of equipment this user can see, for keying shared caches.
+
+    Librarians see everything and most users see only the public catalog, so
+    they share 'all' and 'public'; only users with access to some private
+    items get a class of their own.
+    """
+    if can_see_private(user):
+        return 'all'
+    if not allowed_equipment_ids(user):
+        return 'public'
+    return f'user:{user.pk}'
+
+
+def visible_equipment(user, queryset=None):
+    """
+    Restrict an equipment queryset to the items this user is allowed to see.
+
+    Works with a single ``id NOT IN (...)`` filter on the primary key, so it can
+    be chained onto any other filters without extra joins or ``distinct()``.
+    """
+    if queryset is None:
+        queryset = Equipment.objects.all()
+
+    excluded = excluded_equipment_ids(user)
+    if excluded:
+        queryset = queryset.exclude(id__in=excluded)
+    return queryset
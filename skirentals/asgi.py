@@ -3,6 +3,10 @@ ASGI config for skirentals project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The site is served through ASGI (uvicorn workers under gunicorn, see the
+Procfile) so that the notification stream, an async view that holds its
+connection open, doesn't tie up a worker per open browser tab.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -1,6 +1,11 @@
+import time
+
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
+from django.db import connection
+
+from . import profiling
 
 class AdminRedirectMiddleware:
     def __init__(self, get_response):
@@ -62,4 +67,32 @@ class AccountCleanupMiddleware:
             return redirect('home')
 
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+class ProfilingMiddleware:
+    """
+    Record the SQL queries, template render time and wall time of every
+    request, per URL name (see skirentals/profiling.py).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        profiling.instrument_templates()
+
+    def __call__(self, request):
+        profile = profiling.RequestProfile()
+        token = profiling.current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            profile.wall_time = time.perf_counter() - start
+            profiling.current_profile.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else profiling.UNRESOLVED
+        profiling.registry.record(view_name, profile)
+        profiling.request_profiled.send(sender=self.__class__, view_name=view_name, profile=profile)
+
+        response['Server-Timing'] = profile.server_timing()
+        return response
@@ -0,0 +1,206 @@
+"""
+Per-request cost accounting.
+
+``ProfilingMiddleware`` (in ``skirentals.middleware``) gives each request a
+``RequestProfile`` and fills it in while the request runs: the number of SQL
+queries and the time spent in them, the time spent rendering templates, and
+the total wall time. Each finished profile is
+
+* summarised in the response's ``Server-Timing`` header,
+* added to ``registry`` under the request's URL name (``equipment:index``,
+  ``librarian``, ...), which the librarian-only ``/metrics/`` view exposes in
+  the Prometheus text format, and
+* sent with the ``request_profiled`` signal, which ``query_budget`` uses to
+  fail tests when a view starts running more queries than it should.
+
+The registry lives in process memory, so each worker reports its own
+requests; Prometheus sums them across scrape targets.
+"""
+import threading
+import time
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.dispatch import Signal
+from django.template.base import Template
+
+# Sent with ``view_name`` and ``profile`` after every profiled request
+request_profiled = Signal()
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Name recorded for requests that never matched a URL pattern
+UNRESOLVED = 'unresolved'
+
+# Profile of the request being handled in this context, if any
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """What one request cost."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.wall_time = 0.0
+        # Nesting depth of template renders, so includes aren't counted twice
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper`` hook that times each query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self):
+        """Return the value of the ``Server-Timing`` header for this profile."""
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.wall_time * 1000:.1f}',
+        ])
+
+
+_original_template_render = None
+
+
+def instrument_templates():
+    """Wrap ``Template.render`` so that render time is added to the current profile."""
+    global _original_template_render
+    if _original_template_render is not None:
+        return
+    _original_template_render = original = Template.render
+
+    def render(self, context):
+        profile = current_profile.get()
+        if profile is None:
+            return original(self, context)
+
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - start
+
+    Template.render = render
+
+
+class ViewMetrics:
+    """Running totals for one view."""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.wall_time = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    def add(self, profile):
+        self.requests += 1
+        self.queries += profile.queries
+        self.sql_time += profile.sql_time
+        self.template_time += profile.template_time
+        self.wall_time += profile.wall_time
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if profile.wall_time <= bound:
+                self.buckets[index] += 1
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Per-view totals of every profiled request in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, profile):
+        with self._lock:
+            self._views.setdefault(view_name, ViewMetrics()).add(profile)
+
+    def get(self, view_name):
+        return self._views.get(view_name)
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            views = sorted(self._views.items())
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{_label(str(val))}"' for key, val in labels)
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+
+        metric('skirentals_requests_total', 'counter', 'Requests handled, by view.',
+               [('', [('view', view)], stats.requests) for view, stats in views])
+        metric('skirentals_db_queries_total', 'counter', 'SQL queries run, by view.',
+               [('', [('view', view)], stats.queries) for view, stats in views])
+        metric('skirentals_db_query_seconds_total', 'counter', 'Time spent in SQL queries, by view.',
+               [('', [('view', view)], f'{stats.sql_time:.6f}') for view, stats in views])
+        metric('skirentals_template_render_seconds_total', 'counter', 'Time spent rendering templates, by view.',
+               [('', [('view', view)], f'{stats.template_time:.6f}') for view, stats in views])
+
+        duration = []
+        for view, stats in views:
+            for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                duration.append(('_bucket', [('view', view), ('le', bound)], count))
+            duration.append(('_bucket', [('view', view), ('le', '+Inf')], stats.requests))
+            duration.append(('_sum', [('view', view)], f'{stats.wall_time:.6f}'))
+            duration.append(('_count', [('view', view)], stats.requests))
+        metric('skirentals_request_duration_seconds', 'histogram', 'Wall time per request, by view.', duration)
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class query_budget(ContextDecorator):
+    """
+    Fail if any request to the given views runs more SQL queries than allowed.
+
+    Use as a context manager or test decorator::
+
+        @query_budget({'equipment:index': 12})
+        def test_index(self):
+            self.client.get(reverse('equipment:index'))
+    """
+
+    def __init__(self, budgets):
+        self.budgets = budgets
+
+    def _check(self, sender, view_name, profile, **kwargs):
+        budget = self.budgets.get(view_name)
+        if budget is not None and profile.queries > budget:
+            self.violations.append(f'{view_name} ran {profile.queries} queries (budget {budget})')
+
+    def __enter__(self):
+        self.violations = []
+        request_profiled.connect(self._check)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        request_profiled.disconnect(self._check)
+        if exc_type is None and self.violations:
+            raise AssertionError('Query budget exceeded: ' + '; '.join(self.violations))
+        return False
@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 from dotenv import load_dotenv
 from pathlib import Path
@@ -93,6 +94,7 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 MIDDLEWARE = [
+    'skirentals.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -121,6 +123,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'equipment.context_processors.notification_events',
             ],
         },
     },
@@ -155,6 +158,58 @@ else:
     }
 
 
+# Caches
+# "catalog" holds cached queries and their tag versions (equipment/caching.py),
+# "fragments" rendered template fragments, "sessions" session data and
+# "default" the visibility and typeahead caches and the notification badge
+# counters. Their version keys and counters are invalidated by whichever
+# process changes the data, so every process has to see the same cache:
+# Redis with REDIS_URL set (e.g. the Heroku add-on), otherwise the database
+# on Heroku (tables made by `manage.py createcachetable`). Locally, with a
+# single process, CACHE_BACKEND can also be file (under CACHE_DIR) or locmem.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if REDIS_URL else 'db' if IS_HEROKU_APP else 'locmem')
+if IS_HEROKU_APP and CACHE_BACKEND not in ('redis', 'db'):
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND={CACHE_BACKEND!r} isn't shared between dynos and workers; use 'redis' or 'db'"
+    )
+CACHE_DIR = os.environ.get('CACHE_DIR', str(BASE_DIR / '.cache'))
+
+
+def cache_config(name, backend, timeout=300):
+    if backend == 'redis':
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': name,
+            'TIMEOUT': timeout,
+        }
+    if backend == 'db':
+        backend, location = 'django.core.cache.backends.db.DatabaseCache', f'cache_{name}'
+    elif backend == 'file':
+        backend, location = 'django.core.cache.backends.filebased.FileBasedCache', os.path.join(CACHE_DIR, name)
+    else:
+        backend, location = 'django.core.cache.backends.locmem.LocMemCache', name
+    return {'BACKEND': backend, 'LOCATION': location, 'TIMEOUT': timeout}
+
+
+CACHES = {
+    'default': cache_config('default', CACHE_BACKEND),
+    'catalog': cache_config('catalog', CACHE_BACKEND),
+    'fragments': cache_config('fragments', CACHE_BACKEND, timeout=60 * 60),
+    'sessions': cache_config('sessions', CACHE_BACKEND, timeout=60 * 60 * 24 * 14),
+}
+
+# Sessions are read from the cache and written through to the database when
+# the cache is in memory or Redis. In front of a database cache that would be
+# two queries instead of one, so they are read from the database directly.
+if CACHE_BACKEND in ('redis', 'locmem'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = 'sessions'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -227,6 +282,17 @@ ACCOUNT_USERNAME_REQUIRED = True
 SOCIALACCOUNT_AUTO_SIGNUP = False  # Require users to fill out the signup form
 SOCIALACCOUNT_LOGIN_ON_GET = True  # Skip the intermediate "Do you want to sign in with Google?" page
 
+# Notification push events (see equipment/events.py). The local backend only
+# reaches streams served by the same process, so with several web workers pages
+# only catch up when they poll; with Redis (REDIS_URL, e.g. the Heroku add-on)
+# events are shared between all workers and dynos.
+NOTIFICATION_EVENT_BACKEND = (
+    'equipment.events.RedisEventBackend' if REDIS_URL else 'equipment.events.LocalEventBackend'
+)
+
+# Read notifications older than this are archived by `manage.py archive_notifications`
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+
 # Email Configuration
 # For development, emails will be printed to the console
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -259,4 +325,11 @@ else:
     # Local storage settings
     MEDIA_URL = '/media/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-    STORAGES['default'] = {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
\ No newline at end of file
+    STORAGES['default'] = {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+
+# Uploads waiting for the image workers (see equipment/image_jobs.py) are staged
+# on local disk, so the upload request doesn't wait for S3
+STORAGES['image_jobs'] = {
+    'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    'OPTIONS': {'location': os.path.join(FILE_UPLOAD_TEMP_DIR, 'image_jobs')},
+}
@@ -24,7 +24,8 @@ from users.views import (
     home, logout_view, role_based_redirect, 
     librarian_view, patron_view, cart_view, 
     help_view, edit_profile_view, profile_view,
-    manage_users_view, promote_to_librarian, demote_to_patron
+    manage_users_view, promote_to_librarian, demote_to_patron,
+    metrics_view
 )
 
 # Import custom admin site
@@ -47,6 +48,7 @@ urlpatterns = [
     path('promote-to-librarian/<int:user_id>/', promote_to_librarian, name='promote_to_librarian'),
     path('demote-to-patron/<int:user_id>/', demote_to_patron, name='demote_to_patron'),
     path('equipment/', include('equipment.urls')),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
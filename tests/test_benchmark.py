@@ -0,0 +1,49 @@
+import json
+
+from django.test import TestCase
+
+from equipment import benchmark
+from equipment.models import Equipment, Rental, Review
+
+
+class BenchmarkTests(TestCase):
+    """Test suite for the synthetic data generator and benchmark runner."""
+
+    def test_generate_is_deterministic(self):
+        """The same seed produces the same catalog, and clear() removes it."""
+        counts = benchmark.generate(equipment=60, users=20, seed=7, batch_size=25)
+        self.assertEqual(counts['equipment'], 60)
+        self.assertEqual(Review.objects.count(), counts['reviews'])
+        first = list(Equipment.objects.order_by('equipment_id').values_list(
+            'equipment_id', 'brand', 'model', 'size_value', 'rating_count'
+        ))
+
+        benchmark.clear()
+        self.assertFalse(Equipment.objects.exists())
+
+        benchmark.generate(equipment=60, users=20, seed=7, batch_size=25)
+        second = list(Equipment.objects.order_by('equipment_id').values_list(
+            'equipment_id', 'brand', 'model', 'size_value', 'rating_count'
+        ))
+        self.assertEqual(first, second)
+
+    def test_run_report(self):
+        """Every scenario is timed and the data is left unchanged."""
+        benchmark.generate(equipment=40, users=10, seed=1)
+        rentals = Rental.objects.count()
+
+        report = benchmark.run(repeat=2, warmup=0)
+        json.dumps(report)
+
+        self.assertEqual(report['meta']['dataset']['equipment'], 40)
+        scenarios = report['scenarios']
+        self.assertEqual(len([name for name in scenarios if name.startswith('index[')]), 32 + 3)
+        for name in ('detail', 'search_equipment', 'checkout[3 items]', 'librarian_dashboard'):
+            self.assertIn(name, scenarios)
+        self.assertEqual(scenarios['index[all]']['status'], 200)
+        self.assertEqual(scenarios['checkout[3 items]']['status'], 302)
+        self.assertGreater(scenarios['librarian_dashboard']['queries'], 0)
+        self.assertEqual(Rental.objects.count(), rentals)
+
+        rows = benchmark.compare(report, report)
+        self.assertTrue(all(change == 0 for _, _, _, change, _ in rows))
@@ -0,0 +1,168 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from equipment import caching, rental_states
+from equipment.models import Equipment, EquipmentImage, Rental, Review
+from equipment.views import top_rated_equipment
+from users.models import UserProfile
+
+
+class CachingTests(TestCase):
+    """Test suite for the named caches and tag-invalidated cached queries."""
+
+    def setUp(self):
+        """Start from an empty catalog cache with one item and a patron."""
+        caches[caching.CACHE_ALIAS].clear()
+        self.patron = User.objects.create_user(username='patron', password='password123')
+        UserProfile.objects.create(user=self.patron, user_type='PATRON')
+        self.equipment = Equipment.objects.create(
+            equipment_id='CACHE1', equipment_type='SKI', brand='Atomic',
+            model='Bent 100', size='172', condition='GOOD', rental_price=40.00
+        )
+
+        self.calls = []
+
+        @caching.cached_query('test_count', ttl=60, tags=['equipment'])
+        def equipment_count(label):
+            self.calls.append(label)
+            return Equipment.objects.filter(is_deleted=False).count()
+
+        self.equipment_count = equipment_count
+
+    def test_named_caches_configured(self):
+        """The catalog, fragment and session caches are all defined."""
+        for alias in ('default', 'catalog', 'fragments', 'sessions'):
+            self.assertIn(alias, settings.CACHES)
+        self.assertEqual(settings.SESSION_CACHE_ALIAS, 'sessions')
+
+    def test_cached_until_tag_invalidated(self):
+        """A value is computed once per key until its tag is invalidated."""
+        self.assertEqual(self.equipment_count('a'), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.equipment_count('a'), 1)
+        self.assertEqual(self.equipment_count('b'), 1)
+        self.assertEqual(self.calls, ['a', 'b'])
+
+        caching.invalidate_tags('equipment')
+        self.equipment_count('a')
+        self.assertEqual(self.calls, ['a', 'b', 'a'])
+
+    def test_model_signals_invalidate(self):
+        """Saving or deleting a tagged model makes cached values stale."""
+        self.equipment_count('a')
+        Equipment.objects.create(
+            equipment_id='CACHE2', equipment_type='SKI', brand='Atomic',
+            model='Bent 110', size='180', condition='GOOD', rental_price=45.00
+        )
+        self.assertEqual(self.equipment_count('a'), 2)
+
+        self.equipment.delete()
+        self.assertEqual(self.equipment_count('a'), 1)
+
+    def test_untagged_changes_keep_cache(self):
+        """Changes to models under other tags don't touch the cached value."""
+        self.equipment_count('a')
+        Rental.objects.create(
+            equipment=self.equipment, patron=self.patron, rental_status='PENDING',
+            rental_duration='DAILY', rental_price=40.00, checked_out_condition='GOOD',
+            due_date=timezone.now() + timedelta(days=2),
+        )
+        self.equipment_count('a')
+        self.assertEqual(self.calls, ['a'])
+
+    def test_rating_update_refreshes_top_rated(self):
+        """A review changes the rating with update(), which still busts the top rated list."""
+        top_rated = top_rated_equipment('public', user=self.patron)
+        self.assertEqual(top_rated[0].average_rating, 0)
+
+        Review.objects.create(equipment=self.equipment, user=self.patron, rating=5, comment='Great')
+        top_rated = top_rated_equipment('public', user=self.patron)
+        self.assertEqual(top_rated[0].average_rating, 5)
+
+    def test_rental_transitions_invalidate(self):
+        """Approving a rental bumps the rental and equipment tags without signals."""
+        rental = Rental.objects.create(
+            equipment=self.equipment, patron=self.patron, rental_status='PENDING',
+            rental_duration='DAILY', rental_price=40.00, checked_out_condition='GOOD',
+            due_date=timezone.now() + timedelta(days=2),
+        )
+        before = caching.tag_versions(['rental', 'equipment'])
+        rental_states.approve_rentals([rental.id])
+        after = caching.tag_versions(['rental', 'equipment'])
+        self.assertGreater(after[0], before[0])
+        self.assertGreater(after[1], before[1])
+
+
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class FragmentCachingTests(TestCase):
+    """Test suite for the cached equipment cards and filter sidebar."""
+
+    def setUp(self):
+        """Start from empty caches with one item on the catalog page."""
+        # Keep uploaded files and their renditions out of the project's media directory
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        # Includes the visibility cache, which outlives earlier tests' collections
+        for cache in caches.all():
+            cache.clear()
+        self.equipment = Equipment.objects.create(
+            equipment_id='FRAG1', equipment_type='SKI', brand='Atomic',
+            model='Bent 100', size='172', condition='GOOD', rental_price=40.00
+        )
+        self.client = Client()
+
+    def catalog(self, **params):
+        return self.client.get(reverse('equipment:index'), params).content.decode()
+
+    def test_card_cached_until_saved(self):
+        """A card is reused until the item is saved or its rating changes."""
+        self.assertIn('Bent 100', self.catalog())
+
+        # update() doesn't move last_maintained, so the cached card is served
+        Equipment.objects.filter(pk=self.equipment.pk).update(model='Bent 110')
+        self.assertIn('Bent 100', self.catalog())
+
+        self.equipment.refresh_from_db()
+        self.equipment.save()
+        self.assertIn('Bent 110', self.catalog())
+
+        patron = User.objects.create_user(username='patron', password='password123')
+        Review.objects.create(equipment=self.equipment, user=patron, rating=4, comment='Good')
+        self.assertIn('<span class="ms-1">4.00</span>', self.catalog())
+
+    def test_gallery_image_refreshes_card(self):
+        """Adding the first gallery image of an item without a main image re-renders its card."""
+        self.assertIn('equipment-placeholder.jpg', self.catalog())
+        image = EquipmentImage.objects.create(
+            equipment=self.equipment,
+            image=SimpleUploadedFile('test_image.jpg', b'image', content_type='image/jpeg'),
+        )
+        self.assertIn(image.image.url, self.catalog())
+
+    def test_sidebar_shared_by_every_selection(self):
+        """The sidebar is rendered once for all selections, and again when the catalog changes."""
+        self.catalog()
+        with self.assertTemplateNotUsed('equipment/_filter_sidebar.html'):
+            content = self.catalog(type='SKI', condition='GOOD', min_price='17')
+        # The selection is applied by the page's script, outside the cached fragment
+        self.assertNotRegex(content, r'id="condition-good" value="GOOD"\s+checked')
+        self.assertIn('<script id="filter-state" type="application/json">', content)
+        self.assertIn('"type": "SKI"', content)
+        self.assertIn('"conditions": ["GOOD"]', content)
+
+        self.equipment.save()
+        with self.assertTemplateUsed('equipment/_filter_sidebar.html'):
+            self.catalog()
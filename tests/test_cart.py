@@ -1,12 +1,18 @@
-from django.test import TestCase, Client
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 import unittest
 
+from equipment import pricing
 from equipment.models import Equipment, Cart, CartItem, Rental
-from users.models import UserProfile
+from users.models import Notification, UserProfile
 
 
 class CartTests(TestCase):
@@ -198,6 +204,140 @@ class CartTests(TestCase):
         total = cart.get_total_price()
         self.assertEqual(total, daily_subtotal + weekly_subtotal)
 
+    def test_cart_totals_in_sql(self):
+        """The SQL subtotal of a cart matches the per-item Python prices."""
+        self.snowboard.weekly_rate = 200.00
+        self.snowboard.save()
+        helmet = Equipment.objects.create(
+            equipment_id='HELMET001', equipment_type='HELMET', brand='Smith', model='Vantage',
+            size='M', condition='NEW', rental_price=10.00
+        )
+        cart = Cart.objects.create(user=self.user)
+        start = timezone.localtime() + timedelta(days=1)
+        for equipment, duration, days in ((self.ski, 'DAILY', 3), (self.snowboard, 'WEEKLY', 9), (helmet, 'SEASONAL', 30)):
+            CartItem.objects.create(
+                cart=cart, equipment=equipment, rental_duration=duration,
+                start_date=start, end_date=start + timedelta(days=days - 1),
+            )
+
+        expected = Decimal('60.00') * 3 + Decimal('200.00') * 2 + Decimal('10.00') * 90
+        self.assertEqual(cart.get_total_price(), expected)
+        self.assertEqual(cart.get_total_with_tax(), round((expected + 25) * Decimal('1.085'), 2))
+
+        empty = Cart.objects.create(user=User.objects.create_user(username='empty', password='pass'))
+        reported = {c.id: c for c in pricing.with_totals(Cart.objects.all())}
+        self.assertEqual((reported[cart.id].item_count, reported[cart.id].subtotal), (3, expected))
+        self.assertEqual((reported[empty.id].item_count, reported[empty.id].subtotal), (0, 0))
+
+    def test_sql_subtotal_matches_rate_rules(self):
+        """subtotal_expression agrees with get_price_for_duration on either side of each billing boundary."""
+        self.snowboard.weekly_rate = 200.00
+        self.snowboard.seasonal_rate = 1500.00
+        self.snowboard.save()
+        cart = Cart.objects.create(user=self.user)
+        start = timezone.now()
+        for equipment in (self.ski, self.snowboard):
+            for duration in (*pricing.DURATIONS, 'UNKNOWN'):
+                for days in (1, 2, 6, 7, 8, 29, 30, 31, 89, 90, 91):
+                    item = CartItem.objects.create(
+                        cart=cart, equipment=equipment, rental_duration=duration,
+                        start_date=start, end_date=start + timedelta(days=days - 1),
+                    )
+                    expected = equipment.get_price_for_duration(duration) * pricing.billed_units(duration, days)
+                    computed = CartItem.objects.annotate(price=pricing.subtotal_expression()).get(id=item.id).price
+                    self.assertEqual((duration, days, computed), (duration, days, expected))
+                    self.assertEqual(item.get_subtotal(), expected)
+                    # One item per piece of equipment in a cart
+                    item.delete()
+
+    def test_rental_days_counted_in_local_dates(self):
+        """Cart prices and checkout count the same days for times near midnight."""
+        # 23:30 local is already the next day in UTC; 18:00 local isn't
+        start = timezone.make_aware(datetime(2026, 1, 10, 23, 30))
+        end = timezone.make_aware(datetime(2026, 1, 12, 18, 0))
+        self.assertNotEqual(start.astimezone(dt_timezone.utc).date(), start.date())
+        cart = Cart.objects.create(user=self.user)
+        item = CartItem.objects.create(
+            cart=cart, equipment=self.ski, rental_duration='DAILY', start_date=start, end_date=end,
+        )
+        self.assertEqual(item.get_rental_days(), 3)
+        computed = CartItem.objects.annotate(price=pricing.subtotal_expression()).get(id=item.id).price
+        self.assertEqual(computed, item.get_subtotal())
+        self.assertEqual(computed, self.ski.get_price_for_duration('DAILY') * 3)
+
+    def test_quote_matches_cart_prices(self):
+        """Batch quotes agree with CartItem.get_subtotal for every duration."""
+        self.snowboard.seasonal_rate = 1500.00
+        self.snowboard.save()
+        cart = Cart.objects.create(user=self.user)
+        start = timezone.localtime()
+        cases = []
+        for equipment in (self.ski, self.snowboard):
+            for duration in pricing.DURATIONS:
+                for days in (1, 7, 9):
+                    item = CartItem(
+                        cart=cart, equipment=equipment, rental_duration=duration,
+                        start_date=start, end_date=start + timedelta(days=days - 1),
+                    )
+                    cases.append((equipment.id, duration, days, item.get_subtotal()))
+
+        with self.assertNumQueries(1):
+            prices = pricing.quote(*zip(*[case[:3] for case in cases]))
+        self.assertEqual(prices, [case[3] for case in cases])
+        self.assertEqual(pricing.quote([9999], ['DAILY'], [3]), [None])
+
+    def test_quote_endpoint(self):
+        """The quote API prices a package for each duration, with totals."""
+        response = self.client.get(reverse('equipment:quote_prices'), {
+            'equipment': [self.ski.id, self.snowboard.id],
+            'start': '2025-01-01', 'end': '2025-01-09',
+        })
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['days'], 9)
+        self.assertEqual(data['quotes'][0], {
+            'equipment_id': self.ski.id,
+            'prices': {'DAILY': '540.00', 'WEEKLY': '600.00', 'SEASONAL': '5400.00'},
+        })
+        self.assertEqual(data['totals']['DAILY'], '945.00')
+
+        response = self.client.get(reverse('equipment:quote_prices'), {
+            'equipment': self.ski.id, 'duration': 'WEEKLY', 'days': 3,
+        })
+        self.assertEqual(response.json()['totals'], {'WEEKLY': '300.00'})
+
+        response = self.client.get(reverse('equipment:quote_prices'), {'equipment': self.ski.id, 'days': 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('equipment:quote_prices'), {'equipment': 9999, 'days': 2})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_cart_page_query_count(self):
+        """The cart page loads its items once, however many there are."""
+        cart = Cart.objects.create(user=self.user)
+
+        def page_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('cart'))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        CartItem.objects.create(
+            cart=cart, equipment=self.ski,
+            start_date=timezone.localtime() + timedelta(days=1),
+            end_date=timezone.localtime() + timedelta(days=3),
+        )
+        one_item = page_queries()
+        CartItem.objects.create(
+            cart=cart, equipment=self.snowboard, rental_duration='WEEKLY',
+            start_date=timezone.localtime() + timedelta(days=1),
+            end_date=timezone.localtime() + timedelta(days=8),
+        )
+        self.assertEqual(page_queries(), one_item)
+
     def test_submit_rental_request(self):
         """Test converting cart items to rental requests."""
         # Add items to cart
@@ -242,6 +382,32 @@ class CartTests(TestCase):
             rental.equipment.refresh_from_db()
             self.assertTrue(rental.equipment.is_available)
 
+    def test_submit_rental_request_query_count(self):
+        """Checkout runs the same number of queries however many items are in the cart."""
+        for i in range(3):
+            librarian = User.objects.create_user(username=f'librarian{i}', password='pass')
+            UserProfile.objects.create(user=librarian, user_type='LIBRARIAN')
+
+        def submit_cart(size):
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            for i in range(size):
+                equipment = Equipment.objects.create(
+                    equipment_id=f'CART{size}-{i}', equipment_type='SKI', brand='Atomic',
+                    model='Bent 100', size='172', condition='GOOD', rental_price=40.00
+                )
+                CartItem.objects.create(
+                    cart=cart, equipment=equipment,
+                    start_date=timezone.localtime() + timedelta(days=1),
+                    end_date=timezone.localtime() + timedelta(days=3),
+                )
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(reverse('equipment:submit_rental_request'))
+            return len(queries)
+
+        self.assertEqual(submit_cart(1), submit_cart(5))
+        self.assertEqual(Rental.objects.filter(patron=self.user).count(), 6)
+        self.assertEqual(Notification.objects.filter(notification_type='RENTAL_REQUEST').count(), 6)
+
     def test_add_unavailable_equipment(self):
         """Test handling attempt to add unavailable equipment."""
         # Mark equipment as unavailable
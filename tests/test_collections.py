@@ -1,13 +1,18 @@
 import json
 import unittest
+from unittest import mock
 
-from django.test import TestCase, Client
+from asgiref.local import Local
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
 from django.utils import timezone
 from datetime import timedelta
 from users.models import UserProfile
 from equipment.models import Equipment, Rental, Review, Collection, MaintenanceRecord
+from equipment.visibility import visible_equipment
 
 
 
@@ -887,3 +892,134 @@ class CollectionEditAjaxTests(TestCase):
         # Collection should remain unchanged
         self.public_collection.refresh_from_db()
         self.assertEqual(self.public_collection.sharing_type, 'PUBLIC')
+
+
+class EquipmentVisibilityTests(TestCase):
+    """Tests for hiding equipment that belongs to private collections."""
+
+    def setUp(self):
+        self.librarian_user = User.objects.create_user(username='librarian', password='password123')
+        self.patron_user = User.objects.create_user(username='patron', password='password123')
+        self.authorized_patron = User.objects.create_user(username='authorized', password='password123')
+
+        UserProfile.objects.create(user=self.librarian_user, user_type='LIBRARIAN')
+        UserProfile.objects.create(user=self.patron_user, user_type='PATRON')
+        UserProfile.objects.create(user=self.authorized_patron, user_type='PATRON')
+
+        self.public_item = Equipment.objects.create(
+            equipment_id="PUB001",
+            equipment_type="SKI",
+            brand="Atomic",
+            model="Bent 100",
+            size="172",
+            condition="GOOD",
+            rental_price=40.00
+        )
+        self.private_item = Equipment.objects.create(
+            equipment_id="PRIV001",
+            equipment_type="SKI",
+            brand="Atomic",
+            model="Redster",
+            size="165",
+            condition="NEW",
+            rental_price=60.00
+        )
+
+        self.private_collection = Collection.objects.create(
+            title="Race Stock",
+            description="Private race skis",
+            sharing_type='PRIVATE',
+            is_public=False,
+            creator=self.librarian_user
+        )
+        self.private_collection.items.add(self.private_item)
+        self.private_collection.authorized_users.add(self.authorized_patron)
+
+    def visible_ids(self, user):
+        return set(visible_equipment(user).values_list('id', flat=True))
+
+    def test_anonymous_user_cannot_see_private_items(self):
+        """Anonymous users only see items outside private collections."""
+        self.assertEqual(self.visible_ids(AnonymousUser()), {self.public_item.id})
+
+    def test_authorized_patron_and_librarian_see_private_items(self):
+        """Authorized users and librarians see private items, other patrons don't."""
+        everything = {self.public_item.id, self.private_item.id}
+        self.assertEqual(self.visible_ids(self.authorized_patron), everything)
+        self.assertEqual(self.visible_ids(self.librarian_user), everything)
+        self.assertEqual(self.visible_ids(self.patron_user), {self.public_item.id})
+
+    def test_visibility_updates_when_collection_changes(self):
+        """Cached visibility is invalidated by collection membership and sharing changes."""
+        self.assertNotIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+        # Granting access takes effect immediately
+        self.private_collection.authorized_users.add(self.patron_user)
+        self.assertIn(self.private_item.id, self.visible_ids(self.patron_user))
+        self.private_collection.authorized_users.remove(self.patron_user)
+        self.assertNotIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+        # Making the collection public reveals its items
+        self.private_collection.sharing_type = 'PUBLIC'
+        self.private_collection.save()
+        self.assertIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+        # Removing the item from a private collection also reveals it
+        self.private_collection.sharing_type = 'PRIVATE'
+        self.private_collection.save()
+        self.assertNotIn(self.private_item.id, self.visible_ids(self.patron_user))
+        self.private_collection.items.remove(self.private_item)
+        self.assertIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+    @override_settings(CACHES={
+        alias: {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': f'test_cache_{alias}',
+        }
+        for alias in ('default', 'catalog')
+    })
+    def test_visibility_change_reaches_other_workers(self):
+        """A sharing change made in one worker process hides the items in every other one."""
+        call_command('createcachetable', verbosity=0)
+        self.private_collection.items.remove(self.private_item)
+        self.assertIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+        # Another worker opens its own cache connections and makes the collection private again
+        with mock.patch.object(caches, '_connections', Local()):
+            self.private_collection.items.add(self.private_item)
+            self.assertNotIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+        # This worker's cached sets are stale as well
+        self.assertNotIn(self.private_item.id, self.visible_ids(self.patron_user))
+
+    def test_search_api_respects_visibility(self):
+        """The JSON search endpoint hides private items from unauthorized users."""
+        client = Client()
+        client.login(username='patron', password='password123')
+        response = client.get(reverse('equipment:search_equipment'), {'q': 'Atomic'})
+        ids = [item['id'] for item in json.loads(response.content)['equipment']]
+        self.assertEqual(ids, [self.public_item.id])
+
+        client.login(username='authorized', password='password123')
+        response = client.get(reverse('equipment:search_equipment'), {'q': 'Atomic'})
+        ids = {item['id'] for item in json.loads(response.content)['equipment']}
+        self.assertEqual(ids, {self.public_item.id, self.private_item.id})
+
+    def test_autocomplete_respects_visibility(self):
+        """Typeahead suggestions are cached per visibility class, not shared across them."""
+        client = Client()
+        params = {'q': 'atom', 'mode': 'autocomplete'}
+        response = client.get(reverse('equipment:search_equipment'), params)
+        ids = [item['id'] for item in json.loads(response.content)['suggestions']]
+        self.assertEqual(ids, [self.public_item.id])
+
+        client.login(username='librarian', password='password123')
+        response = client.get(reverse('equipment:search_equipment'), params)
+        suggestions = json.loads(response.content)['suggestions']
+        self.assertEqual(
+            suggestions,
+            [
+                {'id': self.public_item.id, 'label': 'Atomic Bent 100'},
+                {'id': self.private_item.id, 'label': 'Atomic Redster'},
+            ]
+        )
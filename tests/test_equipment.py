@@ -1,11 +1,15 @@
+import shutil
+import tempfile
 import unittest
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
 from django.utils import timezone
 from datetime import timedelta
-from django.test import TestCase, Client
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
+from equipment import search, typeahead
 from equipment.forms import EquipmentForm
 from equipment.models import Equipment, Review
 from users.models import UserProfile
@@ -44,6 +48,17 @@ class EquipmentModelTests(TestCase):
         self.assertTrue(isinstance(self.test_ski, Equipment))
         self.assertEqual(str(self.test_ski), 'Rossignol Experience 88 - SKI (170cm)')
 
+    def test_size_fields_normalized_on_save(self):
+        """Test that the numeric and categorical size fields are derived from size."""
+        self.assertEqual(self.test_ski.size_value, 170.0)
+        self.assertEqual(self.test_ski.size_category, '')
+
+        self.test_ski.equipment_type = 'JACKET'
+        self.test_ski.size = 'm'
+        self.test_ski.save()
+        self.assertIsNone(self.test_ski.size_value)
+        self.assertEqual(self.test_ski.size_category, 'M')
+
     def test_price_for_duration_with_default_rates(self):
         """Test price calculation with default multipliers when no custom rates are set."""
         self.assertEqual(self.test_ski.get_price_for_duration('DAILY'), 50.00)
@@ -228,6 +243,10 @@ class EquipmentAddTests(TestCase):
 
     def setUp(self):
         """Set up environment for equipment add tests."""
+        # Keep uploaded files and their renditions out of the project's media directory
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
         # Create test users
         self.librarian_user = User.objects.create_user(username='librarian', password='pass')
         self.patron_user = User.objects.create_user(username='patron', password='pass')
@@ -571,4 +590,175 @@ class EquipmentViewTests(TestCase):
         # Librarian should be able to access
         add_url = reverse('equipment:add_equipment')
         response = self.librarian_client.get(add_url)
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+
+# Render {% static %} without needing collectstatic's manifest
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class EquipmentPaginationTests(TestCase):
+    """Test suite for keyset pagination of the equipment catalog."""
+
+    def setUp(self):
+        """Create more equipment than fits on one page, with tied prices."""
+        for i in range(30):
+            Equipment.objects.create(
+                equipment_id=f'SKI{i:03d}',
+                equipment_type='SKI',
+                brand='Rossignol',
+                model=f'Experience {i}',
+                size='170',
+                condition='GOOD',
+                rental_price=40.00 if i % 2 else 50.00,
+                is_available=True
+            )
+
+    def fetch_all_pages(self, params):
+        """Follow the cursors of the AJAX grid endpoint and collect the ids in order."""
+        ids = []
+        cursor = None
+        while True:
+            query = dict(params, ajax='1')
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get(reverse('equipment:index'), query)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(equipment.id for equipment in response.context['equipment_list'])
+            cursor = response['X-Next-Cursor']
+            if not cursor:
+                return ids
+
+    def test_pages_cover_catalog_in_order(self):
+        """Walking every page returns each item once, in the requested order."""
+        ids = self.fetch_all_pages({'sort': 'price-low'})
+        expected = list(Equipment.objects.order_by('rental_price', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+        ids = self.fetch_all_pages({'sort': 'newest'})
+        expected = list(Equipment.objects.order_by('-date_added', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_first_page_reports_total_count(self):
+        """Only the first page includes the total result count."""
+        response = self.client.get(reverse('equipment:index'), {'ajax': '1'})
+        self.assertEqual(response['X-Total-Count'], '30')
+        self.assertEqual(len(response.context['equipment_list']), 24)
+
+        response = self.client.get(reverse('equipment:index'), {'ajax': '1', 'cursor': response['X-Next-Cursor']})
+        self.assertFalse(response.has_header('X-Total-Count'))
+        self.assertEqual(len(response.context['equipment_list']), 6)
+
+    def test_full_page_renders_first_page(self):
+        """The catalog page renders one page of cards and a link to the next."""
+        response = self.client.get(reverse('equipment:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['equipment_list']), 24)
+        self.assertContains(response, 'data-next-cursor="%s"' % response.context['page_obj'].next_cursor)
+
+    def test_invalid_cursor(self):
+        """A cursor that can't be decoded returns a 404."""
+        response = self.client.get(reverse('equipment:index'), {'ajax': '1', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_size_filters(self):
+        """Size ranges and standard sizes are matched against the normalized fields."""
+        Equipment.objects.create(
+            equipment_id='SKI190', equipment_type='SKI', brand='Atomic',
+            model='Bent 100', size='190', condition='GOOD', rental_price=60.00
+        )
+        Equipment.objects.create(
+            equipment_id='JACKET001', equipment_type='JACKET', brand='Patagonia',
+            model='Powder Bowl', size='L', condition='GOOD', rental_price=20.00
+        )
+
+        response = self.client.get(reverse('equipment:index'), {'ajax': '1', 'size': ['180-200', 'L']})
+        self.assertEqual(
+            sorted(equipment.equipment_id for equipment in response.context['equipment_list']),
+            ['JACKET001', 'SKI190']
+        )
+
+
+class EquipmentSearchTests(TestCase):
+    """Test suite for the full-text equipment search."""
+
+    def setUp(self):
+        """Create equipment with distinct brands, models and notes."""
+        self.rossignol = Equipment.objects.create(
+            equipment_id='SKI001', equipment_type='SKI', brand='Rossignol',
+            model='Experience 88', size='170', condition='GOOD', rental_price=50.00,
+            notes='Versatile all-mountain skis.'
+        )
+        self.burton = Equipment.objects.create(
+            equipment_id='BOARD001', equipment_type='SNOWBOARD', brand='Burton',
+            model='Custom', size='158', condition='GOOD', rental_price=45.00,
+            notes='Pairs well with Rossignol boots.'
+        )
+
+    def test_prefix_terms_match_across_fields(self):
+        """Every term must match the start of a word in one of the indexed fields."""
+        results = search.search(Equipment.objects.all(), 'ross exp')
+        self.assertEqual(list(results), [self.rossignol])
+
+        results = search.search(Equipment.objects.all(), 'custom')
+        self.assertEqual(list(results), [self.burton])
+
+    def test_results_ranked_by_relevance(self):
+        """Items that mention a term in short fields outrank a passing mention in notes."""
+        results = list(search.search(Equipment.objects.all(), 'rossignol'))
+        self.assertEqual(results, [self.rossignol, self.burton])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_index_follows_updates_and_deletes(self):
+        """Saving or deleting equipment keeps the index current."""
+        self.burton.model = 'Process'
+        self.burton.save()
+        self.assertFalse(search.search(Equipment.objects.all(), 'custom').exists())
+        self.assertTrue(search.search(Equipment.objects.all(), 'process').exists())
+
+        self.rossignol.delete()
+        self.assertFalse(search.search(Equipment.objects.all(), 'experience').exists())
+
+    def test_search_api(self):
+        """The JSON search endpoint returns the best matches first."""
+        response = self.client.get(reverse('equipment:search_equipment'), {'q': 'rossignol'})
+        self.assertEqual(
+            [item['id'] for item in response.json()['equipment']],
+            [self.rossignol.id, self.burton.id]
+        )
+
+
+class EquipmentTypeaheadTests(TestCase):
+    """Test suite for the in-memory typeahead index."""
+
+    def setUp(self):
+        """Create equipment to suggest."""
+        self.rossignol = Equipment.objects.create(
+            equipment_id='SKI001', equipment_type='SKI', brand='Rossignol',
+            model='Experience 88', size='170', condition='GOOD', rental_price=50.00
+        )
+        self.salomon = Equipment.objects.create(
+            equipment_id='SKI002', equipment_type='SKI', brand='Salomon',
+            model='QST 92', size='169', condition='GOOD', rental_price=50.00
+        )
+
+    def test_prefix_index_lookup(self):
+        """Each term must prefix a word of the brand or model."""
+        index = typeahead.PrefixIndex.build()
+        self.assertEqual(index.lookup(['ro']), [{'id': self.rossignol.id, 'label': 'Rossignol Experience 88'}])
+        self.assertEqual(index.lookup(['ros', 'q']), [])
+        self.assertEqual(index.lookup(['88'], exclude={self.rossignol.id}), [])
+
+    def test_index_refreshed_on_save_and_delete(self):
+        """Renaming or deleting equipment is reflected in the next suggestions."""
+        user = AnonymousUser()
+        self.assertEqual([s['id'] for s in typeahead.suggest(user, 'qst')], [self.salomon.id])
+
+        self.salomon.model = 'Stance 96'
+        self.salomon.save()
+        self.assertEqual(typeahead.suggest(user, 'qst'), [])
+        self.assertEqual([s['id'] for s in typeahead.suggest(user, 'stance')], [self.salomon.id])
+
+        self.salomon.delete()
+        self.assertEqual(typeahead.suggest(user, 'stance'), [])
@@ -1,13 +1,22 @@
 import io
+import os
+import shutil
+import tempfile
 import unittest
 
 from PIL import Image
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from equipment.models import Equipment, EquipmentImage
+from equipment import image_jobs, images
+from equipment.models import Equipment, EquipmentImage, ImageUploadJob
 from users.models import UserProfile
 
 
@@ -16,6 +25,19 @@ class EquipmentImageTests(TestCase):
 
     def setUp(self):
         """Initialize test environment."""
+        # Keep uploaded files and their renditions out of the project's media directory
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media_root,
+            STORAGES={
+                **settings.STORAGES,
+                'image_jobs': {
+                    'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                    'OPTIONS': {'location': os.path.join(media_root, 'image_jobs')},
+                },
+            },
+        ))
         # Create test users
         self.librarian = User.objects.create_user(username='librarian', password='password123')
         self.patron = User.objects.create_user(username='patron', password='password123')
@@ -97,10 +119,69 @@ class EquipmentImageTests(TestCase):
         # Check response
         self.assertEqual(response.status_code, 302)  # Should redirect to equipment detail
 
-        # Verify images were added
+        # Verify images were added once the queued uploads have run
+        self.assertEqual(image_jobs.process_queued(), 2)
         images = EquipmentImage.objects.filter(equipment=self.equipment)
         self.assertEqual(images.count(), 2)
 
+    def test_ajax_upload_queued(self):
+        """AJAX uploads return job IDs at once; the images are stored by a worker."""
+        response = self.librarian_client.post(
+            reverse('equipment:add_images', args=[self.equipment.id]),
+            {'images': [self.test_image, self._create_test_image()]},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['jobs']), 2)
+        self.assertFalse(EquipmentImage.objects.filter(equipment=self.equipment).exists())
+
+        jobs = list(ImageUploadJob.objects.filter(id__in=data['jobs']))
+        for job in jobs:
+            self.assertTrue(image_jobs.staging().exists(job.staged_path))
+
+        status_url = f"{data['status_url']}?jobs={','.join(map(str, data['jobs']))}"
+        status = self.librarian_client.get(status_url).json()
+        self.assertEqual([job['status'] for job in status['jobs']], ['QUEUED', 'QUEUED'])
+        self.assertFalse(status['finished'])
+
+        self.assertEqual(image_jobs.process_queued(), 2)
+        status = self.librarian_client.get(status_url).json()
+        self.assertTrue(status['finished'])
+        image_ids = [job['image'] for job in status['jobs']]
+        self.assertEqual(
+            sorted(image_ids),
+            sorted(EquipmentImage.objects.filter(equipment=self.equipment).values_list('id', flat=True)),
+        )
+        for job in jobs:
+            self.assertFalse(image_jobs.staging().exists(job.staged_path))
+
+        # Only librarians can follow uploads
+        self.assertEqual(self.patron_client.get(status_url).status_code, 403)
+
+    def test_failed_and_stalled_jobs(self):
+        """A job that can't run fails; one left running by a dead worker is queued again."""
+        missing = ImageUploadJob.objects.create(
+            equipment=self.equipment, staged_path='nonexistent.png', original_name='upload.png'
+        )
+        self.assertEqual(image_jobs.process_queued(), 1)
+        missing.refresh_from_db()
+        self.assertEqual(missing.status, 'FAILED')
+        self.assertIn('nonexistent.png', missing.error)
+
+        staged = ImageUploadJob.objects.create(
+            equipment=self.equipment, staged_path=image_jobs.stage(self.test_image), original_name='test_image.png',
+            status='RUNNING', attempts=1, started_at=timezone.now() - image_jobs.STALE_AFTER * 2,
+        )
+        self.assertEqual(image_jobs.requeue_stale(), 1)
+        self.assertEqual(image_jobs.claim(5), [staged])
+        # Claimed jobs aren't handed out twice
+        self.assertEqual(image_jobs.claim(5), [])
+        staged.refresh_from_db()
+        self.assertTrue(image_jobs.run(staged))
+        self.assertEqual(staged.attempts, 2)
+        self.assertEqual(staged.image.equipment, self.equipment)
+
     def test_delete_image(self):
         """Test deleting equipment images."""
         # First add an image
@@ -156,6 +237,113 @@ class EquipmentImageTests(TestCase):
         # Image should still exist
         self.assertEqual(EquipmentImage.objects.filter(equipment=self.equipment).count(), 1)
 
+    def test_with_card_image(self):
+        """Cards get the first gallery image from the listing query itself."""
+        second = EquipmentImage.objects.create(equipment=self.equipment, image=self._create_test_image())
+        first = EquipmentImage.objects.create(equipment=self.equipment, image=self._create_test_image())
+        EquipmentImage.objects.filter(pk=first.pk).update(order=0)
+        EquipmentImage.objects.filter(pk=second.pk).update(order=1)
+
+        equipment = Equipment.objects.with_card_image().get(pk=self.equipment.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(equipment.card_image_url, first.image.url)
+
+        # Without the annotation the image is looked up
+        self.assertEqual(Equipment.objects.get(pk=self.equipment.pk).card_image_url, first.image.url)
+
+        # A main image takes precedence
+        self.equipment.main_image = self._create_test_image()
+        self.equipment.save()
+        equipment = Equipment.objects.with_card_image().get(pk=self.equipment.pk)
+        self.assertEqual(equipment.card_image_url, self.equipment.main_image.url)
+
+    @override_settings(STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_catalog_card_images_one_query(self):
+        """The catalog's query count doesn't grow with the number of cards showing gallery images."""
+        def catalog_queries():
+            # Render every card, and compute the cached queries, each time
+            for cache in caches.all():
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.patron_client.get(reverse('equipment:index'))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        EquipmentImage.objects.create(equipment=self.equipment, image=self._create_test_image())
+        before = catalog_queries()
+        for i in range(5):
+            equipment = Equipment.objects.create(
+                equipment_id=f'SKI10{i}', equipment_type='SKI', brand='Rossignol',
+                model=f'Experience {90 + i}', size='170', condition='NEW', rental_price=50.00
+            )
+            EquipmentImage.objects.create(equipment=equipment, image=self._create_test_image())
+        self.assertEqual(catalog_queries(), before)
+
+    def _create_photo(self, width=1000, height=500):
+        """Create a JPEG test photo with a GPS position and a rotation in its EXIF data."""
+        file = io.BytesIO()
+        image = Image.new('RGB', (width, height), 'blue')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        exif[0x8825] = {2: (59.0, 20.0, 0.0)}  # GPS latitude
+        image.save(file, 'jpeg', exif=exif)
+        return SimpleUploadedFile('test_image_photo.jpg', file.getvalue(), content_type='image/jpeg')
+
+    def test_upload_stripped_and_resized(self):
+        """Uploads are stored without EXIF data and get WebP and JPEG copies at each smaller width."""
+        image = EquipmentImage.objects.create(equipment=self.equipment, image=self._create_photo())
+
+        with Image.open(image.image.path) as original:
+            self.assertFalse(original.getexif())
+            # Turned upright, as the EXIF orientation said
+            self.assertEqual(original.size, (500, 1000))
+
+        image.refresh_from_db()
+        record = image.renditions
+        self.assertEqual(record['source'], image.image.name)
+        self.assertEqual((record['width'], record['height']), (500, 1000))
+        self.assertEqual(
+            sorted((rendition['format'], rendition['width']) for rendition in record['renditions']),
+            [('JPEG', 320), ('JPEG', 500), ('WEBP', 320), ('WEBP', 500)],
+        )
+        for rendition in record['renditions']:
+            with image.image.storage.open(rendition['name']) as file, Image.open(file) as copy:
+                self.assertEqual(copy.format, rendition['format'])
+                self.assertEqual(copy.size, (rendition['width'], rendition['height']))
+                self.assertFalse(copy.getexif())
+
+    def test_unreadable_upload_recorded(self):
+        """A file Pillow can't read is stored as uploaded, with no copies."""
+        image = EquipmentImage.objects.create(
+            equipment=self.equipment,
+            image=SimpleUploadedFile('test_image.jpg', b'not an image', content_type='image/jpeg'),
+        )
+        image.refresh_from_db()
+        self.assertEqual(image.renditions, {'source': image.image.name, 'renditions': []})
+
+    @override_settings(STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_catalog_card_srcset(self):
+        """Catalog cards offer the resized copies in srcset."""
+        caches['fragments'].clear()
+        self.equipment.main_image = self._create_photo(width=2000, height=1000)
+        self.equipment.save()
+        self.equipment.refresh_from_db()
+
+        picture = images.Picture(
+            self.equipment.main_image.storage, self.equipment.main_image.name, self.equipment.main_image_renditions
+        )
+        self.assertEqual(picture.webp_srcset.count('w,'), 2)
+
+        response = self.patron_client.get(reverse('equipment:index'))
+        self.assertContains(response, f'<source type="image/webp" srcset="{picture.webp_srcset}"', html=False)
+        self.assertContains(response, f'srcset="{picture.jpeg_srcset}"')
+
     @unittest.skip("Skipping temporarily need to fix")
     def test_images_displayed_in_detail_view(self):
         """Test that images are displayed in equipment detail view."""
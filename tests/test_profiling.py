@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from equipment.models import Equipment, Rental, Review
+from skirentals import profiling
+from users.dashboard import load_librarian_dashboard
+from users.models import UserProfile
+
+
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class ProfilingTests(TestCase):
+    """Test suite for request profiling, metrics and query budgets."""
+
+    def setUp(self):
+        """Create a librarian, a patron and a small catalog with reviews and rentals."""
+        self.librarian = User.objects.create_user(username='librarian', password='password123')
+        UserProfile.objects.create(user=self.librarian, user_type='LIBRARIAN')
+        self.patron = User.objects.create_user(username='patron', password='password123')
+        UserProfile.objects.create(user=self.patron, user_type='PATRON')
+
+        self.equipment = []
+        for i in range(10):
+            equipment = Equipment.objects.create(
+                equipment_id=f'PROF{i}', equipment_type='SKI', brand='Atomic',
+                model=f'Bent {i}', size='172', condition='GOOD', rental_price=40.00
+            )
+            Review.objects.create(equipment=equipment, user=self.patron, rating=4, comment='Good')
+            Rental.objects.create(
+                equipment=equipment, patron=self.patron, rental_status='PENDING',
+                rental_duration='DAILY', rental_price=40.00, checked_out_condition='GOOD',
+                due_date=timezone.now() + timedelta(days=2),
+            )
+            self.equipment.append(equipment)
+
+        self.librarian_client = Client()
+        self.librarian_client.login(username='librarian', password='password123')
+        self.patron_client = Client()
+        self.patron_client.login(username='patron', password='password123')
+        profiling.registry.reset()
+
+    def test_server_timing_header(self):
+        """Every response says how long it spent in SQL, templates and overall."""
+        response = self.patron_client.get(reverse('equipment:index'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_recorded_by_url_name(self):
+        """Requests are totalled under their URL name and exposed to librarians."""
+        self.patron_client.get(reverse('equipment:index'))
+        self.patron_client.get(reverse('equipment:index'))
+
+        stats = profiling.registry.get('equipment:index')
+        self.assertEqual(stats.requests, 2)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.template_time, 0)
+
+        response = self.librarian_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE skirentals_request_duration_seconds histogram', body)
+        self.assertIn('skirentals_requests_total{view="equipment:index"} 2', body)
+        self.assertIn('skirentals_request_duration_seconds_count{view="equipment:index"} 2', body)
+
+    def test_metrics_librarian_only(self):
+        """Patrons can't read the metrics."""
+        response = self.patron_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_query_budget_fails_when_exceeded(self):
+        """A budget smaller than what the view needs fails the block."""
+        with self.assertRaisesMessage(AssertionError, 'equipment:index ran'):
+            with profiling.query_budget({'equipment:index': 1}):
+                self.patron_client.get(reverse('equipment:index'))
+
+    def test_librarian_dashboard_queries_flat(self):
+        """The dashboard's query count doesn't grow with the number of rentals."""
+        def dashboard_queries():
+            profiles = []
+            receiver = lambda sender, profile, **kwargs: profiles.append(profile)
+            profiling.request_profiled.connect(receiver)
+            try:
+                self.librarian_client.get(reverse('librarian'))
+            finally:
+                profiling.request_profiled.disconnect(receiver)
+            return profiles[-1].queries
+
+        before = dashboard_queries()
+        for i, equipment in enumerate(self.equipment):
+            for status in ('ACTIVE', 'COMPLETED'):
+                Rental.objects.create(
+                    equipment=equipment, patron=self.librarian if i % 2 else self.patron,
+                    rental_status=status, rental_duration='DAILY', rental_price=40.00,
+                    checked_out_condition='GOOD', due_date=timezone.now() - timedelta(days=i),
+                    start_date=timezone.localdate() - timedelta(days=30 + i),
+                )
+        self.assertEqual(dashboard_queries(), before)
+
+    def test_librarian_dashboard_counters(self):
+        """The dashboard counters come from one aggregate per table."""
+        Equipment.objects.filter(id=self.equipment[0].id).update(is_deleted=True)
+        Equipment.objects.filter(id=self.equipment[1].id).update(condition='MAINTENANCE')
+        with self.assertNumQueries(4):
+            context = load_librarian_dashboard(self.librarian)
+        self.assertEqual(
+            {key: context[key] for key in ('total_equipment', 'maintenance_count', 'total_users', 'active_rentals_count')},
+            {'total_equipment': 9, 'maintenance_count': 1, 'total_users': 1, 'active_rentals_count': 0},
+        )
+        self.assertEqual(len(context['pending_rentals']), 10)
+
+    # Current costs with ten items; lower these as views get cheaper
+    @profiling.query_budget({
+        'equipment:index': 10,
+        'equipment:detail': 9,
+        'librarian': 8,
+    })
+    def test_view_query_budgets(self):
+        """Catalog, detail and dashboard pages stay within their query budgets."""
+        self.patron_client.get(reverse('equipment:index'))
+        self.patron_client.get(reverse('equipment:detail', args=[self.equipment[0].pk]))
+        self.librarian_client.get(reverse('librarian'))
@@ -1,13 +1,19 @@
 import unittest
+from io import StringIO
 
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
+import random
 
+from equipment import availability, rental_states
 from equipment.models import Equipment, Rental, Cart
-from users.models import UserProfile
+from users.models import Notification, UserProfile
 
 
 class RentalTests(TestCase):
@@ -250,6 +256,50 @@ class RentalTests(TestCase):
         response = self.patron_client.get(reverse('equipment:manage_rentals'))
         self.assertEqual(len(response.context['rentals']), 0)
 
+    def test_manage_rentals_pages_and_date_filter(self):
+        """The rental list is paged by cursor, and counts follow the date filter."""
+        today = timezone.localdate()
+        for i in range(55):
+            Rental.objects.create(
+                equipment=self.snowboard,
+                patron=self.patron,
+                rental_duration='DAILY',
+                rental_price=45.00,
+                due_date=timezone.localtime() - timedelta(days=100 + i),
+                checked_out_condition='EXCELLENT',
+                rental_status='COMPLETED',
+                start_date=today - timedelta(days=100 + i),
+                end_date=today - timedelta(days=100 + i),
+            )
+
+        url = reverse('equipment:manage_rentals')
+        with self.assertNumQueries(4):
+            response = self.librarian_client.get(url)
+        self.assertEqual(response.context['pending_count'], 1)
+        self.assertEqual(response.context['completed_count'], 55)
+        self.assertEqual(len(response.context['rentals']), 50)
+
+        # The next page carries on from the cursor, keeping the filters
+        response = self.librarian_client.get(url, {'status': 'completed'})
+        first_page = list(response.context['rentals'])
+        self.assertIn('status=completed', response.context['next_page_query'])
+        response = self.librarian_client.get(f"{url}?{response.context['next_page_query']}")
+        second_page = list(response.context['rentals'])
+        self.assertEqual(len(second_page), 5)
+        self.assertFalse(set(first_page) & set(second_page))
+
+        # Only rentals booked within the range are listed and counted
+        response = self.librarian_client.get(url, {
+            'from': (today - timedelta(days=104)).isoformat(),
+            'to': (today - timedelta(days=100)).isoformat(),
+        })
+        self.assertEqual(response.context['completed_count'], 5)
+        self.assertEqual(response.context['pending_count'], 0)
+        self.assertEqual(len(response.context['rentals']), 5)
+
+        response = self.librarian_client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
     # TODO: Add tests for rental history tracking
     # def test_user_rental_history(self):
     #     """Test user's rental history and preferences tracking"""
@@ -535,4 +585,302 @@ class RentalWorkflowTests(TestCase):
             }
         )
 
-        self.assertFalse(Cart.objects.filter(user=other_patron).exists())
\ No newline at end of file
+        self.assertFalse(Cart.objects.filter(user=other_patron).exists())
+
+
+class AvailabilityTests(TestCase):
+    """Tests for the date-interval availability checks."""
+
+    def setUp(self):
+        self.patron = User.objects.create_user(username='patron', password='password123')
+        UserProfile.objects.create(user=self.patron, user_type='PATRON')
+        self.client.login(username='patron', password='password123')
+
+        self.ski = Equipment.objects.create(
+            equipment_id='SKI001', equipment_type='SKI', brand='Rossignol', model='Soul 7',
+            size='180', condition='NEW', rental_price=60.00
+        )
+        self.other_ski = Equipment.objects.create(
+            equipment_id='SKI002', equipment_type='SKI', brand='Salomon', model='QST 92',
+            size='170', condition='NEW', rental_price=55.00
+        )
+
+        self.start = timezone.localdate() + timedelta(days=10)
+        self.book(self.start, self.start + timedelta(days=2))
+
+    def book(self, start, end, status='ACTIVE', equipment=None):
+        return Rental.objects.create(
+            equipment=equipment or self.ski,
+            patron=self.patron,
+            rental_duration='DAILY',
+            rental_status=status,
+            rental_price=60.00,
+            due_date=timezone.localtime() + timedelta(days=30),
+            start_date=start,
+            end_date=end,
+            checked_out_condition='NEW'
+        )
+
+    def test_is_free(self):
+        """Bookings block their own days only, inclusive at both ends."""
+        day = timedelta(days=1)
+        self.assertFalse(availability.is_free(self.ski, self.start + 2 * day, self.start + 5 * day))
+        self.assertFalse(availability.is_free(self.ski, self.start - 3 * day, self.start))
+        self.assertTrue(availability.is_free(self.ski, self.start + 3 * day, self.start + 5 * day))
+        self.assertTrue(availability.is_free(self.other_ski, self.start, self.start))
+
+        # Completed and cancelled rentals don't hold the equipment
+        self.book(self.start + 4 * day, self.start + 6 * day, status='COMPLETED')
+        self.assertTrue(availability.is_free(self.ski, self.start + 4 * day, self.start + 6 * day))
+
+    def test_free_equipment_by_type(self):
+        """Only unbooked items of the requested type are returned."""
+        free = availability.free_equipment(self.start, self.start, equipment_type='SKI')
+        self.assertEqual(list(free), [self.other_ski])
+        free = availability.free_equipment(self.start, self.start, equipment_type='SNOWBOARD')
+        self.assertEqual(list(free), [])
+
+    def test_booked_ranges_are_merged(self):
+        """Overlapping and back-to-back bookings come back as one range."""
+        self.book(self.start + timedelta(days=3), self.start + timedelta(days=4), status='PENDING')
+        self.book(self.start + timedelta(days=8), self.start + timedelta(days=9), status='PENDING')
+        self.assertEqual(
+            availability.booked_ranges(self.ski),
+            [
+                (self.start, self.start + timedelta(days=4)),
+                (self.start + timedelta(days=8), self.start + timedelta(days=9)),
+            ]
+        )
+
+    def test_interval_tree_matches_brute_force(self):
+        """The interval tree finds exactly the intervals a linear scan does."""
+        rng = random.Random(7)
+        base = date(2025, 1, 1)
+        intervals = []
+        for rental_id in range(200):
+            start = base + timedelta(days=rng.randrange(365))
+            intervals.append((start, start + timedelta(days=rng.randrange(14)), rental_id))
+        tree = availability.IntervalTree(intervals)
+
+        for _ in range(100):
+            start = base + timedelta(days=rng.randrange(380))
+            end = start + timedelta(days=rng.randrange(10))
+            expected = {i for i in intervals if i[0] <= end and i[1] >= start}
+            self.assertEqual(set(tree.overlapping(start, end)), expected)
+
+    def test_add_to_cart_rejects_booked_dates(self):
+        """A patron can't add an item to their cart for days it is already booked."""
+        response = self.client.post(
+            reverse('equipment:add_to_cart', args=[self.ski.id]),
+            {
+                'start_date': (self.start + timedelta(days=1)).isoformat(),
+                'end_date': (self.start + timedelta(days=4)).isoformat(),
+                'rental_duration': 'DAILY'
+            }
+        )
+        self.assertRedirects(response, reverse('equipment:detail', args=[self.ski.id]), fetch_redirect_response=False)
+        self.assertFalse(Cart.objects.filter(user=self.patron, items__isnull=False).exists())
+
+        response = self.client.post(
+            reverse('equipment:add_to_cart', args=[self.ski.id]),
+            {
+                'start_date': (self.start + timedelta(days=3)).isoformat(),
+                'end_date': (self.start + timedelta(days=4)).isoformat(),
+                'rental_duration': 'DAILY'
+            }
+        )
+        self.assertEqual(Cart.objects.get(user=self.patron).items.count(), 1)
+
+
+class BulkRentalTests(TestCase):
+    """Tests for the rental state machine and the bulk approve, reject and return endpoints."""
+
+    def setUp(self):
+        self.patron = User.objects.create_user(username='patron', password='password123')
+        self.librarian = User.objects.create_user(username='librarian', password='password123')
+        UserProfile.objects.create(user=self.patron, user_type='PATRON')
+        UserProfile.objects.create(user=self.librarian, user_type='LIBRARIAN')
+
+        self.skis = [
+            Equipment.objects.create(
+                equipment_id=f'SKI{i}', equipment_type='SKI', brand='Atomic', model=f'Bent {i}',
+                size='172', condition='EXCELLENT', rental_price=40.00
+            )
+            for i in range(3)
+        ]
+        self.start = timezone.localdate() + timedelta(days=5)
+
+        self.client.login(username='librarian', password='password123')
+
+    def request(self, equipment, status='PENDING', days=(0, 2)):
+        return Rental.objects.create(
+            equipment=equipment,
+            patron=self.patron,
+            rental_duration='DAILY',
+            rental_status=status,
+            rental_price=40.00,
+            due_date=timezone.localtime() + timedelta(days=30),
+            start_date=self.start + timedelta(days=days[0]),
+            end_date=self.start + timedelta(days=days[1]),
+            checked_out_condition='EXCELLENT'
+        )
+
+    def post(self, name, data):
+        return self.client.post(reverse(f'equipment:{name}'), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_bulk_approve(self):
+        """Requests are approved together, and judged against each other."""
+        first = self.request(self.skis[0])
+        second = self.request(self.skis[1])
+        competing = self.request(self.skis[1], days=(1, 3))
+        active = self.request(self.skis[2], status='ACTIVE')
+
+        with self.assertNumQueries(10):
+            response = self.post('bulk_approve_rentals', {
+                'rental_ids': [first.id, second.id, competing.id, active.id, 9999]
+            })
+
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], '2 of 5 rentals updated.')
+        self.assertEqual(
+            [(result['id'], result['success']) for result in data['results']],
+            [(first.id, True), (second.id, True), (competing.id, False), (active.id, False), (9999, False)]
+        )
+
+        statuses = dict(Rental.objects.values_list('id', 'rental_status'))
+        self.assertEqual(statuses[first.id], 'ACTIVE')
+        self.assertEqual(statuses[second.id], 'ACTIVE')
+        # It overlaps the request approved before it in the batch
+        self.assertEqual(statuses[competing.id], 'CANCELLED')
+        self.assertIn('already rented out', data['results'][2]['message'])
+        # The approved rentals start in a few days, so the skis can still go out today
+        self.assertTrue(Equipment.objects.get(id=self.skis[0].id).is_available)
+        self.assertEqual(
+            Notification.objects.filter(user=self.patron, notification_type='RENTAL_APPROVED').count(), 2
+        )
+
+    def test_bulk_reject_and_complete(self):
+        """Rejected requests are cancelled; returned rentals free and downgrade their equipment."""
+        pending = self.request(self.skis[0])
+        active = [self.request(ski, status='ACTIVE') for ski in self.skis[1:]]
+        Equipment.objects.filter(id__in=[ski.id for ski in self.skis[1:]]).update(is_available=False)
+
+        response = self.post('bulk_reject_rentals', {'rental_ids': [pending.id, active[0].id]})
+        self.assertEqual([result['success'] for result in response.json()['results']], [True, False])
+        pending.refresh_from_db()
+        self.assertEqual(pending.rental_status, 'CANCELLED')
+
+        response = self.post('bulk_complete_rentals', {
+            'rental_ids': [active[0].id, active[1].id],
+            f'return_condition_{active[0].id}': 'FAIR',
+            f'return_notes_{active[0].id}': 'Edge damage',
+        })
+        self.assertTrue(response.json()['success'])
+
+        active[0].refresh_from_db()
+        self.assertEqual(active[0].rental_status, 'COMPLETED')
+        self.assertEqual(active[0].return_condition, 'FAIR')
+        self.assertEqual(active[0].return_notes, 'Edge damage')
+        worn, kept = Equipment.objects.get(id=self.skis[1].id), Equipment.objects.get(id=self.skis[2].id)
+        self.assertEqual((worn.condition, worn.is_available, worn.total_rentals), ('FAIR', True, 1))
+        self.assertEqual((kept.condition, kept.is_available, kept.total_rentals), ('EXCELLENT', True, 1))
+
+    def test_bulk_actions_librarian_only(self):
+        """Patrons can't use the bulk endpoints, and an empty selection is refused."""
+        rental = self.request(self.skis[0])
+        response = self.post('bulk_approve_rentals', {'rental_ids': []})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.login(username='patron', password='password123')
+        response = self.post('bulk_approve_rentals', {'rental_ids': [rental.id]})
+        self.assertEqual(response.status_code, 403)
+        rental.refresh_from_db()
+        self.assertEqual(rental.rental_status, 'PENDING')
+
+    def test_approval_cancels_overlapping_requests(self):
+        """Approving a request cancels other pending requests for the same item and dates."""
+        other_patron = User.objects.create_user(username='other', password='password123')
+        approved = self.request(self.skis[0])
+        overlapping = self.request(self.skis[0], days=(2, 4))
+        overlapping.patron = other_patron
+        overlapping.save()
+        later = self.request(self.skis[0], days=(10, 12))
+        other_item = self.request(self.skis[1])
+
+        results = rental_states.approve_rentals([approved.id])
+        self.assertTrue(results[0]['success'])
+
+        statuses = dict(Rental.objects.values_list('id', 'rental_status'))
+        self.assertEqual(statuses[approved.id], 'ACTIVE')
+        self.assertEqual(statuses[overlapping.id], 'CANCELLED')
+        self.assertEqual(statuses[later.id], 'PENDING')
+        self.assertEqual(statuses[other_item.id], 'PENDING')
+        self.assertTrue(Notification.objects.filter(user=other_patron, notification_type='RENTAL_DENIED').exists())
+
+    def test_approve_separate_periods(self):
+        """Requests for the same item on different dates can all be approved."""
+        first = self.request(self.skis[0], days=(0, 2))
+        later = self.request(self.skis[0], days=(10, 12))
+        results = rental_states.approve_rentals([first.id])
+        self.assertTrue(results[0]['success'])
+        results = rental_states.approve_rentals([later.id])
+        self.assertTrue(results[0]['success'])
+
+        statuses = dict(Rental.objects.values_list('id', 'rental_status'))
+        self.assertEqual((statuses[first.id], statuses[later.id]), ('ACTIVE', 'ACTIVE'))
+
+        # A rental that has started takes the item out
+        today = self.request(self.skis[1], days=(-5, 1))
+        self.assertTrue(rental_states.approve_rentals([today.id])[0]['success'])
+        self.assertFalse(Equipment.objects.get(id=self.skis[1].id).is_available)
+
+    def test_items_out_of_service_and_started_rentals(self):
+        """Pulled items can't be approved; items go out when a rental starts and stay out while one runs."""
+        Equipment.objects.filter(id=self.skis[0].id).update(is_available=False)
+        pulled = self.request(self.skis[0])
+        result = rental_states.approve_rentals([pulled.id])[0]
+        self.assertFalse(result['success'])
+        self.assertIn('no longer available', result['message'])
+        pulled.refresh_from_db()
+        self.assertEqual(pulled.rental_status, 'CANCELLED')
+
+        # An approved rental that has started since takes its item out
+        started = self.request(self.skis[1], status='ACTIVE', days=(-5, 1))
+        earlier = self.request(self.skis[1], status='ACTIVE', days=(-10, -6))
+        call_command('start_rentals', stdout=StringIO())
+        self.assertFalse(Equipment.objects.get(id=self.skis[1].id).is_available)
+
+        # Returning the earlier rental leaves the item with the one that has started
+        self.assertTrue(rental_states.complete_rentals([earlier.id])[0]['success'])
+        self.assertFalse(Equipment.objects.get(id=self.skis[1].id).is_available)
+        self.assertTrue(rental_states.complete_rentals([started.id])[0]['success'])
+        self.assertTrue(Equipment.objects.get(id=self.skis[1].id).is_available)
+
+    def test_stale_transition_rolls_back(self):
+        """A rental whose status changed after it was read fails the whole batch."""
+        first, second = self.request(self.skis[0]), self.request(self.skis[1])
+        stale = Rental.objects.get(id=second.id)
+        Rental.objects.filter(id=second.id).update(rental_status='CANCELLED')
+
+        with self.assertRaises(rental_states.RentalConflict):
+            with transaction.atomic():
+                rental_states._transition(
+                    [Rental.objects.get(id=first.id), stale], 'PENDING', rental_status='ACTIVE'
+                )
+        first.refresh_from_db()
+        self.assertEqual(first.rental_status, 'PENDING')
+
+    def test_single_views_use_state_machine(self):
+        """Approving twice only approves once; the second attempt is reported."""
+        rental = self.request(self.skis[0])
+        url = reverse('equipment:approve_rental', args=[rental.id])
+        self.client.post(url)
+        response = self.client.post(url)
+        self.assertIn(
+            'This rental request cannot be approved because it is not pending.',
+            [str(message) for message in get_messages(response.wsgi_request)]
+        )
+        self.assertEqual(
+            Notification.objects.filter(user=self.patron, notification_type='RENTAL_APPROVED').count(), 1
+        )
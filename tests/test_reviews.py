@@ -1,5 +1,8 @@
 import unittest
+from decimal import Decimal
+from io import StringIO
 
+from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
@@ -178,4 +181,73 @@ class ReviewTests(TestCase):
         )
 
         # No review should be created
-        self.assertEqual(Review.objects.count(), 0)
\ No newline at end of file
+        self.assertEqual(Review.objects.count(), 0)
+
+    def test_rating_counts_follow_review_writes(self):
+        """Adding, editing and deleting reviews keeps the per-star counts in sync."""
+        self.patron_client.post(
+            reverse('equipment:add_review', args=[self.equipment.id]),
+            {'rating': 4, 'comment': 'Great skis!'}
+        )
+        self.other_patron_client.post(
+            reverse('equipment:add_review', args=[self.equipment.id]),
+            {'rating': 2, 'comment': 'Too stiff.'}
+        )
+        self.equipment.refresh_from_db()
+        self.assertEqual(self.equipment.rating_count, 2)
+        self.assertEqual(self.equipment.rating_4_count, 1)
+        self.assertEqual(self.equipment.rating_2_count, 1)
+        self.assertEqual(self.equipment.average_rating, 3.0)
+
+        # Editing moves the review from one star count to another
+        self.patron_client.post(
+            reverse('equipment:add_review', args=[self.equipment.id]),
+            {'rating': 5, 'comment': 'Even better the second time.'}
+        )
+        self.equipment.refresh_from_db()
+        self.assertEqual(self.equipment.rating_count, 2)
+        self.assertEqual(self.equipment.rating_4_count, 0)
+        self.assertEqual(self.equipment.rating_5_count, 1)
+        self.assertEqual(self.equipment.average_rating, 3.5)
+
+        Review.objects.get(user=self.other_patron).delete()
+        self.equipment.refresh_from_db()
+        self.assertEqual(self.equipment.rating_count, 1)
+        self.assertEqual(self.equipment.rating_2_count, 0)
+        self.assertEqual(self.equipment.average_rating, 5.0)
+
+        distribution = self.equipment.get_rating_distribution()
+        self.assertEqual(distribution['5'], 1)
+        self.assertEqual(distribution['total'], 1)
+        self.assertEqual(distribution['5_percent'], 100)
+
+    def test_recompute_ratings_command(self):
+        """The recompute command repairs counts written around the signals."""
+        Review.objects.create(equipment=self.equipment, user=self.patron, rating=5)
+        Review.objects.create(equipment=self.equipment, user=self.other_patron, rating=4)
+        Equipment.objects.filter(pk=self.equipment.pk).update(
+            rating_count=0, rating_5_count=0, rating_4_count=0, average_rating=0
+        )
+
+        call_command('recompute_ratings', stdout=StringIO())
+
+        self.equipment.refresh_from_db()
+        self.assertEqual(self.equipment.rating_count, 2)
+        self.assertEqual(self.equipment.rating_5_count, 1)
+        self.assertEqual(self.equipment.rating_4_count, 1)
+        self.assertEqual(self.equipment.average_rating, Decimal('4.50'))
+
+    def test_out_of_range_rating(self):
+        """Ratings outside 1-5 are refused by the view and recounted, not crashed on, by the model."""
+        response = self.patron_client.post(
+            reverse('equipment:add_review', args=[self.equipment.id]), {'rating': 7, 'comment': 'Off the scale'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Review.objects.exists())
+
+        # Written around the view's check, e.g. from the shell
+        Review.objects.create(equipment=self.equipment, user=self.patron, rating=7)
+        Review.objects.create(equipment=self.equipment, user=self.other_patron, rating=4)
+        self.equipment.refresh_from_db()
+        self.assertEqual(self.equipment.rating_count, 1)
+        self.assertEqual(self.equipment.average_rating, Decimal('4.00'))
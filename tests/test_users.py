@@ -1,9 +1,24 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.test import Client, TestCase
+from django.test import Client, RequestFactory, TestCase
+from django.utils import timezone
 
 
-from users.models import UserProfile
+from equipment import context_processors, events, notification_counts
+from users.models import ArchivedNotification, Notification, NotificationReceipt, UserProfile
 
 
 class UserProfileTests(TestCase):
@@ -182,4 +197,246 @@ class UserProfileTests(TestCase):
 
         # Patron should not access management page
         response = self.patron_client.get(reverse('manage_users'))
-        self.assertEqual(response.status_code, 302)  # Should redirect
\ No newline at end of file
+        self.assertEqual(response.status_code, 302)  # Should redirect
+
+
+class NotificationTests(TestCase):
+    """Test suite for personal and broadcast notifications."""
+
+    def setUp(self):
+        """Create two librarians, a patron and a mix of notifications."""
+        self.librarians = []
+        for i in range(2):
+            librarian = User.objects.create_user(
+                username=f'librarian{i}', password='password123', date_joined=timezone.now() - timedelta(days=365)
+            )
+            UserProfile.objects.create(user=librarian, user_type='LIBRARIAN', role_since=librarian.date_joined)
+            self.librarians.append(librarian)
+        self.patron = User.objects.create_user(username='patron', password='password123')
+        UserProfile.objects.create(user=self.patron, user_type='PATRON')
+
+        self.broadcast = Notification.objects.create(
+            audience='LIBRARIAN', notification_type='RENTAL_REQUEST', message='New request'
+        )
+        self.personal = Notification.objects.create(
+            user=self.librarians[0], notification_type='COLLECTION_REQUEST', message='Access request'
+        )
+
+        self.client = Client()
+        self.client.login(username='librarian0', password='password123')
+
+    def test_broadcast_merged_into_feed(self):
+        """Librarians see role broadcasts alongside their own notifications; patrons don't."""
+        response = self.client.get(reverse('equipment:get_notifications'))
+        data = response.json()
+        self.assertEqual(data['total_count'], 2)
+        self.assertEqual(data['unread_count'], 2)
+        self.assertEqual(
+            {n['id'] for n in data['notifications']}, {self.broadcast.id, self.personal.id}
+        )
+
+        self.assertEqual(Notification.objects.for_user(self.librarians[1]).count(), 1)
+        self.assertEqual(Notification.objects.for_user(self.patron).count(), 0)
+
+    def test_new_librarian_skips_earlier_broadcasts(self):
+        """Librarians only get the broadcasts made since they became librarians."""
+        newcomer = User.objects.create_user(username='newcomer', password='password123')
+        UserProfile.objects.create(user=newcomer, user_type='LIBRARIAN')
+        self.assertEqual(notification_counts.get_counts(newcomer), {'total_count': 0, 'unread_count': 0})
+
+        self.client.post(reverse('promote_to_librarian', args=[self.patron.id]))
+        promoted = User.objects.get(id=self.patron.id)
+        self.assertEqual(promoted.userprofile.user_type, 'LIBRARIAN')
+        self.assertEqual(Notification.objects.for_user(promoted).count(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            later = Notification.objects.create(
+                audience='LIBRARIAN', notification_type='RENTAL_REQUEST', message='Later request'
+            )
+        self.assertEqual(list(Notification.objects.for_user(promoted).values_list('id', flat=True)), [later.id])
+        self.assertEqual(notification_counts.get_counts(newcomer), {'total_count': 1, 'unread_count': 1})
+
+    def test_broadcast_read_receipts_are_per_user(self):
+        """Reading a broadcast records a receipt for that librarian only."""
+        response = self.client.post(
+            reverse('equipment:get_notifications'), {'notification_id': self.broadcast.id}
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertTrue(
+            NotificationReceipt.objects.filter(notification=self.broadcast, user=self.librarians[0]).exists()
+        )
+
+        reads = dict(Notification.objects.for_user(self.librarians[1]).values_list('id', 'read'))
+        self.assertEqual(reads, {self.broadcast.id: False})
+        data = self.client.get(reverse('equipment:get_notifications')).json()
+        self.assertEqual(data['unread_count'], 1)
+
+    def test_mark_all_read(self):
+        """Marking everything read updates personal rows and adds receipts for broadcasts."""
+        self.client.post(reverse('equipment:get_notifications'))
+        self.client.post(reverse('equipment:get_notifications'))
+
+        self.personal.refresh_from_db()
+        self.assertTrue(self.personal.is_read)
+        self.assertEqual(NotificationReceipt.objects.filter(user=self.librarians[0]).count(), 1)
+        self.assertEqual(
+            self.client.get(reverse('equipment:get_notifications')).json()['unread_count'], 0
+        )
+
+    def test_unread_count_cached_and_kept_current(self):
+        """The badge counts come from the cache and follow creates and reads."""
+        librarian = self.librarians[0]
+        self.assertEqual(notification_counts.get_counts(librarian), {'total_count': 2, 'unread_count': 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(notification_counts.unread_count(librarian), 2)
+        self.assertEqual(len(queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(
+                user=librarian, notification_type='COLLECTION_REQUEST', message='Another'
+            )
+        self.assertEqual(notification_counts.get_counts(librarian), {'total_count': 3, 'unread_count': 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('equipment:get_notifications'), {'notification_id': self.broadcast.id})
+        self.assertEqual(notification_counts.unread_count(librarian), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('equipment:get_notifications'))
+        self.assertEqual(notification_counts.unread_count(librarian), 0)
+        self.assertEqual(Notification.objects.for_user(librarian).filter(read=False).count(), 0)
+
+    def test_view_all_paginated_by_cursor(self):
+        """The full history is returned a page at a time with a next cursor."""
+        Notification.objects.bulk_create([
+            Notification(user=self.librarians[0], notification_type='RENTAL_APPROVED', message=f'Old {i}')
+            for i in range(60)
+        ])
+        url = reverse('equipment:get_notifications')
+        first = self.client.get(url, {'all': 'true'}).json()
+        self.assertEqual(len(first['notifications']), 50)
+        self.assertIsNotNone(first['next_cursor'])
+
+        second = self.client.get(url, {'all': 'true', 'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(second['notifications']), 12)
+        self.assertIsNone(second['next_cursor'])
+        ids = [n['id'] for n in first['notifications'] + second['notifications']]
+        self.assertEqual(len(set(ids)), 62)
+
+        self.assertEqual(self.client.get(url, {'all': 'true', 'cursor': 'bogus'}).status_code, 400)
+
+        # Pages showing the history refresh only the badge
+        self.assertEqual(self.client.get(url, {'counts': 'true'}).json(), {'total_count': 62, 'unread_count': 62})
+
+    def test_archive_old_read_notifications(self):
+        """Old read notifications move to the archive; unread and recent ones stay."""
+        old = timezone.now() - timedelta(days=120)
+        read_personal = Notification.objects.create(
+            user=self.librarians[0], notification_type='RENTAL_APPROVED', message='Read', is_read=True
+        )
+        unread_personal = Notification.objects.create(
+            user=self.librarians[0], notification_type='RENTAL_APPROVED', message='Unread'
+        )
+        for librarian in self.librarians:
+            NotificationReceipt.objects.create(notification=self.broadcast, user=librarian)
+        Notification.objects.filter(
+            id__in=[read_personal.id, unread_personal.id, self.broadcast.id]
+        ).update(created_at=old)
+
+        call_command('archive_notifications', days=90, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            set(ArchivedNotification.objects.values_list('id', flat=True)),
+            {read_personal.id, self.broadcast.id}
+        )
+        self.assertEqual(
+            set(Notification.objects.values_list('id', flat=True)), {unread_personal.id, self.personal.id}
+        )
+        self.assertFalse(NotificationReceipt.objects.exists())
+
+    def test_broadcast_kept_until_everyone_read_it(self):
+        """A broadcast read by one librarian stays for the one who hasn't read it."""
+        NotificationReceipt.objects.create(notification=self.broadcast, user=self.librarians[1])
+        Notification.objects.filter(id=self.broadcast.id).update(created_at=timezone.now() - timedelta(days=120))
+
+        call_command('archive_notifications', days=90, stdout=StringIO())
+        self.assertTrue(Notification.objects.filter(id=self.broadcast.id).exists())
+        self.assertEqual(
+            dict(Notification.objects.for_user(self.librarians[0]).values_list('id', 'read'))[self.broadcast.id],
+            False
+        )
+
+        NotificationReceipt.objects.create(notification=self.broadcast, user=self.librarians[0])
+        call_command('archive_notifications', days=90, stdout=StringIO())
+        self.assertFalse(Notification.objects.filter(id=self.broadcast.id).exists())
+
+    def test_broadcast_not_kept_for_inactive_librarians(self):
+        """Librarians who left, joined later or haven't logged in lately don't hold a broadcast back."""
+        NotificationReceipt.objects.create(notification=self.broadcast, user=self.librarians[0])
+        Notification.objects.filter(id=self.broadcast.id).update(created_at=timezone.now() - timedelta(days=120))
+        # librarians[1] has never logged in
+        departed = User.objects.create_user(
+            username='departed', is_active=False, last_login=timezone.now(),
+            date_joined=timezone.now() - timedelta(days=365),
+        )
+        newcomer = User.objects.create_user(username='newcomer', last_login=timezone.now())
+        for user in (departed, newcomer):
+            UserProfile.objects.create(user=user, user_type='LIBRARIAN', role_since=user.date_joined)
+
+        call_command('archive_notifications', days=90, stdout=StringIO())
+        self.assertFalse(Notification.objects.filter(id=self.broadcast.id).exists())
+
+    def test_archive_to_jsonl(self):
+        """With --output the archived rows are written as gzipped JSON lines."""
+        self.personal.is_read = True
+        self.personal.save()
+        Notification.objects.filter(id=self.personal.id).update(created_at=timezone.now() - timedelta(days=100))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'notifications.jsonl.gz')
+            call_command('archive_notifications', output=path, stdout=StringIO())
+            with gzip.open(path, 'rt') as archive:
+                rows = [json.loads(line) for line in archive]
+
+        self.assertEqual([row['id'] for row in rows], [self.personal.id])
+        self.assertFalse(ArchivedNotification.objects.exists())
+        self.assertFalse(Notification.objects.filter(id=self.personal.id).exists())
+
+    def test_stream_unavailable_without_asgi(self):
+        """Under WSGI the stream answers 204 so the browser falls back to polling."""
+        response = self.client.get(reverse('equipment:notification_stream'))
+        self.assertEqual(response.status_code, 204)
+
+    def test_pages_poll_without_shared_events(self):
+        """Pages are told to keep polling only when the event backend misses other workers' events."""
+        request = RequestFactory().get('/')
+        self.assertEqual(context_processors.notification_events(request), {'notification_events_shared': False})
+        with mock.patch.object(events, '_backend', mock.Mock(shared=True)):
+            self.assertEqual(context_processors.notification_events(request), {'notification_events_shared': True})
+
+    async def test_stream_pushes_new_notifications(self):
+        """The stream sends the unread count, then each new notification as it commits."""
+        await self.async_client.aforce_login(self.librarians[0])
+        response = await self.async_client.get(reverse('equipment:notification_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = aiter(response.streaming_content)
+        first = await anext(content)
+        self.assertIn(b'event: read', first)
+        self.assertIn(b'"unread_count": 2', first)
+
+        def notify():
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.create(
+                    audience='LIBRARIAN', notification_type='RENTAL_REQUEST', message='Another request'
+                )
+
+        await sync_to_async(notify)()
+        pushed = await asyncio.wait_for(anext(content), 5)
+        self.assertIn(b'event: notification', pushed)
+        self.assertIn(b'Another request', pushed)
+        self.assertIn(b'"unread_count": 3', pushed)
+        # Close the response's iterator too, not just the wrapper streaming_content returned
+        await content.aclose()
+        await response._iterator.aclose()
+
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:33
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_roles_when_joined(apps, schema_editor):
+    # Existing users keep the broadcasts sent since they joined
+    UserProfile = apps.get_model('users', 'UserProfile')
+    UserProfile.objects.update(role_since=F('date_joined'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_archivednotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='role_since',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(start_roles_when_joined, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 class UserProfile(models.Model):
@@ -50,6 +51,8 @@ class UserProfile(models.Model):
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='userprofile')
     user_type = models.CharField(max_length=20, choices=USER_TYPES, default='PATRON')
+    # When the user got their current user_type; older broadcasts to it aren't in their feed
+    role_since = models.DateTimeField(default=timezone.now)
     profile_picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
     date_joined = models.DateTimeField(auto_now_add=True)
     phone_number = models.CharField(max_length=20, blank=True)
@@ -100,9 +103,50 @@ class UserProfile(models.Model):
         ).order_by('-return_date')
 
 
+class NotificationQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        Notifications addressed to ``user`` personally or broadcast to their
+        role since they got it, merged into one query and annotated with
+        ``read`` (whether this user has read each one).
+        """
+        recipients = models.Q(user=user)
+        profile = getattr(user, 'userprofile', None)
+        if profile is not None and profile.user_type:
+            # Only broadcasts made since the user joined their role
+            recipients |= models.Q(audience=profile.user_type, created_at__gte=profile.role_since)
+
+        receipts = NotificationReceipt.objects.filter(notification=models.OuterRef('pk'), user=user)
+        return self.filter(recipients).annotate(
+            read=models.Case(
+                models.When(user=user, then=models.F('is_read')),
+                default=models.Exists(receipts),
+                output_field=models.BooleanField(),
+            )
+        )
+
+    def mark_read(self, user):
+        """
+        Mark every notification in this queryset (from ``for_user``) as read
+        by ``user``, returning how many were unread.
+        """
+        updated = self.filter(user=user, is_read=False).update(is_read=True)
+        unread_broadcasts = list(self.filter(user__isnull=True, read=False).values_list('id', flat=True))
+        NotificationReceipt.objects.bulk_create(
+            [NotificationReceipt(notification_id=pk, user=user) for pk in unread_broadcasts],
+            ignore_conflicts=True,
+        )
+        return updated + len(unread_broadcasts)
+
+
 class Notification(models.Model):
     """
     Model to store notifications for users
+
+    A notification goes either to a single ``user`` or, as a broadcast, to
+    everyone whose profile has the ``audience`` user type (e.g. all
+    librarians). Broadcasts are stored once; who has read them is tracked in
+    NotificationReceipt rather than ``is_read``.
     """
     NOTIFICATION_TYPES = [
         ('RENTAL_REQUEST', 'Rental Request'),
@@ -113,19 +157,91 @@ class Notification(models.Model):
         ('COLLECTION_DENIED', 'Collection Access Denied'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    # User type a broadcast is addressed to (blank for personal notifications)
+    audience = models.CharField(max_length=20, choices=UserProfile.USER_TYPES, blank=True)
     notification_type = models.CharField(max_length=30, choices=NOTIFICATION_TYPES)
     message = models.TextField()
     related_url = models.CharField(max_length=255, blank=True)  # URL to redirect when clicked
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+
+    objects = NotificationQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's feed and unread count, newest first
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread_idx'),
+            models.Index(fields=['audience', 'created_at'], name='notification_audience_idx'),
+        ]
+        constraints = [
+            # Exactly one of user / audience is set
+            models.CheckConstraint(
+                condition=(
+                    models.Q(user__isnull=False, audience='') |
+                    (models.Q(user__isnull=True) & ~models.Q(audience=''))
+                ),
+                name='notification_single_recipient',
+            ),
+        ]
         
     def __str__(self):
-        return f"{self.notification_type} for {self.user.username} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+        recipient = self.user.username if self.user_id else f"all {self.get_audience_display()}s"
+        return f"{self.notification_type} for {recipient} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
         
-    def mark_as_read(self):
-        self.is_read = True
-        self.save()
+    def mark_as_read(self, user=None):
+        """
+        Mark as read (broadcasts need the ``user`` who read them). Returns
+        True if the notification was unread before.
+        """
+        if self.user_id:
+            if self.is_read:
+                return False
+            self.is_read = True
+            self.save()
+            return True
+        if user is not None:
+            _, created = NotificationReceipt.objects.get_or_create(notification=self, user=user)
+            return created
+        return False
+
+
+class NotificationReceipt(models.Model):
+    """Records that a user has read a broadcast notification."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='receipts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_receipts')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='notification_receipt_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} read notification {self.notification_id}"
+
+
+class ArchivedNotification(models.Model):
+    """
+    Compact copy of an old, read notification, moved out of Notification by
+    the archive_notifications command to keep the live table small.
+    """
+    # Copied as plain values, so archived rows hold no foreign keys
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    audience = models.CharField(max_length=20, blank=True)
+    notification_type = models.CharField(max_length=30)
+    message = models.TextField()
+    related_url = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user_id', 'created_at'], name='archived_notification_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.notification_type} from {self.created_at.strftime('%Y-%m-%d %H:%M')}"
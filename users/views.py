@@ -2,82 +2,30 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import logout
 from datetime import datetime
+from django.utils import timezone
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.http import HttpResponse, HttpResponseForbidden
 
 from equipment.models import UserProfile, Cart, Rental, Equipment, User, Review
+from equipment import notification_counts
+from equipment.visibility import visible_equipment
+from skirentals import profiling
+from .dashboard import load_librarian_dashboard
 
 
 # Create your views here.
 
 def home(request):
-    # Start with available equipment
-    featured_query = Equipment.objects.filter(is_available=True)
-    
-    # Apply collection visibility filters for anonymous users and patrons
     user = request.user
-    
-    if not user.is_authenticated or not hasattr(user, 'userprofile') or user.userprofile.user_type != 'LIBRARIAN':
-        # For anonymous users and patrons:
-        # Hide items that are in private collections (unless the user has access)
-        
-        # Start by excluding all items in private collections
-        items_in_private_collections = Equipment.objects.filter(
-            collections__sharing_type='PRIVATE'
-        ).distinct()
-        
-        if user.is_authenticated:
-            # For authenticated users, add back items from private collections they have access to
-            accessible_private_items = Equipment.objects.filter(
-                collections__sharing_type='PRIVATE',
-                collections__authorized_users=user
-            )
-            
-            creator_private_items = Equipment.objects.filter(
-                collections__sharing_type='PRIVATE',
-                collections__creator=user
-            )
-            
-            # Remove items in private collections first
-            featured_query = featured_query.exclude(id__in=items_in_private_collections.values('id'))
-            
-            # Add back accessible items and creator items
-            accessible_ids = set(accessible_private_items.values_list('id', flat=True))
-            creator_ids = set(creator_private_items.values_list('id', flat=True))
-            private_item_ids = accessible_ids.union(creator_ids)
-            
-            if private_item_ids:
-                # Ensure both querysets have the same distinctness property
-                featured_query = featured_query.distinct()
-                private_items_query = Equipment.objects.filter(id__in=private_item_ids).distinct()
-                featured_query = featured_query | private_items_query
-        else:
-            # For anonymous users, just exclude all items in private collections
-            featured_query = featured_query.exclude(id__in=items_in_private_collections.values('id'))
-    
+
     # Get featured equipment (random order) with visibility filters applied
-    featured_equipment = featured_query.distinct().order_by('?')[:3]
+    featured_query = visible_equipment(user, Equipment.objects.filter(is_available=True).with_card_image())
+    featured_equipment = featured_query.order_by('?')[:3]
     
     # Get popular equipment for the home page - Apply the same visibility filters
-    popular_query = Equipment.objects.all().order_by('-average_rating')
-    
-    # Apply the same visibility filters to popular equipment
-    if not user.is_authenticated or not hasattr(user, 'userprofile') or user.userprofile.user_type != 'LIBRARIAN':
-        if user.is_authenticated:
-            # Remove items in private collections
-            popular_query = popular_query.exclude(id__in=items_in_private_collections.values('id'))
-            
-            # Add back items from accessible private collections
-            if private_item_ids:
-                # Ensure both querysets have the same distinctness property
-                popular_query = popular_query.distinct()
-                private_items_query = Equipment.objects.filter(id__in=private_item_ids).order_by('-average_rating').distinct()
-                popular_query = popular_query | private_items_query
-        else:
-            # For anonymous users, exclude all items in private collections
-            popular_query = popular_query.exclude(id__in=items_in_private_collections.values('id'))
-    
-    popular_equipment = popular_query.distinct().order_by('-average_rating')[:6]
+    popular_query = visible_equipment(user, Equipment.objects.with_card_image())
+    popular_equipment = popular_query.order_by('-average_rating')[:6]
     
     return render(request, 'home.html', {
         'featured_equipment': featured_equipment,
@@ -115,42 +63,9 @@ def librarian_view(request):
     except UserProfile.DoesNotExist:
         return redirect('home')
 
-    # Get today's date
-    today_date = datetime.now().date()
-    
-    # Get pending rental requests, active rentals, and equipment due for return
-    pending_rentals = Rental.objects.filter(rental_status='PENDING').order_by('-checkout_date')
-    active_rentals = Rental.objects.filter(rental_status='ACTIVE').order_by('-checkout_date')
-
-    # Get user's rental requests
-    rental_requests = Rental.objects.filter(patron=request.user).order_by('-checkout_date')
-
-    # Separate rentals by status
-    your_active_rentals = rental_requests.filter(rental_status='ACTIVE')
-    your_pending_rentals = rental_requests.filter(rental_status='PENDING')
-    your_completed_rentals = rental_requests.filter(rental_status__in=['COMPLETED', 'CANCELLED'])
-    
-    # Count equipment requiring maintenance
-    maintenance_equipment = Equipment.objects.filter(condition='MAINTENANCE')
-    
-    # Count total equipment, users, active rentals
-    total_equipment = Equipment.objects.filter(is_deleted=False).count()
-    total_users = User.objects.filter(userprofile__user_type='PATRON').count()
-    active_rentals_count = active_rentals.count()
-    
-    context = {
-        'pending_rentals': pending_rentals,
-        'active_rentals': active_rentals,
-        'maintenance_equipment': maintenance_equipment,
-        'total_equipment': total_equipment,
-        'total_users': total_users,
-        'active_rentals_count': active_rentals_count,
-        'today_date': today_date,
-        #For the your rentals section:
-        'your_active_rentals': your_active_rentals,
-        'your_pending_rentals': your_pending_rentals,
-        'your_completed_rentals': your_completed_rentals,
-    }
+    # Rentals, maintenance list and counters in a fixed number of queries
+    context = load_librarian_dashboard(request.user)
+    context['today_date'] = datetime.now().date()
     
     return render(request, 'users/librarian.html', context)
 
@@ -193,8 +108,8 @@ def cart_view(request):
     # Get or create the user's cart
     cart, created = Cart.objects.get_or_create(user=request.user)
     
-    # Get all items in the cart
-    cart_items = cart.items.all()
+    # Get all items in the cart, with their equipment, in one query
+    cart_items = cart.pricing.items
     
     context = {
         'cart': cart,
@@ -448,7 +363,10 @@ def promote_to_librarian(request, user_id):
     
     # Update user type to librarian
     profile_to_promote.user_type = 'LIBRARIAN'
+    profile_to_promote.role_since = timezone.now()
     profile_to_promote.save()
+    # The cached counts still include broadcasts to the old role
+    notification_counts.invalidate([user_to_promote.id])
     
     messages.success(request, f"{user_to_promote.get_full_name() or user_to_promote.username} has been promoted to librarian.")
     return redirect('manage_users')
@@ -489,9 +407,25 @@ def demote_to_patron(request, user_id):
     
     # Update user type to patron
     profile_to_demote.user_type = 'PATRON'
+    profile_to_demote.role_since = timezone.now()
     profile_to_demote.save()
+    # The cached counts still include broadcasts to the old role
+    notification_counts.invalidate([user_to_demote.id])
     
     messages.success(request, f"{user_to_demote.get_full_name() or user_to_demote.username} has been demoted to patron.")
     return redirect('manage_users')
 
+@login_required
+def metrics_view(request):
+    """
+    Per-view request metrics in the Prometheus text format.
+    Only accessible by librarians.
+    """
+    profile = UserProfile.objects.filter(user=request.user).first()
+    if profile is None or profile.user_type != 'LIBRARIAN':
+        return HttpResponseForbidden("Only librarians can view metrics.")
 
+    return HttpResponse(
+        profiling.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )